@@ -0,0 +1,3 @@
+"""
+Módulos de apoio do GMaster (dados, índices e serviços usados pela aplicação Streamlit).
+"""
@@ -0,0 +1,144 @@
+"""
+Alertas de estoque baixo avaliados a cada alteração de estoque.
+
+O monitor guarda, por produto, a quantidade e o mínimo (coluna Estoque_Minimo da aba Estoque).
+Cada venda atualiza apenas o produto vendido (O(1)): um alerta é emitido só quando o produto
+atravessa o mínimo, e não a cada venda enquanto estiver abaixo. A lista de sugestões de reposição
+é mantida ao mesmo tempo e pode ser convertida em registos de Compras na aba Compras.
+"""
+import json
+import math
+import threading
+import urllib.request
+from collections import deque
+from datetime import datetime
+
+import pandas as pd
+
+from gmaster.metricas import contar
+
+# A sugestão repõe o produto até este múltiplo do mínimo
+FATOR_REPOSICAO = 2
+
+
+class NotificadorFicheiro:
+    """Acrescenta cada alerta como uma linha JSON ao ficheiro indicado."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+
+    def __call__(self, alerta):
+        with self._lock, open(self.caminho, "a", encoding="utf-8") as f:
+            f.write(json.dumps(alerta, ensure_ascii=False) + "\n")
+
+
+class NotificadorWebhook:
+    """Envia o alerta por POST (JSON) numa thread, sem atrasar a venda. Falhas ficam só contadas."""
+
+    def __init__(self, url, tempo_limite=5):
+        self.url = url
+        self.tempo_limite = tempo_limite
+
+    def _enviar(self, alerta):
+        pedido = urllib.request.Request(self.url, data=json.dumps(alerta, ensure_ascii=False).encode('utf-8'),
+                                        headers={'Content-Type': 'application/json'}, method='POST')
+        try:
+            urllib.request.urlopen(pedido, timeout=self.tempo_limite).close()
+        except OSError:
+            contar('alertas_webhook_falhas')
+
+    def __call__(self, alerta):
+        threading.Thread(target=self._enviar, args=(alerta,), daemon=True).start()
+
+
+def _numero(valor):
+    try:
+        valor = float(valor)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if math.isnan(valor) else valor
+
+
+class MonitorEstoque:
+
+    def __init__(self, notificadores=()):
+        self.notificadores = list(notificadores)
+        self._quantidades = {}
+        self._minimos = {}
+        self.sugestoes = {}
+        self.alertas_app = deque(maxlen=50)
+
+    def carregar(self, estoque_df):
+        """Reconstrói o estado a partir da aba Estoque (na carga e depois de edições no editor)."""
+        minimos = estoque_df['Estoque_Minimo'] if 'Estoque_Minimo' in estoque_df.columns else pd.Series(0, index=estoque_df.index)
+        self._quantidades = {p: _numero(q) for p, q in zip(estoque_df['Produto'], estoque_df['Quantidade_Estoque'])}
+        self._minimos = {p: _numero(m) for p, m in zip(estoque_df['Produto'], minimos)}
+        self.sugestoes = {}
+        for produto in self._quantidades:
+            self._avaliar(produto, notificar=False)
+
+    def _abaixo(self, produto):
+        minimo = self._minimos.get(produto, 0)
+        return minimo > 0 and self._quantidades.get(produto, 0) < minimo
+
+    def _avaliar(self, produto, notificar=True, estava_abaixo=False):
+        if self._abaixo(produto):
+            quantidade = self._quantidades[produto]
+            minimo = self._minimos[produto]
+            self.sugestoes[produto] = {
+                'Produto': produto,
+                'Atual': quantidade,
+                'Minimo': minimo,
+                'Sugerido': int(math.ceil(minimo * FATOR_REPOSICAO - quantidade)),
+            }
+            if notificar and not estava_abaixo:
+                self._notificar({
+                    'produto': produto, 'quantidade': quantidade, 'minimo': minimo,
+                    'momento': datetime.now().isoformat(timespec='seconds'),
+                })
+        else:
+            self.sugestoes.pop(produto, None)
+
+    def _notificar(self, alerta):
+        contar('alertas_estoque')
+        self.alertas_app.append(alerta)
+        for notificador in self.notificadores:
+            notificador(alerta)
+
+    def atualizar(self, produto, quantidade):
+        """Regista a nova quantidade de um produto e emite alerta se acabou de ficar abaixo do mínimo."""
+        estava_abaixo = self._abaixo(produto)
+        self._quantidades[produto] = _numero(quantidade)
+        self._avaliar(produto, estava_abaixo=estava_abaixo)
+
+    def atualizar_varios(self, estoque_df, produtos):
+        """Atualiza apenas os produtos indicados (importações, entradas de NF-e)."""
+        produtos = set(produtos)
+        linhas = estoque_df[estoque_df['Produto'].isin(produtos)]
+        for produto, quantidade in zip(linhas['Produto'], linhas['Quantidade_Estoque']):
+            self.atualizar(produto, quantidade)
+
+    def retirar_alertas_app(self):
+        """Alertas ainda não mostrados na aplicação (esvazia a fila)."""
+        alertas = list(self.alertas_app)
+        self.alertas_app.clear()
+        return alertas
+
+    def tabela_sugestoes(self):
+        return pd.DataFrame(sorted(self.sugestoes.values(), key=lambda s: s['Produto']),
+                            columns=['Produto', 'Atual', 'Minimo', 'Sugerido'])
+
+
+def compras_de_reposicao(sugestoes_df, produtos_df, data, fornecedor=''):
+    """Converte as sugestões (com a coluna 'Sugerido' possivelmente editada) em linhas da aba Compras."""
+    custos = pd.to_numeric(produtos_df.drop_duplicates('Produto').set_index('Produto')['Custo_Unitario'], errors='coerce')
+    linhas = sugestoes_df[pd.to_numeric(sugestoes_df['Sugerido'], errors='coerce').fillna(0) > 0]
+    quantidades = pd.to_numeric(linhas['Sugerido'], errors='coerce').astype(int)
+    return pd.DataFrame({
+        'Data': data,
+        'Item': [f"Reposição: {produto} ({quantidade} un.)" for produto, quantidade in zip(linhas['Produto'], quantidades)],
+        'Valor': (quantidades * linhas['Produto'].map(custos).fillna(0)).round(2).values,
+        'Fornecedor': fornecedor,
+        'Categoria_Despesa': 'Mercadorias',
+    })
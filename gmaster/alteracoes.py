@@ -0,0 +1,82 @@
+"""
+Conjuntos de alterações (linhas adicionadas, editadas e removidas) vindos do st.data_editor.
+
+Em vez de substituir a tabela inteira pelo que o editor devolve, a aplicação lê o estado do
+editor, converte as posições em rótulos do índice e aplica apenas essas linhas. A
+reconciliação do estoque com o cardápio usa operações de conjunto e só corre quando o
+cardápio muda.
+"""
+import pandas as pd
+
+
+def ler_alteracoes(estado_editor, df_base):
+    """Converte o estado do editor (posições das linhas) em alterações por rótulo do índice de `df_base`."""
+    estado = estado_editor or {}
+    n_linhas = len(df_base)
+    editadas = {}
+    for posicao, valores in estado.get('edited_rows', {}).items():
+        posicao = int(posicao)
+        if posicao < n_linhas and valores:
+            editadas[df_base.index[posicao]] = dict(valores)
+    adicionadas = [dict(linha) for linha in estado.get('added_rows', [])
+                   if any(valor not in (None, '') for valor in linha.values())]
+    removidas = [df_base.index[int(posicao)] for posicao in estado.get('deleted_rows', []) if int(posicao) < n_linhas]
+    return {'editadas': editadas, 'adicionadas': adicionadas, 'removidas': removidas}
+
+
+def tem_alteracoes(alteracoes):
+    return bool(alteracoes['editadas'] or alteracoes['adicionadas'] or alteracoes['removidas'])
+
+
+def aplicar_alteracoes(df_base, alteracoes):
+    """Devolve uma cópia de `df_base` com as alterações aplicadas; as linhas intocadas não são reescritas."""
+    df = df_base.drop(index=alteracoes['removidas'])
+    for rotulo, valores in alteracoes['editadas'].items():
+        if rotulo in df.index:
+            for coluna, valor in valores.items():
+                df.at[rotulo, coluna] = valor
+    if alteracoes['adicionadas']:
+        proximo = int(df_base.index.max()) + 1 if len(df_base) else 0
+        novas = pd.DataFrame(alteracoes['adicionadas'], columns=df.columns,
+                             index=pd.RangeIndex(proximo, proximo + len(alteracoes['adicionadas'])))
+        df = pd.concat([df, novas]) if not df.empty else novas
+    return df
+
+
+def reconciliar_estoque(estoque, produtos_antes, produtos_depois, alteracoes):
+    """
+    Ajusta o estoque apenas para os produtos tocados pelo conjunto de alterações do cardápio:
+    renomeados mantêm a quantidade, removidos saem e novos entram com quantidade 0.
+    """
+    renomeados = {}
+    for rotulo, valores in alteracoes['editadas'].items():
+        if 'Produto' in valores and rotulo in produtos_antes.index:
+            nome_antigo = produtos_antes.at[rotulo, 'Produto']
+            if pd.notna(valores['Produto']) and nome_antigo != valores['Produto']:
+                renomeados[nome_antigo] = valores['Produto']
+
+    nomes_antes = set(produtos_antes['Produto'].dropna())
+    nomes_depois = set(produtos_depois['Produto'].dropna())
+    removidos = nomes_antes - nomes_depois - set(renomeados)
+
+    estoque = estoque.copy()
+    if renomeados:
+        estoque['Produto'] = estoque['Produto'].replace(renomeados)
+    if removidos:
+        estoque = estoque[~estoque['Produto'].isin(removidos)]
+    existentes = set(estoque['Produto'])
+    novos = [p for p in produtos_depois['Produto'].dropna().unique() if p not in existentes]
+    if novos:
+        novas_linhas = pd.DataFrame({'Produto': novos, 'Quantidade_Estoque': [0] * len(novos)})
+        if 'Estoque_Minimo' in estoque.columns:
+            novas_linhas['Estoque_Minimo'] = 0
+        estoque = pd.concat([estoque, novas_linhas], ignore_index=True)
+    return estoque
+
+
+def produtos_com_estoque_alterado(estoque_antes, estoque_depois):
+    """Produtos cuja quantidade mudou ou que passaram a existir no estoque."""
+    antes = estoque_antes.drop_duplicates('Produto').set_index('Produto')['Quantidade_Estoque']
+    depois = estoque_depois.drop_duplicates('Produto').set_index('Produto')['Quantidade_Estoque']
+    comparado = antes.reindex(depois.index)
+    return set(depois.index[comparado.isna() | (comparado != depois)])
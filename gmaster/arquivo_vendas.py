@@ -0,0 +1,163 @@
+"""
+Particionamento mensal das vendas antigas.
+
+A aba Vendas guarda apenas as semanas mais recentes (conjunto "quente"). Os meses
+fechados são movidos para partições comprimidas em `arquivo_vendas/vendas_AAAA-MM.csv.gz`,
+descritas num manifesto JSON, e só são lidos quando um período pedido os alcança.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import pandas as pd
+
+from gmaster.metricas import cronometrado, contar
+
+COLUNAS_VENDAS = ['Data', 'Produto', 'Quantidade', 'CPF_Cliente']
+MANIFESTO = "manifesto.json"
+DIAS_QUENTES_PADRAO = 21
+# Partições mantidas em memória (partilhadas pelas sessões): só os meses mais consultados, para
+# que ver "Todo o histórico" não deixe anos de vendas residentes no processo
+PARTICOES_EM_CACHE = 3
+
+
+def _caminho_particao(pasta, mes):
+    return os.path.join(pasta, f"vendas_{mes}.csv.gz")
+
+
+def ler_manifesto(pasta):
+    caminho = os.path.join(pasta, MANIFESTO)
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _gravar_manifesto(pasta, manifesto):
+    caminho = os.path.join(pasta, MANIFESTO)
+    with open(caminho + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, indent=4, sort_keys=True)
+    os.replace(caminho + ".tmp", caminho)
+
+
+@lru_cache(maxsize=PARTICOES_EM_CACHE)
+def _ler_particao(caminho, mtime):
+    # O mtime faz parte da chave para que partições regravadas não sejam servidas da cache
+    df = pd.read_csv(caminho, compression='gzip', index_col='ID_Venda', parse_dates=['Data'],
+                     dtype={'CPF_Cliente': str})
+    return df
+
+
+def ler_particao(pasta, mes):
+    caminho = _caminho_particao(pasta, mes)
+    if not os.path.exists(caminho):
+        return pd.DataFrame(columns=COLUNAS_VENDAS)
+    return _ler_particao(caminho, os.path.getmtime(caminho)).copy()
+
+
+@cronometrado('arquivar_vendas')
+def arquivar_meses_fechados(vendas_df, pasta, dias_quentes=DIAS_QUENTES_PADRAO, hoje=None):
+    """
+    Move para o arquivo os meses inteiramente anteriores a (hoje - dias_quentes).
+    Devolve (vendas_quentes, meses_arquivados). O índice das vendas (ID_Venda) é preservado.
+    """
+    if vendas_df.empty:
+        return vendas_df, []
+    hoje = pd.Timestamp(hoje or datetime.now())
+    corte = (hoje - timedelta(days=dias_quentes)).to_period('M').to_timestamp()
+    datas = pd.to_datetime(vendas_df['Data'])
+    antigas = datas < corte
+    if not antigas.any():
+        return vendas_df, []
+
+    os.makedirs(pasta, exist_ok=True)
+    manifesto = ler_manifesto(pasta)
+    a_arquivar = vendas_df[antigas].copy()
+    a_arquivar['Data'] = datas[antigas]
+    meses = a_arquivar['Data'].dt.to_period('M').astype(str)
+    for mes, grupo in a_arquivar.groupby(meses):
+        existente = ler_particao(pasta, mes)
+        if not existente.empty:
+            grupo = pd.concat([existente, grupo])
+            grupo = grupo[~grupo.index.duplicated(keep='last')]
+        grupo = grupo.sort_values('Data')
+        caminho = _caminho_particao(pasta, mes)
+        grupo.to_csv(caminho + ".tmp", index_label='ID_Venda', compression='gzip')
+        os.replace(caminho + ".tmp", caminho)
+        manifesto[mes] = {
+            'linhas': int(len(grupo)),
+            'inicio': grupo['Data'].min().isoformat(),
+            'fim': grupo['Data'].max().isoformat(),
+            'ultimo_id': int(grupo.index.max()),
+        }
+    _gravar_manifesto(pasta, manifesto)
+    return vendas_df[~antigas], sorted(meses.unique())
+
+
+def meses_no_periodo(pasta, inicio, fim):
+    """Meses arquivados cujo intervalo de datas cruza [inicio, fim)."""
+    inicio, fim = pd.Timestamp(inicio), pd.Timestamp(fim)
+    return [mes for mes, info in sorted(ler_manifesto(pasta).items())
+            if pd.Timestamp(info['fim']) >= inicio and pd.Timestamp(info['inicio']) < fim]
+
+
+@cronometrado('ler_arquivo_vendas')
+def carregar_periodo(pasta, inicio, fim):
+    """Lê apenas as partições arquivadas necessárias para o período [inicio, fim)."""
+    meses = meses_no_periodo(pasta, inicio, fim)
+    if not meses:
+        return pd.DataFrame(columns=COLUNAS_VENDAS)
+    contar('particoes_lidas', len(meses))
+    df = pd.concat([ler_particao(pasta, mes) for mes in meses])
+    return df[(df['Data'] >= pd.Timestamp(inicio)) & (df['Data'] < pd.Timestamp(fim))]
+
+
+def iterar_periodo(pasta, inicio, fim, tamanho_bloco=50000):
+    """Percorre as partições do período em blocos de linhas, sem carregar (nem guardar em cache) meses inteiros."""
+    inicio, fim = pd.Timestamp(inicio), pd.Timestamp(fim)
+    for mes in meses_no_periodo(pasta, inicio, fim):
+        caminho = _caminho_particao(pasta, mes)
+        if not os.path.exists(caminho):
+            continue
+        contar('particoes_lidas')
+        with pd.read_csv(caminho, compression='gzip', index_col='ID_Venda', parse_dates=['Data'],
+                         dtype={'CPF_Cliente': str}, chunksize=tamanho_bloco) as leitor:
+            for bloco in leitor:
+                bloco = bloco[(bloco['Data'] >= inicio) & (bloco['Data'] < fim)]
+                if not bloco.empty:
+                    yield bloco
+
+
+def vendas_do_periodo(vendas_quentes, pasta, inicio, fim):
+    """Junta as vendas quentes com o arquivo, lendo partições só se o período sair do conjunto quente."""
+    inicio, fim = pd.Timestamp(inicio), pd.Timestamp(fim)
+    datas = pd.to_datetime(vendas_quentes['Data'])
+    quentes = vendas_quentes[(datas >= inicio) & (datas < fim)]
+    if not datas.empty and inicio >= datas.min():
+        return quentes
+    arquivadas = carregar_periodo(pasta, inicio, fim)
+    if arquivadas.empty:
+        return quentes
+    arquivadas = arquivadas[~arquivadas.index.isin(quentes.index)]
+    return pd.concat([arquivadas, quentes])
+
+
+def data_inicial_historico(pasta, vendas_quentes):
+    """Data da venda mais antiga, consultando apenas o manifesto (sem abrir partições)."""
+    datas = [pd.Timestamp(info['inicio']) for info in ler_manifesto(pasta).values()]
+    if not vendas_quentes.empty:
+        datas.append(pd.to_datetime(vendas_quentes['Data']).min())
+    return min(datas) if datas else None
+
+
+def total_linhas_arquivadas(pasta):
+    return sum(info['linhas'] for info in ler_manifesto(pasta).values())
+
+
+def proximo_id_venda(vendas_quentes, pasta):
+    """Próximo ID_Venda livre, considerando também as vendas já arquivadas."""
+    ids = [info['ultimo_id'] for info in ler_manifesto(pasta).values()]
+    if not vendas_quentes.empty:
+        ids.append(int(vendas_quentes.index.max()))
+    return max(ids) + 1 if ids else 0
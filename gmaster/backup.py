@@ -0,0 +1,320 @@
+"""
+Cópias de segurança incrementais e deduplicadas dos dados do GMaster.
+
+Cada cópia (snapshot) é um pequeno JSON em `backups/snapshots/` que lista, para cada ficheiro
+de dados, os hashes dos seus blocos. Os blocos ficam em `backups/objetos/`, comprimidos e
+guardados uma única vez: partições do arquivo de vendas, XMLs fiscais e tudo o que não mudou
+desde a cópia anterior não ocupam espaço de novo. Ficheiros com o mesmo tamanho e data de
+modificação da cópia anterior nem chegam a ser lidos.
+
+A restauração reconstrói os ficheiros a partir dos blocos de um snapshot qualquer. O ID de cada
+snapshot é o momento da cópia (com "-2", "-3", ... se já houver outra no mesmo segundo); os
+temporários têm nomes únicos, para a linha de comandos e a aplicação poderem correr ao mesmo tempo.
+
+    python -m gmaster.backup criar
+    python -m gmaster.backup listar
+    python -m gmaster.backup restaurar 20261019T101500
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import closing
+from datetime import datetime, timedelta
+
+from gmaster.metricas import cronometrado
+
+# Ficheiros e pastas (relativos à pasta de dados) incluídos nas cópias
+INCLUIR = [
+    "pizzaria_db.xlsx", "config_empresa.json", "clientes_idx.json.gz", ".gmaster_sal", "lojas.json",
+    "importacoes.sqlite", "arquivo_vendas", "documentos_fiscais",
+]
+TAMANHO_BLOCO = 1024 * 1024
+FORMATO_ID = "%Y%m%dT%H%M%S"
+INTERVALO_PADRAO = 15 * 60
+
+# Retenção: tudo das últimas 24 h, depois uma por dia durante 14 dias e uma por semana durante 8 semanas
+RETER_TODAS_HORAS = 24
+RETER_DIARIAS = 14
+RETER_SEMANAIS = 8
+
+
+def momento_snapshot(snapshot_id):
+    """Data e hora de um ID de snapshot (sem o sufixo de desempate)."""
+    return datetime.strptime(snapshot_id.split('-')[0], FORMATO_ID)
+
+
+def _ordem_snapshot(snapshot_id):
+    base, _, sufixo = snapshot_id.partition('-')
+    return base, int(sufixo or 1)
+
+
+def _escrever_temporario(pasta, blocos):
+    """Escreve os blocos de bytes num temporário com nome único em `pasta` e devolve o seu caminho."""
+    descritor, temporario = tempfile.mkstemp(dir=pasta, suffix='.tmp')
+    try:
+        with os.fdopen(descritor, 'wb') as f:
+            for bloco in blocos:
+                f.write(bloco)
+    except BaseException:
+        os.remove(temporario)
+        raise
+    return temporario
+
+
+def _listar_ficheiros(pasta_dados):
+    for nome in INCLUIR:
+        caminho = os.path.join(pasta_dados, nome)
+        if os.path.isfile(caminho):
+            yield nome
+        elif os.path.isdir(caminho):
+            for raiz, _, ficheiros in os.walk(caminho):
+                for ficheiro in sorted(ficheiros):
+                    if not ficheiro.endswith('.tmp'):
+                        yield os.path.relpath(os.path.join(raiz, ficheiro), pasta_dados).replace(os.sep, '/')
+
+
+def _ler_conteudo(caminho):
+    """Conteúdo consistente do ficheiro: SQLite pela API de backup, os restantes relidos se mudarem durante a leitura."""
+    if caminho.endswith('.sqlite'):
+        with tempfile.TemporaryDirectory() as temporaria:
+            copia = os.path.join(temporaria, 'copia.sqlite')
+            with closing(sqlite3.connect(caminho)) as origem, closing(sqlite3.connect(copia)) as destino:
+                origem.backup(destino)
+            with open(copia, 'rb') as f:
+                return f.read()
+    for _ in range(5):
+        antes = os.stat(caminho)
+        with open(caminho, 'rb') as f:
+            conteudo = f.read()
+        depois = os.stat(caminho)
+        if (antes.st_size, antes.st_mtime_ns) == (depois.st_size, depois.st_mtime_ns) and len(conteudo) == depois.st_size:
+            return conteudo
+        time.sleep(0.2)  # A aplicação está a gravar este ficheiro; tenta de novo
+    return conteudo
+
+
+class Repositorio:
+
+    def __init__(self, pasta_backup):
+        self.pasta = pasta_backup
+        self.pasta_objetos = os.path.join(pasta_backup, "objetos")
+        self.pasta_snapshots = os.path.join(pasta_backup, "snapshots")
+        self._lock = threading.Lock()
+
+    def _caminho_objeto(self, hash_bloco):
+        return os.path.join(self.pasta_objetos, hash_bloco[:2], hash_bloco)
+
+    def _guardar_bloco(self, bloco):
+        """Guarda o bloco se ainda não existir; devolve (hash, bytes escritos)."""
+        hash_bloco = hashlib.sha256(bloco).hexdigest()
+        caminho = self._caminho_objeto(hash_bloco)
+        if os.path.exists(caminho):
+            return hash_bloco, 0
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        comprimido = zlib.compress(bloco, 6)
+        os.replace(_escrever_temporario(os.path.dirname(caminho), [comprimido]), caminho)
+        return hash_bloco, len(comprimido)
+
+    def _ler_bloco(self, hash_bloco):
+        with open(self._caminho_objeto(hash_bloco), 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def listar(self):
+        """IDs dos snapshots, do mais recente para o mais antigo."""
+        if not os.path.isdir(self.pasta_snapshots):
+            return []
+        return sorted((n[:-5] for n in os.listdir(self.pasta_snapshots) if n.endswith('.json')), key=_ordem_snapshot, reverse=True)
+
+    def ler_snapshot(self, snapshot_id):
+        with open(os.path.join(self.pasta_snapshots, f"{snapshot_id}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @cronometrado('backup_criar')
+    def criar(self, pasta_dados, agora=None):
+        """
+        Cria um snapshot incremental. Devolve um resumo (id, ficheiros, alterados, bytes_novos)
+        ou None se nada mudou desde o último.
+        """
+        with self._lock:
+            anteriores = self.listar()
+            anterior = self.ler_snapshot(anteriores[0])['ficheiros'] if anteriores else {}
+            ficheiros, alterados, bytes_novos = {}, 0, 0
+            for relativo in _listar_ficheiros(pasta_dados):
+                caminho = os.path.join(pasta_dados, relativo)
+                estado = os.stat(caminho)
+                entrada_anterior = anterior.get(relativo)
+                if (entrada_anterior and not relativo.endswith('.sqlite')
+                        and entrada_anterior['tamanho'] == estado.st_size and entrada_anterior['mtime_ns'] == estado.st_mtime_ns):
+                    ficheiros[relativo] = entrada_anterior
+                    continue
+                conteudo = _ler_conteudo(caminho)
+                partes = []
+                for inicio in range(0, len(conteudo), TAMANHO_BLOCO):
+                    hash_bloco, escritos = self._guardar_bloco(conteudo[inicio:inicio + TAMANHO_BLOCO])
+                    partes.append(hash_bloco)
+                    bytes_novos += escritos
+                ficheiros[relativo] = {'tamanho': len(conteudo), 'mtime_ns': estado.st_mtime_ns, 'partes': partes}
+                if entrada_anterior is None or entrada_anterior['partes'] != partes:
+                    alterados += 1
+
+            if anteriores and not alterados and set(ficheiros) == set(anterior):
+                return None
+            agora = agora or datetime.now()
+            os.makedirs(self.pasta_snapshots, exist_ok=True)
+            conteudo = json.dumps({'criado_em': agora.isoformat(timespec='seconds'), 'ficheiros': ficheiros},
+                                  separators=(',', ':')).encode('utf-8')
+            temporario = _escrever_temporario(self.pasta_snapshots, [conteudo])
+            try:
+                snapshot_id = self._publicar_snapshot(temporario, agora.strftime(FORMATO_ID))
+            finally:
+                os.remove(temporario)
+            return {'id': snapshot_id, 'ficheiros': len(ficheiros), 'alterados': alterados, 'bytes_novos': bytes_novos}
+
+    def _publicar_snapshot(self, temporario, base):
+        """
+        Dá ao snapshot o primeiro ID livre (base, base-2, ...). O link falha se o nome já existir,
+        mesmo que outro processo o tenha acabado de criar, por isso nenhum snapshot é substituído.
+        """
+        for numero in range(1, 1000):
+            snapshot_id = base if numero == 1 else f"{base}-{numero}"
+            try:
+                os.link(temporario, os.path.join(self.pasta_snapshots, f"{snapshot_id}.json"))
+            except FileExistsError:
+                continue
+            return snapshot_id
+        raise OSError(f"Demasiadas cópias no mesmo segundo ({base}).")
+
+    @cronometrado('backup_restaurar')
+    def restaurar(self, snapshot_id, pasta_dados):
+        """
+        Repõe os ficheiros de dados como estavam no snapshot. Ficheiros das pastas incluídas que
+        não existiam nesse momento são removidos.
+        """
+        with self._lock:
+            ficheiros = self.ler_snapshot(snapshot_id)['ficheiros']
+            for relativo, entrada in ficheiros.items():
+                destino = os.path.join(pasta_dados, relativo)
+                pasta_destino = os.path.dirname(destino) or pasta_dados
+                os.makedirs(pasta_destino, exist_ok=True)
+                blocos = (self._ler_bloco(hash_bloco) for hash_bloco in entrada['partes'])
+                os.replace(_escrever_temporario(pasta_destino, blocos), destino)
+            for relativo in list(_listar_ficheiros(pasta_dados)):
+                if relativo not in ficheiros:
+                    os.remove(os.path.join(pasta_dados, relativo))
+            return len(ficheiros)
+
+    def aplicar_retencao(self, agora=None):
+        """Apaga os snapshots fora da política de retenção e os blocos que deixaram de ser usados."""
+        with self._lock:
+            agora = agora or datetime.now()
+            manter, dias_vistos, semanas_vistas = set(), set(), set()
+            for snapshot_id in self.listar():
+                momento = momento_snapshot(snapshot_id)
+                idade = agora - momento
+                dia, semana = momento.date(), momento.isocalendar()[:2]
+                if idade <= timedelta(hours=RETER_TODAS_HORAS):
+                    manter.add(snapshot_id)
+                elif idade <= timedelta(days=RETER_DIARIAS) and dia not in dias_vistos:
+                    manter.add(snapshot_id)
+                elif idade <= timedelta(weeks=RETER_SEMANAIS) and semana not in semanas_vistas:
+                    manter.add(snapshot_id)
+                dias_vistos.add(dia)
+                semanas_vistas.add(semana)
+            removidos = [s for s in self.listar() if s not in manter]
+            for snapshot_id in removidos:
+                os.remove(os.path.join(self.pasta_snapshots, f"{snapshot_id}.json"))
+            if removidos:
+                self._recolher_blocos()
+            return removidos
+
+    def _recolher_blocos(self):
+        usados = set()
+        for snapshot_id in self.listar():
+            for entrada in self.ler_snapshot(snapshot_id)['ficheiros'].values():
+                usados.update(entrada['partes'])
+        for raiz, _, nomes in os.walk(self.pasta_objetos):
+            for nome in nomes:
+                # Os temporários são blocos que outro processo ainda está a gravar
+                if nome not in usados and not nome.endswith('.tmp'):
+                    os.remove(os.path.join(raiz, nome))
+
+
+class AgendadorBackup:
+    """Thread que cria um snapshot a cada `intervalo` segundos (se algo mudou) e aplica a retenção."""
+
+    def __init__(self, pasta_dados, pasta_backup, intervalo=INTERVALO_PADRAO):
+        self.pasta_dados = pasta_dados
+        self.repositorio = Repositorio(pasta_backup)
+        self.intervalo = intervalo
+        self.ultimo_resultado = None
+        self.ultimo_erro = None
+        self._acordar = threading.Event()
+        self._thread = threading.Thread(target=self._ciclo, name='backup', daemon=True)
+        self._thread.start()
+
+    def copiar_agora(self):
+        self._acordar.set()
+
+    def _ciclo(self):
+        while True:
+            try:
+                resultado = self.repositorio.criar(self.pasta_dados)
+                if resultado is not None:
+                    self.ultimo_resultado = resultado
+                self.repositorio.aplicar_retencao()
+                self.ultimo_erro = None
+            except (OSError, ValueError, sqlite3.Error) as erro:
+                self.ultimo_erro = str(erro)
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+
+
+_agendadores = {}
+_agendadores_lock = threading.Lock()
+
+
+def obter_agendador(pasta_dados, pasta_backup, intervalo=INTERVALO_PADRAO):
+    """Agendador partilhado pelas sessões do servidor (um por pasta de backup)."""
+    with _agendadores_lock:
+        if pasta_backup not in _agendadores:
+            _agendadores[pasta_backup] = AgendadorBackup(pasta_dados, pasta_backup, intervalo)
+        return _agendadores[pasta_backup]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cópias de segurança dos dados do GMaster.")
+    parser.add_argument('--dados', default=os.environ.get("GMASTER_DADOS", os.getcwd()))
+    parser.add_argument('--backups', default=None, help="Pasta das cópias (padrão: <dados>/backups)")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    sub.add_parser('criar')
+    sub.add_parser('listar')
+    restaurar = sub.add_parser('restaurar')
+    restaurar.add_argument('snapshot')
+    args = parser.parse_args(argv)
+
+    repositorio = Repositorio(args.backups or os.path.join(args.dados, "backups"))
+    if args.comando == 'criar':
+        resultado = repositorio.criar(args.dados)
+        print("Nada mudou desde a última cópia." if resultado is None else
+              f"Cópia {resultado['id']}: {resultado['alterados']} ficheiro(s) alterado(s), {resultado['bytes_novos']} bytes novos.")
+    elif args.comando == 'listar':
+        for snapshot_id in repositorio.listar():
+            print(snapshot_id)
+    else:
+        # Como na aba Empresa: o estado atual fica guardado antes de ser substituído
+        seguranca = repositorio.criar(args.dados)
+        if seguranca is not None:
+            print(f"Cópia de segurança do estado atual: {seguranca['id']}.")
+        inicio = time.perf_counter()
+        total = repositorio.restaurar(args.snapshot, args.dados)
+        print(f"{total} ficheiro(s) restaurado(s) em {time.perf_counter() - inicio:.2f} s.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Benchmark do GMaster sobre bases fictícias de tamanho crescente.
+
+Mede carga, gravação (salvar_dados), preparar_dados_analise, agregação do Dashboard,
+lotes de gerar_xml_nfc e as duas exportações, e grava os resultados em JSON.
+
+Uso:
+    python -m gmaster.benchmark --cenarios demo ano --repeticoes 3 --saida bench.json
+    python -m gmaster.benchmark --dias 730 --vendas-dia 500 1500 --produtos 200
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from gmaster.dados import (
+    gerar_dados_ficticios, gravar_base, ler_base, preparar_dados_analise, agregar_dashboard,
+    gerar_xml_nfc, gerar_csv_powerbi, gerar_script_mysql
+)
+
+CENARIOS = {
+    'demo': {'dias': 90, 'vendas_por_dia': (5, 25), 'n_produtos': 10},
+    'ano': {'dias': 365, 'vendas_por_dia': (50, 150), 'n_produtos': 50},
+    'movimentado': {'dias': 730, 'vendas_por_dia': (500, 1500), 'n_produtos': 200},
+    # Passa do limite de linhas de uma folha do Excel (1.048.576): a gravação deve falhar
+    'limite': {'dias': 1095, 'vendas_por_dia': (1000, 3000), 'n_produtos': 300},
+}
+
+CONFIG_BENCHMARK = {'cnpj': '00.000.000/0001-00', 'razao_social': 'Pizzaria Benchmark LTDA'}
+
+
+def _cronometrar(funcao, repeticoes):
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return tempos, resultado
+
+
+def _gerar_lote_xml(vendas, produtos, tamanho_lote):
+    produtos_idx = produtos.set_index('Produto', drop=False)
+    for _, venda_info in vendas.tail(tamanho_lote).iterrows():
+        produto_info = produtos_idx.loc[[venda_info['Produto']]].copy()
+        produto_info['Quantidade'] = venda_info['Quantidade']
+        gerar_xml_nfc(venda_info, produto_info, CONFIG_BENCHMARK)
+
+
+def executar_cenario(nome, parametros, repeticoes=3, tamanho_lote_xml=500, semente=42, pasta=None):
+    """Executa todas as operações para um cenário e devolve um dicionário com os tempos."""
+    dados = gerar_dados_ficticios(semente=semente, **parametros)
+    produtos, estoque, vendas, compras = dados['produtos'], dados['estoque'], dados['vendas'], dados['compras']
+    caminho = os.path.join(pasta or tempfile.gettempdir(), f"bench_{nome}.xlsx")
+    fim = vendas['Data'].max() + timedelta(days=1)
+    inicio = fim - timedelta(days=30)
+    contexto = {}
+
+    def preparar():
+        contexto['analise'] = preparar_dados_analise(vendas, produtos)
+
+    def agregar():
+        analise = contexto['analise']
+        return agregar_dashboard(analise[(analise['Data'] >= inicio) & (analise['Data'] < fim)])
+
+    operacoes = [
+        ('salvar_dados', lambda: gravar_base(caminho, produtos, estoque, vendas, compras)),
+        ('carregar', lambda: ler_base(caminho)),
+        ('preparar_dados_analise', preparar),
+        ('agregar_dashboard', agregar),
+        ('gerar_xml_nfc_lote', lambda: _gerar_lote_xml(vendas, produtos, tamanho_lote_xml)),
+        ('exportar_csv_powerbi', lambda: gerar_csv_powerbi(vendas, produtos)),
+        ('exportar_mysql', lambda: gerar_script_mysql(produtos, estoque, vendas)),
+    ]
+
+    resultado = {
+        'cenario': nome,
+        'parametros': {**parametros, 'vendas_por_dia': list(parametros['vendas_por_dia'])},
+        'linhas_vendas': int(len(vendas)),
+        'produtos': int(len(produtos)),
+        'operacoes': {},
+    }
+    for nome_operacao, funcao in operacoes:
+        try:
+            tempos, _ = _cronometrar(funcao, repeticoes)
+            resultado['operacoes'][nome_operacao] = {
+                'tempos_s': [round(t, 6) for t in tempos],
+                'mediana_s': round(statistics.median(tempos), 6),
+                'min_s': round(min(tempos), 6),
+                'erro': None,
+            }
+        except Exception as e:
+            resultado['operacoes'][nome_operacao] = {
+                'tempos_s': [], 'mediana_s': None, 'min_s': None,
+                'erro': f"{type(e).__name__}: {e}",
+            }
+            traceback.print_exc(file=sys.stderr)
+    resultado['operacoes']['gerar_xml_nfc_lote']['tamanho_lote'] = min(tamanho_lote_xml, len(vendas))
+    if os.path.exists(caminho):
+        resultado['tamanho_arquivo_bytes'] = os.path.getsize(caminho)
+        os.remove(caminho)
+    return resultado
+
+
+def executar(cenarios, repeticoes=3, tamanho_lote_xml=500, semente=42):
+    resultados = []
+    with tempfile.TemporaryDirectory() as pasta:
+        for nome, parametros in cenarios.items():
+            print(f"[benchmark] cenário '{nome}' {parametros}", file=sys.stderr)
+            resultados.append(executar_cenario(nome, parametros, repeticoes, tamanho_lote_xml, semente, pasta))
+    return {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'plataforma': platform.platform(),
+        },
+        'semente': semente,
+        'repeticoes': repeticoes,
+        'resultados': resultados,
+    }
+
+
+def imprimir_resumo(relatorio, destino=sys.stderr):
+    for resultado in relatorio['resultados']:
+        print(f"\n{resultado['cenario']}: {resultado['linhas_vendas']} vendas, {resultado['produtos']} produtos", file=destino)
+        for operacao, medida in resultado['operacoes'].items():
+            valor = f"{medida['mediana_s']:.4f} s" if medida['erro'] is None else f"ERRO ({medida['erro']})"
+            print(f"  {operacao:<24} {valor}", file=destino)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do GMaster com dados fictícios.")
+    parser.add_argument('--cenarios', nargs='+', choices=sorted(CENARIOS), default=['demo', 'ano'])
+    parser.add_argument('--dias', type=int, help="Cenário personalizado: dias de histórico.")
+    parser.add_argument('--vendas-dia', type=int, nargs=2, metavar=('MIN', 'MAX'), default=(5, 25))
+    parser.add_argument('--produtos', type=int, default=10)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--lote-xml', type=int, default=500, help="Quantidade de XMLs por lote.")
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', help="Ficheiro JSON de saída (por padrão, stdout).")
+    args = parser.parse_args(argv)
+
+    if args.dias:
+        cenarios = {f"personalizado_{args.dias}d": {'dias': args.dias, 'vendas_por_dia': tuple(args.vendas_dia), 'n_produtos': args.produtos}}
+    else:
+        cenarios = {nome: CENARIOS[nome] for nome in args.cenarios}
+
+    relatorio = executar(cenarios, args.repeticoes, args.lote_xml, args.semente)
+    imprimir_resumo(relatorio)
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Dimensão de clientes indexada pelo CPF (normalizado e com hash) e métricas RFM.
+
+O CPF nunca é guardado em claro no índice: cada cliente é identificado por um hash
+com sal local, e o índice aponta para os IDs das vendas desse cliente. As métricas
+(recência, frequência, valor) são acumuladas venda a venda, sem reler a aba Vendas.
+"""
+import gzip
+import hashlib
+import json
+import os
+import secrets
+from datetime import datetime
+
+import pandas as pd
+
+COLUNAS_RFM = ['Cliente', 'CPF', 'Primeira_Compra', 'Ultima_Compra', 'Recencia_Dias',
+               'Frequencia', 'Valor', 'R', 'F', 'V', 'Segmento']
+
+
+def _digitos_verificadores_validos(digitos):
+    for posicao in (9, 10):
+        soma = sum(int(d) * peso for d, peso in zip(digitos[:posicao], range(posicao + 1, 1, -1)))
+        if (soma * 10) % 11 % 10 != int(digitos[posicao]):
+            return False
+    return True
+
+
+def normalizar_cpf(cpf):
+    """Devolve o CPF só com os 11 dígitos, ou None se o valor não for um CPF válido."""
+    if cpf is None:
+        return None
+    if isinstance(cpf, float):
+        if pd.isna(cpf):
+            return None
+        cpf = int(cpf)
+    if isinstance(cpf, int):
+        # O Excel converte CPFs digitados sem pontuação em números e perde os zeros à esquerda
+        cpf = str(cpf).zfill(11)
+    digitos = ''.join(c for c in str(cpf) if c.isdigit())
+    if len(digitos) != 11 or digitos == digitos[0] * 11:
+        return None
+    # Os dígitos verificadores evitam que um CPF digitado com erro vire outro cliente
+    if not _digitos_verificadores_validos(digitos):
+        return None
+    return digitos
+
+
+def mascarar_cpf(cpf_normalizado):
+    return f"***.{cpf_normalizado[3:6]}.{cpf_normalizado[6:9]}-**"
+
+
+def carregar_sal(caminho):
+    """Lê (ou cria na primeira execução) o sal local usado no hash dos CPFs."""
+    if os.path.exists(caminho):
+        with open(caminho, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    sal = secrets.token_hex(16)
+    with open(caminho, "w", encoding="utf-8") as f:
+        f.write(sal)
+    return sal
+
+
+class IndiceClientes:
+    """
+    Índice cliente -> vendas com agregados incrementais.
+
+    Cada entrada guarda: primeira e última compra (timestamp), frequência, valor total,
+    CPF mascarado para exibição e a lista de IDs das vendas. Buscas por CPF são O(1).
+    """
+
+    def __init__(self, sal):
+        self.sal = sal
+        self.clientes = {}
+        self.ultimo_id = -1
+
+    def chave(self, cpf):
+        cpf_normalizado = normalizar_cpf(cpf)
+        if cpf_normalizado is None:
+            return None
+        return hashlib.blake2b(cpf_normalizado.encode(), key=self.sal.encode()[:64], digest_size=10).hexdigest()
+
+    def registrar_venda(self, venda_id, data, cpf, valor):
+        """Acrescenta uma venda ao índice. Vendas sem CPF válido são apenas contabilizadas no cursor."""
+        venda_id = int(venda_id)
+        self.ultimo_id = max(self.ultimo_id, venda_id)
+        chave = self.chave(cpf)
+        if chave is None:
+            return None
+        ts = int(pd.to_datetime(data).timestamp())
+        cliente = self.clientes.get(chave)
+        if cliente is None:
+            cliente = {'primeira': ts, 'ultima': ts, 'frequencia': 0, 'valor': 0.0,
+                       'mascara': mascarar_cpf(normalizar_cpf(cpf)), 'vendas': []}
+            self.clientes[chave] = cliente
+        cliente['primeira'] = min(cliente['primeira'], ts)
+        cliente['ultima'] = max(cliente['ultima'], ts)
+        cliente['frequencia'] += 1
+        cliente['valor'] = round(cliente['valor'] + float(valor or 0), 2)
+        cliente['vendas'].append(venda_id)
+        return chave
+
+    def atualizar(self, vendas_df, produtos_df):
+        """
+        Processa apenas as vendas com ID maior que o último já indexado.
+        Se a aba Vendas encolheu (ficheiro substituído), o índice é reconstruído.
+        """
+        if vendas_df.empty:
+            return 0
+        if vendas_df.index.max() < self.ultimo_id:
+            self.clientes = {}
+            self.ultimo_id = -1
+        novas = vendas_df[vendas_df.index > self.ultimo_id]
+        if novas.empty:
+            return 0
+        precos = pd.to_numeric(produtos_df.set_index('Produto')['Preco_Venda'], errors='coerce')
+        precos = precos[~precos.index.duplicated()]
+        quantidades = pd.to_numeric(novas['Quantidade'], errors='coerce').fillna(0)
+        valores = quantidades * novas['Produto'].map(precos).fillna(0)
+        cpfs = novas['CPF_Cliente'] if 'CPF_Cliente' in novas.columns else pd.Series(None, index=novas.index)
+        for venda_id, data, cpf, valor in zip(novas.index, novas['Data'], cpfs, valores):
+            self.registrar_venda(venda_id, data, cpf, valor)
+        return len(novas)
+
+    def buscar(self, cpf):
+        chave = self.chave(cpf)
+        return self.clientes.get(chave) if chave else None
+
+    def calcular_rfm(self, referencia=None):
+        """Tabela RFM com notas de 1 a 5 (quintis) e um segmento de fidelidade por cliente."""
+        if not self.clientes:
+            return pd.DataFrame(columns=COLUNAS_RFM)
+        referencia = pd.Timestamp(referencia or datetime.now())
+        df = pd.DataFrame.from_dict(self.clientes, orient='index')
+        df.index.name = 'Cliente'
+        df = df.reset_index()
+        df['Primeira_Compra'] = pd.to_datetime(df['primeira'], unit='s')
+        df['Ultima_Compra'] = pd.to_datetime(df['ultima'], unit='s')
+        df['Recencia_Dias'] = (referencia - df['Ultima_Compra']).dt.days.clip(lower=0)
+        df = df.rename(columns={'frequencia': 'Frequencia', 'valor': 'Valor', 'mascara': 'CPF'})
+        if len(df) < 5:
+            # Sem clientes suficientes para quintis: notas neutras, sem classificar ninguém como Campeão ou Inativo
+            df['R'] = df['F'] = df['V'] = 3
+            df['Segmento'] = 'Regular'
+        else:
+            # Ranking antes do qcut para evitar limites duplicados quando há muitos empates
+            df['R'] = pd.qcut((-df['Recencia_Dias']).rank(method='first'), 5, labels=False) + 1
+            df['F'] = pd.qcut(df['Frequencia'].rank(method='first'), 5, labels=False) + 1
+            df['V'] = pd.qcut(df['Valor'].rank(method='first'), 5, labels=False) + 1
+            df['Segmento'] = 'Regular'
+            df.loc[df['R'] <= 2, 'Segmento'] = 'Inativo'
+            df.loc[(df['R'] <= 2) & (df['F'] >= 3), 'Segmento'] = 'Em risco'
+            df.loc[(df['R'] >= 4) & (df['Frequencia'] == 1), 'Segmento'] = 'Novo'
+            df.loc[df['F'] >= 4, 'Segmento'] = 'Fiel'
+            df.loc[(df['R'] >= 4) & (df['F'] >= 4), 'Segmento'] = 'Campeão'
+        return df[COLUNAS_RFM].sort_values(['R', 'F', 'V'], ascending=False).reset_index(drop=True)
+
+    def salvar(self, caminho):
+        dados = {'ultimo_id': self.ultimo_id, 'clientes': self.clientes}
+        temporario = caminho + ".tmp"
+        with gzip.open(temporario, "wt", encoding="utf-8") as f:
+            json.dump(dados, f, separators=(',', ':'))
+        os.replace(temporario, caminho)
+
+    @classmethod
+    def carregar(cls, caminho, sal):
+        indice = cls(sal)
+        if os.path.exists(caminho):
+            try:
+                with gzip.open(caminho, "rt", encoding="utf-8") as f:
+                    dados = json.load(f)
+                indice.ultimo_id = dados.get('ultimo_id', -1)
+                indice.clientes = dados.get('clientes', {})
+            except (OSError, ValueError):
+                # Índice corrompido: começa do zero e é reconstruído a partir das vendas
+                indice = cls(sal)
+        return indice
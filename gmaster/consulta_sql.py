@@ -0,0 +1,177 @@
+"""
+Consola SQL para perguntas ad hoc sobre as tabelas da aplicação.
+
+Usa o DuckDB (motor colunar) quando está instalado e o SQLite da biblioteca padrão caso
+contrário. As tabelas são carregadas apenas quando aparecem na consulta e ficam no motor até a
+versão dos dados mudar. Só são aceites consultas de leitura (SELECT/WITH), com tempo limite e
+limite de linhas; os resultados ficam em cache por texto da consulta e versão dos dados. O texto
+executado é o que foi escrito: comentários e espaços só são ignorados fora das aspas, e só para a
+chave da cache e para as verificações.
+
+Tabelas: vendas (conjunto quente), vendas_arquivo (meses arquivados), vendas_historico (ambas),
+vendas_detalhadas (vendas do histórico com preço, custo, receita e lucro), cardapio, estoque, compras.
+"""
+import importlib.util
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from gmaster.metricas import cronometrado, contar
+
+LIMITE_LINHAS = 1000
+TEMPO_LIMITE = 10
+TAMANHO_CACHE = 32
+
+_INICIO_LEITURA = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+# Literais ('...'), identificadores ("..."), comentários, espaços, ';' e o resto do código
+_PARTES = re.compile(r"""'(?:[^']|'')*'?|"(?:[^"]|"")*"?|--[^\n]*|/\*.*?(?:\*/|$)|\s+|;|[^'"\s;/-]+|.""", re.DOTALL)
+
+
+class ErroConsulta(Exception):
+    pass
+
+
+def motor_disponivel():
+    # DuckDB é opcional e só é importado na primeira consulta, não no arranque da aplicação
+    return 'duckdb' if importlib.util.find_spec('duckdb') is not None else 'sqlite'
+
+
+def _separador(parte):
+    return parte.isspace() or parte.startswith('--') or parte.startswith('/*')
+
+
+def _analisar(sql):
+    """
+    Devolve (texto, chave, codigo): `texto` é a consulta escrita sem os ';', espaços e comentários
+    finais; `chave` é o texto com comentários e espaços fora das aspas reduzidos a um espaço (os
+    literais ficam intactos); `codigo` é só o código, sem comentários e com os literais esvaziados.
+    """
+    partes = list(_PARTES.finditer(sql))
+    while partes and (_separador(partes[-1].group()) or partes[-1].group() == ';'):
+        partes.pop()
+    chave, codigo, separar = [], [], False
+    for m in partes:
+        parte = m.group()
+        if _separador(parte):
+            separar = bool(chave)
+            continue
+        if separar:
+            chave.append(' ')
+            codigo.append(' ')
+            separar = False
+        chave.append(parte)
+        codigo.append("''" if parte.startswith("'") else parte)
+    texto = sql[partes[0].start():partes[-1].end()] if partes else ''
+    return texto, ''.join(chave), ''.join(codigo)
+
+
+def _validar(codigo):
+    if not codigo:
+        raise ErroConsulta("Escreva uma consulta.")
+    if not _INICIO_LEITURA.match(codigo):
+        raise ErroConsulta("Só são permitidas consultas de leitura (SELECT ou WITH).")
+    if ';' in codigo:
+        raise ErroConsulta("Execute uma consulta de cada vez (sem ';' no meio).")
+
+
+class ConsoleSQL:
+
+    def __init__(self, fontes):
+        """`fontes` mapeia o nome de cada tabela a uma função sem argumentos que devolve o DataFrame."""
+        self.fontes = fontes
+        self.motor = motor_disponivel()
+        self._conexao = None
+        self._versao = None
+        self._carregadas = set()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _preparar(self, codigo, versao):
+        if self._conexao is None or versao != self._versao:
+            if self._conexao is not None:
+                self._conexao.close()
+            if self.motor == 'duckdb':
+                import duckdb
+                # Sem acesso a ficheiros nem à rede: só as tabelas registadas
+                self._conexao = duckdb.connect(':memory:', config={'enable_external_access': False})
+            else:
+                self._conexao = sqlite3.connect(':memory:', check_same_thread=False)
+            self._versao = versao
+            self._carregadas = set()
+        referidas = {nome for nome in self.fontes if re.search(rf"\b{nome}\b", codigo, re.IGNORECASE)}
+        if self.motor == 'sqlite' and referidas - self._carregadas:
+            self._conexao.execute("PRAGMA query_only = OFF")
+        for nome in sorted(referidas - self._carregadas):
+            tabela = self.fontes[nome]()
+            if self.motor == 'duckdb':
+                self._conexao.register(nome, tabela)
+            else:
+                tabela.to_sql(nome, self._conexao, index=False)
+            self._carregadas.add(nome)
+        if self.motor == 'sqlite':
+            self._conexao.execute("PRAGMA query_only = ON")
+
+    def _executar_sqlite(self, sql, limite, tempo_limite):
+        prazo = time.monotonic() + tempo_limite
+        # Devolver um valor diferente de zero interrompe a consulta
+        self._conexao.set_progress_handler(lambda: int(time.monotonic() > prazo), 10000)
+        try:
+            cursor = self._conexao.execute(sql)
+            linhas = cursor.fetchmany(limite + 1)
+        except sqlite3.OperationalError as erro:
+            if 'interrupted' in str(erro):
+                raise ErroConsulta(f"A consulta passou do tempo limite de {tempo_limite} s.") from erro
+            raise ErroConsulta(str(erro)) from erro
+        except sqlite3.Error as erro:
+            raise ErroConsulta(str(erro)) from erro
+        finally:
+            self._conexao.set_progress_handler(None, 0)
+        return [d[0] for d in cursor.description], linhas
+
+    def _executar_duckdb(self, sql, limite, tempo_limite):
+        import duckdb
+        temporizador = threading.Timer(tempo_limite, self._conexao.interrupt)
+        temporizador.start()
+        try:
+            cursor = self._conexao.execute(sql)
+            linhas = cursor.fetchmany(limite + 1)
+        except duckdb.InterruptException as erro:
+            raise ErroConsulta(f"A consulta passou do tempo limite de {tempo_limite} s.") from erro
+        except duckdb.Error as erro:
+            raise ErroConsulta(str(erro)) from erro
+        finally:
+            temporizador.cancel()
+        return [d[0] for d in cursor.description], linhas
+
+    @cronometrado('consulta_sql')
+    def executar(self, sql, versao, limite=LIMITE_LINHAS, tempo_limite=TEMPO_LIMITE):
+        """
+        Devolve (DataFrame, info) com info = {motor, truncado, segundos, em_cache}.
+        Levanta ErroConsulta para consultas inválidas, com erro ou que passaram do tempo.
+        """
+        sql, texto_chave, codigo = _analisar(sql)
+        _validar(codigo)
+        chave = (texto_chave, versao, limite)
+        with self._lock:
+            if chave in self._cache:
+                self._cache.move_to_end(chave)
+                contar('consulta_sql_em_cache')
+                resultado, info = self._cache[chave]
+                return resultado, dict(info, em_cache=True)
+            inicio = time.perf_counter()
+            self._preparar(codigo, versao)
+            if self.motor == 'duckdb':
+                colunas, linhas = self._executar_duckdb(sql, limite, tempo_limite)
+            else:
+                colunas, linhas = self._executar_sqlite(sql, limite, tempo_limite)
+            resultado = pd.DataFrame(linhas[:limite], columns=colunas)
+            info = {'motor': self.motor, 'truncado': len(linhas) > limite,
+                    'segundos': time.perf_counter() - inicio, 'em_cache': False}
+            self._cache[chave] = (resultado, info)
+            if len(self._cache) > TAMANHO_CACHE:
+                self._cache.popitem(last=False)
+            return resultado, info
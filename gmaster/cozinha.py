@@ -0,0 +1,232 @@
+"""
+Quadro de pedidos da cozinha com envio imediato (Server-Sent Events).
+
+Cada venda confirmada é publicada num canal em memória (publicar/assinar). Um pequeno servidor
+HTTP, iniciado uma vez por processo, mantém uma ligação SSE aberta com cada ecrã da cozinha e
+envia-lhe os pedidos novos e as mudanças de estado assim que acontecem: os ecrãs não fazem
+polling nem leem a base. A página do quadro é servida pelo mesmo servidor (`/`), por isso pode
+ser aberta diretamente num tablet da cozinha ou embutida na aplicação.
+"""
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from gmaster.metricas import contar
+
+PORTA_PADRAO = 8502
+INTERVALO_BATIMENTO = 15
+
+ESTADOS = {
+    'recebido': "Recebido",
+    'preparando': "Preparando",
+    'no_forno': "No forno",
+    'saiu_entrega': "Saiu para entrega",
+}
+ORDEM_ESTADOS = list(ESTADOS)
+ESTADO_FINAL = 'saiu_entrega'
+
+
+class CanalPedidos:
+    """Pedidos em curso e os assinantes (uma fila por ecrã ligado)."""
+
+    def __init__(self):
+        self._pedidos = {}
+        self._assinantes = set()
+        self._lock = threading.Lock()
+
+    def _difundir(self, evento, dados):
+        for fila in self._assinantes:
+            fila.put((evento, dados))
+
+    def publicar_pedido(self, venda_id, produto, quantidade, data):
+        pedido = {
+            'id': int(venda_id),
+            'produto': str(produto),
+            'quantidade': int(quantidade),
+            'hora': data.strftime('%H:%M') if hasattr(data, 'strftime') else str(data),
+            'estado': ORDEM_ESTADOS[0],
+        }
+        with self._lock:
+            self._pedidos[pedido['id']] = pedido
+            self._difundir('pedido', pedido)
+        contar('cozinha_pedidos_publicados')
+
+    def mudar_estado(self, venda_id, estado):
+        """Muda o estado do pedido; no estado final ele sai do quadro. Devolve False se não existe."""
+        if estado not in ESTADOS:
+            raise ValueError(f"Estado desconhecido: {estado}")
+        with self._lock:
+            pedido = self._pedidos.get(int(venda_id))
+            if pedido is None:
+                return False
+            pedido['estado'] = estado
+            if estado == ESTADO_FINAL:
+                del self._pedidos[pedido['id']]
+            self._difundir('estado', {'id': pedido['id'], 'estado': estado})
+        return True
+
+    def assinar(self):
+        """Devolve (fila, pedidos atuais). A fila recebe (evento, dados) a partir deste momento."""
+        fila = queue.Queue()
+        with self._lock:
+            self._assinantes.add(fila)
+            return fila, list(self._pedidos.values())
+
+    def cancelar(self, fila):
+        with self._lock:
+            self._assinantes.discard(fila)
+
+    def pedidos(self):
+        with self._lock:
+            return list(self._pedidos.values())
+
+
+PAGINA_QUADRO = """<!DOCTYPE html>
+<html lang="pt"><head><meta charset="utf-8"><title>Cozinha - GMaster</title>
+<style>
+body { background:#262730; color:#fff; font-family:sans-serif; margin:0; padding:12px; }
+#colunas { display:flex; gap:12px; }
+.coluna { flex:1; background:#1e1f26; border-radius:8px; padding:8px; min-height:300px; }
+.coluna h3 { margin:4px 0 10px; color:#ffc107; }
+.cartao { background:#33343f; border-left:6px solid #b71c1c; border-radius:6px; padding:8px; margin-bottom:8px; }
+.cartao b { font-size:1.2em; }
+button { background:#ffc107; border:none; border-radius:6px; padding:6px 10px; font-weight:bold; cursor:pointer; margin-top:6px; }
+#ligacao { font-size:0.8em; color:#aaa; margin-bottom:8px; }
+</style></head><body>
+<div id="ligacao">A ligar...</div>
+<div id="colunas"></div>
+<script>
+const ESTADOS = __ESTADOS__;
+const ORDEM = Object.keys(ESTADOS);
+const FINAL = "__FINAL__";
+const pedidos = new Map();
+const colunas = document.getElementById("colunas");
+function desenhar() {
+  colunas.innerHTML = "";
+  for (const estado of ORDEM.filter(e => e !== FINAL)) {
+    const coluna = document.createElement("div");
+    coluna.className = "coluna";
+    coluna.innerHTML = "<h3>" + ESTADOS[estado] + "</h3>";
+    for (const p of [...pedidos.values()].filter(p => p.estado === estado).sort((a, b) => a.id - b.id)) {
+      const cartao = document.createElement("div");
+      cartao.className = "cartao";
+      const seguinte = ORDEM[ORDEM.indexOf(estado) + 1];
+      const titulo = document.createElement("b");
+      titulo.textContent = "#" + p.id + " - " + p.quantidade + "x " + p.produto;
+      cartao.append(titulo, document.createElement("br"), p.hora, document.createElement("br"));
+      const botao = document.createElement("button");
+      botao.textContent = ESTADOS[seguinte] + " →";
+      botao.onclick = () => fetch("pedidos/" + p.id + "/estado", {method: "POST", headers: {"Content-Type": "application/json"}, body: JSON.stringify({estado: seguinte})});
+      cartao.appendChild(botao);
+      coluna.appendChild(cartao);
+    }
+    colunas.appendChild(coluna);
+  }
+}
+const fonte = new EventSource("eventos");
+fonte.onopen = () => document.getElementById("ligacao").textContent = "Ligado - os pedidos aparecem automaticamente.";
+fonte.onerror = () => document.getElementById("ligacao").textContent = "Ligação perdida, a religar...";
+fonte.addEventListener("inicial", e => { pedidos.clear(); for (const p of JSON.parse(e.data)) pedidos.set(p.id, p); desenhar(); });
+fonte.addEventListener("pedido", e => { const p = JSON.parse(e.data); pedidos.set(p.id, p); desenhar(); });
+fonte.addEventListener("estado", e => {
+  const m = JSON.parse(e.data);
+  if (m.estado === FINAL) pedidos.delete(m.id); else if (pedidos.has(m.id)) pedidos.get(m.id).estado = m.estado;
+  desenhar();
+});
+desenhar();
+</script></body></html>
+"""
+
+
+def _criar_tratador(canal):
+    pagina = (PAGINA_QUADRO.replace('__ESTADOS__', json.dumps(ESTADOS, ensure_ascii=False))
+              .replace('__FINAL__', ESTADO_FINAL).encode('utf-8'))
+
+    class Tratador(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _responder(self, codigo, corpo=b'', tipo='application/json'):
+            self.send_response(codigo)
+            self.send_header('Content-Type', tipo)
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def do_GET(self):
+            if self.path in ('/', '/index.html'):
+                self._responder(200, pagina, 'text/html; charset=utf-8')
+            elif self.path == '/eventos':
+                self._transmitir()
+            else:
+                self._responder(404)
+
+        def do_POST(self):
+            partes = self.path.strip('/').split('/')
+            if len(partes) != 3 or partes[0] != 'pedidos' or partes[2] != 'estado':
+                self._responder(404)
+                return
+            try:
+                corpo = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if not isinstance(corpo, dict):
+                    raise ValueError("O corpo tem de ser um objeto JSON")
+                encontrado = canal.mudar_estado(int(partes[1]), corpo.get('estado'))
+            except (ValueError, TypeError):
+                self._responder(400)
+                return
+            self._responder(200 if encontrado else 404, b'{}')
+
+        def _transmitir(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'keep-alive')
+            self.end_headers()
+            fila, atuais = canal.assinar()
+            try:
+                self._enviar('inicial', atuais)
+                while True:
+                    try:
+                        evento, dados = fila.get(timeout=INTERVALO_BATIMENTO)
+                        self._enviar(evento, dados)
+                    except queue.Empty:
+                        self.wfile.write(b": batimento\n\n")  # Mantém a ligação aberta em proxies e routers
+                        self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError, OSError):
+                pass  # O ecrã desligou-se
+            finally:
+                canal.cancelar(fila)
+
+        def _enviar(self, evento, dados):
+            self.wfile.write(f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        def log_message(self, formato, *args):
+            pass
+
+    return Tratador
+
+
+_canal = CanalPedidos()
+_servidor = None
+_servidor_lock = threading.Lock()
+
+
+def obter_canal():
+    """Canal partilhado por todas as sessões do processo."""
+    return _canal
+
+
+def iniciar_servidor(porta=PORTA_PADRAO):
+    """Inicia (uma única vez por processo) o servidor do quadro. Devolve a porta ou None se não foi possível."""
+    global _servidor
+    with _servidor_lock:
+        if _servidor is None:
+            try:
+                _servidor = ThreadingHTTPServer(('0.0.0.0', porta), _criar_tratador(_canal))
+            except OSError:
+                return None  # Porta ocupada (por exemplo, por outra instância)
+            _servidor.daemon_threads = True
+            threading.Thread(target=_servidor.serve_forever, name='cozinha', daemon=True).start()
+        return _servidor.server_address[1]
+
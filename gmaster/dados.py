@@ -0,0 +1,333 @@
+"""
+Funções de dados do GMaster sem dependência do Streamlit: leitura e gravação da base,
+geração de dados fictícios, análise, XML da NFC-e e exportações.
+
+Ficam aqui para poderem ser usadas tanto pela aplicação como pelo benchmark.
+"""
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from gmaster.metricas import cronometrado
+
+COLUNAS_PRODUTOS = ['Produto', 'Categoria', 'Preco_Venda', 'Custo_Unitario']
+COLUNAS_ESTOQUE = ['Produto', 'Quantidade_Estoque', 'Estoque_Minimo']
+COLUNAS_VENDAS = ['Data', 'Produto', 'Quantidade', 'CPF_Cliente']
+COLUNAS_COMPRAS = ['Data', 'Item', 'Valor', 'Fornecedor', 'Categoria_Despesa']
+
+PRODUTOS_EXEMPLO = [
+    {'Produto': 'Pizza Margherita', 'Categoria': 'Pizza Salgada', 'Preco_Venda': 55.00, 'Custo_Unitario': 15.50},
+    {'Produto': 'Pizza Pepperoni', 'Categoria': 'Pizza Salgada', 'Preco_Venda': 62.50, 'Custo_Unitario': 18.00},
+    {'Produto': 'Pizza Frango com Catupiry', 'Categoria': 'Pizza Salgada', 'Preco_Venda': 60.00, 'Custo_Unitario': 17.20},
+    {'Produto': 'Pizza Portuguesa', 'Categoria': 'Pizza Salgada', 'Preco_Venda': 65.00, 'Custo_Unitario': 19.50},
+    {'Produto': 'Pizza Quatro Queijos', 'Categoria': 'Pizza Salgada', 'Preco_Venda': 63.00, 'Custo_Unitario': 20.00},
+    {'Produto': 'Pizza de Chocolate', 'Categoria': 'Pizza Doce', 'Preco_Venda': 58.00, 'Custo_Unitario': 16.00},
+    {'Produto': 'Coca-Cola 2L', 'Categoria': 'Bebida', 'Preco_Venda': 12.00, 'Custo_Unitario': 6.50},
+    {'Produto': 'Guaraná Antarctica 2L', 'Categoria': 'Bebida', 'Preco_Venda': 11.00, 'Custo_Unitario': 6.00},
+    {'Produto': 'Água Mineral 500ml', 'Categoria': 'Bebida', 'Preco_Venda': 5.00, 'Custo_Unitario': 2.00},
+    {'Produto': 'Brownie de Chocolate', 'Categoria': 'Sobremesa', 'Preco_Venda': 15.00, 'Custo_Unitario': 7.00}
+]
+
+
+def _cpfs_ficticios(rng, quantidade):
+    """CPFs com dígitos verificadores corretos (aceites por normalizar_cpf): 9 dígitos ao acaso e os dois calculados."""
+    digitos = rng.integers(0, 10, size=(quantidade, 11))
+    repetidos = (digitos[:, :9] == digitos[:, :1]).all(axis=1)
+    digitos[repetidos, 8] = (digitos[repetidos, 0] + 1) % 10  # 111.111.111-11 e afins não são válidos
+    for posicao in (9, 10):
+        pesos = np.arange(posicao + 1, 1, -1)
+        digitos[:, posicao] = (digitos[:, :posicao] @ pesos) * 10 % 11 % 10
+    return np.array([''.join(map(str, linha)) for linha in digitos], dtype=object)
+
+
+def gerar_dados_ficticios(dias=90, vendas_por_dia=(5, 25), n_produtos=None, fracao_com_cpf=0.0, semente=None, hoje=None):
+    """
+    Gera as quatro tabelas da base com dados fictícios.
+
+    dias: tamanho do histórico de vendas; vendas_por_dia: (mínimo, máximo) de vendas por dia;
+    n_produtos: total de produtos no cardápio (os de exemplo mais produtos sintéticos);
+    fracao_com_cpf: proporção de vendas com CPF do cliente; semente: torna a geração reproduzível.
+    """
+    rng = np.random.default_rng(semente)
+    hoje = pd.Timestamp(hoje or datetime.now())
+
+    # 1. Produtos
+    produtos_data = list(PRODUTOS_EXEMPLO)
+    categorias = ['Pizza Salgada', 'Pizza Doce', 'Bebida', 'Sobremesa']
+    for i in range(len(produtos_data), n_produtos or 0):
+        preco = round(float(rng.uniform(8, 90)), 2)
+        produtos_data.append({
+            'Produto': f'Produto {i + 1:04d}',
+            'Categoria': categorias[int(rng.integers(len(categorias)))],
+            'Preco_Venda': preco,
+            'Custo_Unitario': round(preco * float(rng.uniform(0.25, 0.45)), 2),
+        })
+    df_produtos = pd.DataFrame(produtos_data[:n_produtos] if n_produtos else produtos_data)
+
+    # 2. Estoque
+    df_estoque = pd.DataFrame({
+        'Produto': df_produtos['Produto'],
+        'Quantidade_Estoque': rng.integers(50, 201, size=len(df_produtos)),
+        'Estoque_Minimo': 20,
+    })
+
+    # 3. Vendas (gerada de forma vetorizada para suportar anos de histórico)
+    vendas_dia = rng.integers(vendas_por_dia[0], vendas_por_dia[1] + 1, size=dias)
+    total_vendas = int(vendas_dia.sum())
+    dias_atras = np.repeat(np.arange(dias)[::-1], vendas_dia[::-1])
+    minutos = rng.integers(18 * 60, 23 * 60, size=total_vendas)
+    datas = hoje.normalize() - pd.to_timedelta(dias_atras, unit='D') + pd.to_timedelta(minutos, unit='min')
+    cpfs = np.full(total_vendas, '', dtype=object)
+    if fracao_com_cpf > 0:
+        # Um conjunto de clientes recorrentes, para que o mesmo CPF apareça em várias vendas
+        n_clientes = max(1, total_vendas // 20)
+        clientes = _cpfs_ficticios(rng, n_clientes)
+        com_cpf = rng.random(total_vendas) < fracao_com_cpf
+        cpfs[com_cpf] = clientes[rng.integers(n_clientes, size=int(com_cpf.sum()))]
+    df_vendas = pd.DataFrame({
+        'Data': datas,
+        'Produto': df_produtos['Produto'].to_numpy()[rng.integers(len(df_produtos), size=total_vendas)],
+        'Quantidade': rng.integers(1, 4, size=total_vendas),
+        'CPF_Cliente': cpfs,
+    }).sort_values('Data', kind='stable', ignore_index=True)
+    df_vendas.index.name = 'ID_Venda'
+
+    # 4. Compras (algumas despesas fictícias)
+    compras_data = [
+        {'Data': hoje - timedelta(days=30), 'Item': 'Compra de Farinha e Queijo', 'Valor': 1250.00, 'Fornecedor': 'Distribuidora Alimentos Bons', 'Categoria_Despesa': 'Mercadorias'},
+        {'Data': hoje - timedelta(days=5), 'Item': 'Pagamento de Aluguel', 'Valor': 3500.00, 'Fornecedor': 'Imobiliária Central', 'Categoria_Despesa': 'Aluguel'},
+        {'Data': hoje - timedelta(days=2), 'Item': 'Compra de Embalagens', 'Valor': 450.00, 'Fornecedor': 'EmbalaTudo', 'Categoria_Despesa': 'Mercadorias'},
+    ]
+    df_compras = pd.DataFrame(compras_data)
+
+    return {'produtos': df_produtos, 'estoque': df_estoque, 'vendas': df_vendas, 'compras': df_compras}
+
+
+def criar_db_ficticio(**parametros):
+    """
+    Cria uma base de dados fictícia (por padrão 3 meses de dados) e devolve o conteúdo do .xlsx.
+    Aceita os mesmos parâmetros de gerar_dados_ficticios.
+    """
+    dados = gerar_dados_ficticios(**parametros)
+    output = BytesIO()
+    escrever_base(output, dados['produtos'], dados['estoque'], dados['vendas'], dados['compras'])
+    return output.getvalue()
+
+
+def sincronizar_estoque(produtos_df, estoque):
+    """Mantém no estoque apenas os produtos do cardápio, acrescentando os novos com quantidade 0."""
+    produtos_atuais = pd.Series(produtos_df['Produto'].unique())
+    estoque_sincronizado = estoque[estoque['Produto'].isin(produtos_atuais)].copy()
+    # Bases anteriores aos alertas de estoque não têm a coluna do mínimo
+    if 'Estoque_Minimo' not in estoque_sincronizado.columns:
+        estoque_sincronizado['Estoque_Minimo'] = 0
+    estoque_sincronizado['Estoque_Minimo'] = pd.to_numeric(estoque_sincronizado['Estoque_Minimo'], errors='coerce').fillna(0)
+    # isin usa uma tabela de hash: O(n + m) em vez de procurar cada produto na coluna do estoque
+    novos_produtos = produtos_atuais[~produtos_atuais.isin(estoque_sincronizado['Produto'])].tolist()
+    if novos_produtos:
+        novos_estoque_df = pd.DataFrame({'Produto': novos_produtos, 'Quantidade_Estoque': [0]*len(novos_produtos), 'Estoque_Minimo': [0]*len(novos_produtos)})
+        estoque_sincronizado = pd.concat([estoque_sincronizado, novos_estoque_df], ignore_index=True)
+    return estoque_sincronizado
+
+
+def escrever_base(destino, produtos, estoque, vendas, compras):
+    """Escreve as quatro abas da base em `destino` (caminho ou buffer)."""
+    # O estoque já chega reconciliado com o cardápio (ver gmaster.alteracoes)
+    produtos_df = produtos.dropna(subset=['Produto'])
+    with pd.ExcelWriter(destino, engine='xlsxwriter') as writer:
+        produtos_df.to_excel(writer, index=False, sheet_name='Cardapio')
+        estoque.to_excel(writer, index=False, sheet_name='Estoque')
+        vendas.to_excel(writer, index=True, index_label='ID_Venda', sheet_name='Vendas')
+        compras.to_excel(writer, index=False, sheet_name='Compras')
+
+
+@cronometrado('salvar_base')
+def gravar_base(caminho, produtos, estoque, vendas, compras):
+    # Escreve direto no disco (sem um buffer com o livro inteiro) e só depois substitui a base
+    # Temporário com nome único na mesma pasta: duas gravações ao mesmo tempo não se misturam
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(caminho)), suffix='.xlsx')
+    os.close(descritor)
+    try:
+        escrever_base(temporario, produtos, estoque, vendas, compras)
+        os.replace(temporario, caminho)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+
+@cronometrado('carregar_base')
+def ler_base(caminho):
+    """Lê a base .xlsx e devolve um dicionário com as quatro tabelas (Vendas indexada por ID_Venda)."""
+    with open(caminho, 'rb') as f:
+        xls = pd.ExcelFile(f)
+        df_produtos = pd.read_excel(xls, 'Cardapio')
+        df_estoque = pd.read_excel(xls, 'Estoque')
+        df_vendas = pd.read_excel(xls, 'Vendas')
+        if 'Compras' in xls.sheet_names:
+            df_compras = pd.read_excel(xls, 'Compras')
+        else:
+            df_compras = pd.DataFrame(columns=COLUNAS_COMPRAS)
+    # O ID da venda é persistido para continuar estável depois do arquivamento
+    if 'ID_Venda' in df_vendas.columns:
+        df_vendas = df_vendas.set_index('ID_Venda')
+    df_vendas.index.name = 'ID_Venda'
+    return {'produtos': df_produtos, 'estoque': df_estoque, 'vendas': df_vendas, 'compras': df_compras}
+
+
+@cronometrado('preparar_dados_analise')
+def preparar_dados_analise(vendas_df, produtos_df):
+    if vendas_df.empty or produtos_df.empty:
+        return pd.DataFrame()
+    produtos_df_copy = produtos_df.copy()
+    vendas_df_copy = vendas_df.copy()
+    produtos_df_copy['Preco_Venda'] = pd.to_numeric(produtos_df_copy['Preco_Venda'], errors='coerce').fillna(0)
+    produtos_df_copy['Custo_Unitario'] = pd.to_numeric(produtos_df_copy['Custo_Unitario'], errors='coerce').fillna(0)
+    vendas_df_copy['Quantidade'] = pd.to_numeric(vendas_df_copy['Quantidade'], errors='coerce').fillna(0)
+    vendas_detalhadas = pd.merge(vendas_df_copy, produtos_df_copy, on='Produto', how='left')
+    vendas_validas = vendas_detalhadas[
+        (vendas_detalhadas['Preco_Venda'] > 0) &
+        (vendas_detalhadas['Custo_Unitario'] > 0)
+    ].copy()
+    if not vendas_validas.empty:
+        vendas_validas['Receita'] = vendas_validas['Quantidade'] * vendas_validas['Preco_Venda']
+        vendas_validas['Lucro'] = vendas_validas['Receita'] - (vendas_validas['Quantidade'] * vendas_validas['Custo_Unitario'])
+        vendas_validas['Data'] = pd.to_datetime(vendas_validas['Data'])
+        return vendas_validas
+    return pd.DataFrame()
+
+
+@cronometrado('agregar_dashboard')
+def agregar_dashboard(vendas_filtradas):
+    """KPIs e séries do Dashboard para um período já filtrado."""
+    if vendas_filtradas.empty:
+        return {'receita': 0.0, 'lucro': 0.0, 'itens': 0, 'top_produtos': pd.Series(dtype=float), 'receita_categoria': pd.Series(dtype=float)}
+    return {
+        'receita': vendas_filtradas['Receita'].sum(),
+        'lucro': vendas_filtradas['Lucro'].sum(),
+        'itens': int(vendas_filtradas['Quantidade'].sum()),
+        'top_produtos': vendas_filtradas.groupby('Produto')['Quantidade'].sum().nlargest(5).sort_values(ascending=True),
+        'receita_categoria': vendas_filtradas.groupby('Categoria')['Receita'].sum().sort_values(ascending=True),
+    }
+
+
+@cronometrado('gerar_xml_nfc')
+def gerar_xml_nfc(venda_info, produtos_info, config_empresa):
+    """
+    CORRIGIDO: Função de geração de XML com número de nota e data corrigidos.
+    """
+    nfe = ET.Element("NFe", xmlns="http://www.portalfiscal.inf.br/nfe")
+    infNFe = ET.SubElement(nfe, "infNFe", versao="4.00", Id=f"NFe{venda_info.name}") # Id é opcional mas bom ter
+
+    ide = ET.SubElement(infNFe, "ide")
+    ET.SubElement(ide, "cUF").text = "35"  # Exemplo: SP
+    ET.SubElement(ide, "natOp").text = "VENDA"
+    ET.SubElement(ide, "mod").text = "65"  # NFC-e
+    ET.SubElement(ide, "serie").text = "1"
+    # CORREÇÃO: Usar o índice da venda como número da nota fiscal. É único.
+    ET.SubElement(ide, "nNF").text = str(venda_info.name)
+    # CORREÇÃO: Formatar a data/hora com fuso horário padrão do Brasil (-03:00)
+    ET.SubElement(ide, "dhEmi").text = pd.to_datetime(venda_info['Data']).strftime('%Y-%m-%dT%H:%M:%S-03:00')
+    ET.SubElement(ide, "tpNF").text = "1" # 1 - Saída
+    ET.SubElement(ide, "idDest").text = "1" # 1 - Operação interna
+    ET.SubElement(ide, "tpImp").text = "4" # 4 - DANFE NFC-e
+    ET.SubElement(ide, "tpEmis").text = "1" # 1 - Emissão normal
+    ET.SubElement(ide, "finNFe").text = "1" # 1 - NFe normal
+    ET.SubElement(ide, "indFinal").text = "1" # 1 - Consumidor final
+    ET.SubElement(ide, "indPres").text = "1" # 1 - Operação presencial
+    ET.SubElement(ide, "procEmi").text = "0" # 0 - Emissão com aplicativo do contribuinte
+    ET.SubElement(ide, "verProc").text = "GMaster 1.0"
+
+
+    emit = ET.SubElement(infNFe, "emit")
+    ET.SubElement(emit, "CNPJ").text = config_empresa.get('cnpj', '').replace('.', '').replace('/', '').replace('-', '')
+    ET.SubElement(emit, "xNome").text = config_empresa.get('razao_social', '')
+
+    if 'CPF_Cliente' in venda_info and pd.notna(venda_info['CPF_Cliente']) and venda_info['CPF_Cliente']:
+        dest = ET.SubElement(infNFe, "dest")
+        ET.SubElement(dest, "CPF").text = str(venda_info['CPF_Cliente']).replace('.', '').replace('-', '')
+
+    total_nota = 0
+    for i, row in produtos_info.reset_index(drop=True).iterrows():
+        det = ET.SubElement(infNFe, "det", nItem=str(i + 1))
+        prod = ET.SubElement(det, "prod")
+        ET.SubElement(prod, "cProd").text = f"P{row.name}" # Usando o índice original do produto
+        ET.SubElement(prod, "xProd").text = row['Produto']
+        ET.SubElement(prod, "NCM").text = "21069090"  # Código genérico para alimentos
+        ET.SubElement(prod, "CFOP").text = "5102"
+        ET.SubElement(prod, "uCom").text = "UN"
+        ET.SubElement(prod, "qCom").text = f"{row['Quantidade']:.4f}"
+        # CORREÇÃO: Formatação explícita para 10 casas decimais como exige o padrão
+        ET.SubElement(prod, "vUnCom").text = f"{row['Preco_Venda']:.10f}"
+        vProd = row['Quantidade'] * row['Preco_Venda']
+        total_nota += vProd
+        ET.SubElement(prod, "vProd").text = f"{vProd:.2f}"
+        ET.SubElement(prod, "uTrib").text = "UN"
+        ET.SubElement(prod, "qTrib").text = f"{row['Quantidade']:.4f}"
+        ET.SubElement(prod, "vUnTrib").text = f"{row['Preco_Venda']:.10f}"
+        ET.SubElement(prod, "indTot").text = "1"
+
+    total = ET.SubElement(infNFe, "total")
+    ICMSTot = ET.SubElement(total, "ICMSTot")
+    ET.SubElement(ICMSTot, "vBC").text = "0.00"
+    ET.SubElement(ICMSTot, "vICMS").text = "0.00"
+    ET.SubElement(ICMSTot, "vProd").text = f"{total_nota:.2f}"
+    ET.SubElement(ICMSTot, "vNF").text = f"{total_nota:.2f}"
+
+    pag = ET.SubElement(infNFe, "pag")
+    detPag = ET.SubElement(pag, "detPag")
+    ET.SubElement(detPag, "tPag").text = "01"  # 01=Dinheiro
+    ET.SubElement(detPag, "vPag").text = f"{total_nota:.2f}"
+
+    from xml.dom import minidom  # Carregado apenas quando um XML é de facto gerado
+    xml_string = ET.tostring(nfe, 'utf-8')
+    dom = minidom.parseString(xml_string)
+    return dom.toprettyxml(indent="  ", encoding="utf-8")
+
+
+@cronometrado('exportar_mysql')
+def gerar_script_mysql(produtos, estoque, vendas):
+    sql_script = ""
+    sql_script += "DROP TABLE IF EXISTS `cardapio`;\n"
+    sql_script += "CREATE TABLE `cardapio` (`Produto` varchar(255) NOT NULL, `Categoria` varchar(255) DEFAULT NULL, `Preco_Venda` decimal(10,2) DEFAULT NULL, `Custo_Unitario` decimal(10,2) DEFAULT NULL, PRIMARY KEY (`Produto`)) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;\n\n"
+    if not produtos.empty:
+        for index, row in produtos.iterrows():
+            produto = str(row.get('Produto', '')).replace("'", "''")
+            categoria = str(row.get('Categoria', '')).replace("'", "''")
+            preco = row.get('Preco_Venda', 0)
+            custo = row.get('Custo_Unitario', 0)
+            linha_sql = f"INSERT INTO `cardapio` VALUES ('{produto}', '{categoria}', {preco}, {custo});\n"
+            sql_script += linha_sql
+    sql_script += "\nDROP TABLE IF EXISTS `estoque`;\n"
+    sql_script += "CREATE TABLE `estoque` (`Produto` varchar(255) NOT NULL, `Quantidade_Estoque` int(11) DEFAULT NULL, PRIMARY KEY (`Produto`)) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;\n\n"
+    if not estoque.empty:
+        for index, row in estoque.iterrows():
+            produto = str(row.get('Produto', '')).replace("'", "''")
+            qtde = row.get('Quantidade_Estoque', 0)
+            linha_sql = f"INSERT INTO `estoque` VALUES ('{produto}', {qtde});\n"
+            sql_script += linha_sql
+    sql_script += "\nDROP TABLE IF EXISTS `vendas`;\n"
+    sql_script += "CREATE TABLE `vendas` (`id` int(11) NOT NULL AUTO_INCREMENT, `Data` datetime DEFAULT NULL, `Produto` varchar(255) DEFAULT NULL, `Quantidade` int(11) DEFAULT NULL, `CPF_Cliente` varchar(20) DEFAULT NULL, PRIMARY KEY (`id`)) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;\n\n"
+    if not vendas.empty:
+        for index, row in vendas.iterrows():
+            data = pd.to_datetime(row.get('Data')).strftime('%Y-%m-%d %H:%M:%S')
+            produto = str(row.get('Produto', '')).replace("'", "''")
+            qtde = row.get('Quantidade', 0)
+            cpf = str(row.get('CPF_Cliente', '')).replace("'", "''")
+            linha_sql = f"INSERT INTO `vendas` (`Data`, `Produto`, `Quantidade`, `CPF_Cliente`) VALUES ('{data}', '{produto}', {qtde}, '{cpf}');\n"
+            sql_script += linha_sql
+    return sql_script.encode('utf-8')
+
+
+@cronometrado('exportar_csv_powerbi')
+def gerar_csv_powerbi(vendas_df, produtos_df):
+    try:
+        dados_combinados = pd.merge(vendas_df.reset_index(), produtos_df, on='Produto', how='left')
+        return dados_combinados.to_csv(index=False).encode('utf-8')
+    except Exception:
+        return "".encode('utf-8')
@@ -0,0 +1,204 @@
+"""
+Armazém de documentos fiscais (XMLs de NFC-e) endereçado por conteúdo.
+
+Cada XML gerado é guardado uma única vez em `documentos_fiscais/xml/<sha256>.xml`. O índice
+`indice.json` liga o ID da venda ao hash dos dados que originaram o XML, ao hash do próprio
+XML, à data da venda e a um estado ('gerado', 'exportado').
+
+Um documento emitido é imutável: volta a ser servido tal como foi gerado, mesmo que o cardápio
+mude depois. Uma nova versão só é criada explicitamente (`nova_versao`), nunca para documentos
+já exportados, e a versão anterior fica no histórico da entrada.
+
+O armazém é partilhado pelas sessões do processo (`obter_armazem`); ao gravar, o índice em disco
+é relido e juntado ao da memória, para não perder entradas escritas por outro processo.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+
+from gmaster.metricas import contar
+
+ESTADO_GERADO = 'gerado'
+ESTADO_EXPORTADO = 'exportado'
+
+
+def hash_dados_venda(venda_info, produtos_info, config_empresa):
+    """Hash de tudo o que entra no XML: se não mudar, o XML também não muda."""
+    itens = [
+        [str(row['Produto']), float(row['Quantidade']), float(row['Preco_Venda'])]
+        for _, row in produtos_info.iterrows()
+    ]
+    cpf = venda_info.get('CPF_Cliente', '')
+    dados = [
+        str(venda_info.name),
+        pd.to_datetime(venda_info['Data']).isoformat(),
+        '' if pd.isna(cpf) else str(cpf),
+        itens,
+        config_empresa.get('cnpj', ''),
+        config_empresa.get('razao_social', ''),
+    ]
+    return hashlib.sha256(json.dumps(dados, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class ArmazemFiscal:
+
+    def __init__(self, pasta):
+        self.pasta = pasta
+        self.pasta_xml = os.path.join(pasta, "xml")
+        self.caminho_indice = os.path.join(pasta, "indice.json")
+        self.documentos = {}
+        self.por_data = {}
+        self._alterado = False
+        self._lock = threading.RLock()
+        self.documentos = self._ler_indice()
+        for venda_id, doc in self.documentos.items():
+            self.por_data.setdefault(doc['data'], set()).add(venda_id)
+
+    def _ler_indice(self):
+        if not os.path.exists(self.caminho_indice):
+            return {}
+        with open(self.caminho_indice, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _caminho_xml(self, hash_xml):
+        return os.path.join(self.pasta_xml, f"{hash_xml}.xml")
+
+    def ler_xml(self, venda_id):
+        doc = self.documentos.get(str(venda_id))
+        if doc is None:
+            return None
+        with open(self._caminho_xml(doc['hash_xml']), "rb") as f:
+            return f.read()
+
+    def tem_documento(self, venda_id):
+        doc = self.documentos.get(str(venda_id))
+        return doc is not None and os.path.exists(self._caminho_xml(doc['hash_xml']))
+
+    def obter_ou_gerar(self, venda_info, produtos_info, config_empresa, gerar):
+        """Devolve o XML já emitido da venda; `gerar` só é chamado se a venda ainda não tem documento."""
+        with self._lock:
+            if self.tem_documento(venda_info.name):
+                contar('xml_servido_do_armazem')
+                return self.ler_xml(venda_info.name)
+            return self._emitir(venda_info, produtos_info, config_empresa, gerar)
+
+    def desatualizado(self, venda_info, produtos_info, config_empresa):
+        """True se o documento emitido foi gerado com dados diferentes dos atuais (ex.: preço alterado)."""
+        doc = self.documentos.get(str(venda_info.name))
+        return doc is not None and doc['hash_dados'] != hash_dados_venda(venda_info, produtos_info, config_empresa)
+
+    def nova_versao(self, venda_info, produtos_info, config_empresa, gerar):
+        """Emite uma nova versão com os dados atuais, guardando a anterior no histórico da entrada."""
+        with self._lock:
+            doc = self.documentos.get(str(venda_info.name))
+            if doc is not None and doc['estado'] == ESTADO_EXPORTADO:
+                raise ValueError(f"O documento da venda {venda_info.name} já foi exportado e não pode ser alterado.")
+            return self._emitir(venda_info, produtos_info, config_empresa, gerar)
+
+    def _emitir(self, venda_info, produtos_info, config_empresa, gerar):
+        venda_id = str(venda_info.name)
+        xml_data = gerar(venda_info, produtos_info, config_empresa)
+        hash_xml = hashlib.sha256(xml_data).hexdigest()
+        caminho = self._caminho_xml(hash_xml)
+        if not os.path.exists(caminho):
+            os.makedirs(self.pasta_xml, exist_ok=True)
+            descritor, temporario = tempfile.mkstemp(dir=self.pasta_xml, suffix='.tmp')
+            with os.fdopen(descritor, "wb") as f:
+                f.write(xml_data)
+            os.replace(temporario, caminho)
+        data = pd.to_datetime(venda_info['Data']).strftime('%Y-%m-%d')
+        anterior = self.documentos.get(venda_id)
+        historico = []
+        if anterior is not None:
+            if anterior['data'] != data:
+                self.por_data.get(anterior['data'], set()).discard(venda_id)
+            # Os XMLs anteriores continuam no armazém (endereçados pelo hash) e ficam referenciados aqui
+            historico = anterior.get('versoes_anteriores', []) + [{k: v for k, v in anterior.items() if k != 'versoes_anteriores'}]
+        self.documentos[venda_id] = {
+            'hash_dados': hash_dados_venda(venda_info, produtos_info, config_empresa),
+            'hash_xml': hash_xml,
+            'data': data,
+            'estado': ESTADO_GERADO,
+            'gerado_em': datetime.now().isoformat(timespec='seconds'),
+            'versao': len(historico) + 1,
+        }
+        if historico:
+            self.documentos[venda_id]['versoes_anteriores'] = historico
+        self.por_data.setdefault(data, set()).add(venda_id)
+        self._alterado = True
+        return xml_data
+
+    def ids_no_periodo(self, inicio, fim, estado=None):
+        """IDs das vendas com documento entre as datas (inclusivas), opcionalmente filtrados por estado."""
+        inicio, fim = str(pd.Timestamp(inicio).date()), str(pd.Timestamp(fim).date())
+        ids = []
+        with self._lock:
+            for data in sorted(d for d in self.por_data if inicio <= d <= fim):
+                for venda_id in sorted(self.por_data[data], key=int):
+                    if estado is None or self.documentos[venda_id]['estado'] == estado:
+                        ids.append(venda_id)
+        return ids
+
+    def zip_de(self, ids):
+        """Zip com os XMLs indicados, lidos diretamente do armazém."""
+        import zipfile  # Só é preciso nas exportações em lote
+        zip_buffer = BytesIO()
+        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED, False) as zip_file:
+            for venda_id in ids:
+                with self._lock:
+                    doc = self.documentos[venda_id]
+                zip_file.write(self._caminho_xml(doc['hash_xml']), f"nfce_{venda_id}.xml")
+        return zip_buffer.getvalue()
+
+    def marcar(self, ids, estado):
+        with self._lock:
+            for venda_id in ids:
+                self.documentos[str(venda_id)]['estado'] = estado
+            self._alterado = True
+
+    def _juntar(self, em_disco):
+        """Junta as entradas gravadas por outro processo: fica a versão mais recente de cada venda."""
+        for venda_id, doc in em_disco.items():
+            atual = self.documentos.get(venda_id)
+            if atual is not None:
+                ordem_atual = (atual.get('versao', 1), atual['estado'] == ESTADO_EXPORTADO)
+                if ordem_atual >= (doc.get('versao', 1), doc['estado'] == ESTADO_EXPORTADO):
+                    continue
+                self.por_data.get(atual['data'], set()).discard(venda_id)
+            self.documentos[venda_id] = doc
+            self.por_data.setdefault(doc['data'], set()).add(venda_id)
+
+    def salvar(self):
+        with self._lock:
+            if not self._alterado:
+                return
+            os.makedirs(self.pasta, exist_ok=True)
+            self._juntar(self._ler_indice())
+            descritor, temporario = tempfile.mkstemp(dir=self.pasta, suffix='.tmp')
+            try:
+                with os.fdopen(descritor, "w", encoding="utf-8") as f:
+                    json.dump(self.documentos, f, separators=(',', ':'))
+                os.replace(temporario, self.caminho_indice)
+            except BaseException:
+                if os.path.exists(temporario):
+                    os.remove(temporario)
+                raise
+            self._alterado = False
+
+
+_armazens = {}
+_armazens_lock = threading.Lock()
+
+
+def obter_armazem(pasta):
+    """Armazém partilhado pelas sessões do processo (um por pasta)."""
+    with _armazens_lock:
+        if pasta not in _armazens:
+            _armazens[pasta] = ArmazemFiscal(pasta)
+        return _armazens[pasta]
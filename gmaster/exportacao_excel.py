@@ -0,0 +1,153 @@
+"""
+Exportações .xlsx de períodos grandes para a contabilidade, com memória constante.
+
+O livro é escrito pelo xlsxwriter em modo `constant_memory`: cada linha vai para o disco assim
+que é escrita, e as vendas chegam em blocos (partições arquivadas lidas aos pedaços e depois o
+conjunto quente), por isso a memória usada não cresce com o histórico. O ficheiro é montado num
+temporário e só substitui o destino quando está completo.
+
+Abas: Vendas, Documentos Fiscais (se houver armazém), Compras e Resumo.
+"""
+import os
+import tempfile
+from datetime import datetime
+
+import pandas as pd
+import xlsxwriter
+
+from gmaster import arquivo_vendas
+from gmaster.metricas import cronometrado, contar
+
+TAMANHO_BLOCO = 20000
+# Uma linha da folha fica para o cabeçalho
+MAX_LINHAS_FOLHA = 1048575
+
+COLUNAS_VENDAS = ['ID_Venda', 'Data', 'Produto', 'Categoria', 'Quantidade', 'Preco_Venda', 'Receita', 'CPF_Cliente']
+COLUNAS_DOCUMENTOS = ['ID_Venda', 'Data', 'Estado', 'Hash_XML', 'Gerado_Em']
+COLUNAS_COMPRAS = ['Data', 'Item', 'Valor', 'Fornecedor', 'Categoria_Despesa']
+
+
+def _linhas(df):
+    """Linhas do DataFrame com tipos nativos do Python, convertidos coluna a coluna (NaN/NaT ficam em branco)."""
+    colunas = [df[coluna].astype(object).where(df[coluna].notna(), None).tolist() for coluna in df.columns]
+    return zip(*colunas)
+
+
+def _escrever_folha(livro, nome, colunas, linhas, formatos):
+    """
+    Escreve as linhas por ordem (exigência do modo constant_memory). Se passar do limite de
+    linhas do Excel, continua numa folha nova ("Vendas (2)", ...). Devolve quantas linhas escreveu.
+    """
+    cabecalho = livro.add_format({'bold': True})
+    total, parte, folha, linha_folha = 0, 1, None, MAX_LINHAS_FOLHA
+    for linha in linhas:
+        if linha_folha >= MAX_LINHAS_FOLHA:
+            folha = livro.add_worksheet(nome if parte == 1 else f"{nome} ({parte})")
+            folha.write_row(0, 0, colunas, cabecalho)
+            for coluna, nome_coluna in enumerate(colunas):
+                folha.set_column(coluna, coluna, max(12, len(nome_coluna) + 2))
+            parte += 1
+            linha_folha = 0
+        linha_folha += 1
+        for coluna, valor in enumerate(linha):
+            folha.write(linha_folha, coluna, valor, formatos.get(colunas[coluna]))
+        total += 1
+    if folha is None:
+        folha = livro.add_worksheet(nome)
+        folha.write_row(0, 0, colunas, cabecalho)
+    return total
+
+
+def blocos_vendas(vendas_quentes, pasta_arquivo, inicio, fim, tamanho_bloco=TAMANHO_BLOCO):
+    """Vendas de [inicio, fim) em blocos: primeiro o arquivo, depois o conjunto quente."""
+    inicio, fim = pd.Timestamp(inicio), pd.Timestamp(fim)
+    datas = pd.to_datetime(vendas_quentes['Data'])
+    quentes = vendas_quentes[(datas >= inicio) & (datas < fim)]
+    if datas.empty or inicio < datas.min():
+        for bloco in arquivo_vendas.iterar_periodo(pasta_arquivo, inicio, fim, tamanho_bloco):
+            yield bloco[~bloco.index.isin(quentes.index)]
+    for posicao in range(0, len(quentes), tamanho_bloco):
+        yield quentes.iloc[posicao:posicao + tamanho_bloco]
+
+
+class _LinhasVendas:
+    """Gera as linhas da aba Vendas com preço e receita do cardápio, somando os totais do Resumo."""
+
+    def __init__(self, blocos, produtos_df):
+        cardapio = produtos_df.drop_duplicates('Produto').set_index('Produto')
+        self.precos = pd.to_numeric(cardapio['Preco_Venda'], errors='coerce')
+        self.categorias = cardapio['Categoria'] if 'Categoria' in cardapio.columns else pd.Series(dtype=object)
+        self.blocos = blocos
+        self.itens = 0.0
+        self.receita = 0.0
+
+    def __iter__(self):
+        for bloco in self.blocos:
+            quantidades = pd.to_numeric(bloco['Quantidade'], errors='coerce').fillna(0)
+            precos = bloco['Produto'].map(self.precos)
+            receitas = (quantidades * precos).round(2)
+            self.itens += quantidades.sum()
+            self.receita += receitas.sum()
+            yield from _linhas(pd.DataFrame({
+                'ID_Venda': bloco.index,
+                'Data': pd.to_datetime(bloco['Data']),
+                'Produto': bloco['Produto'],
+                'Categoria': bloco['Produto'].map(self.categorias),
+                'Quantidade': quantidades,
+                'Preco_Venda': precos,
+                'Receita': receitas,
+                'CPF_Cliente': bloco['CPF_Cliente'] if 'CPF_Cliente' in bloco.columns else None,
+            }, index=bloco.index))
+
+
+def _linhas_documentos(armazem, inicio, fim):
+    # Datas do índice fiscal são inclusivas: o último dia do período é o dia anterior a `fim`
+    for venda_id in armazem.ids_no_periodo(inicio, pd.Timestamp(fim) - pd.Timedelta(days=1)):
+        doc = armazem.documentos[venda_id]
+        yield int(venda_id), datetime.fromisoformat(doc['data']), doc['estado'], doc['hash_xml'], doc.get('gerado_em', '')
+
+
+@cronometrado('exportar_contabilidade')
+def exportar_contabilidade(caminho, inicio, fim, vendas_quentes, pasta_arquivo, produtos_df, compras_df,
+                           armazem=None, tamanho_bloco=TAMANHO_BLOCO):
+    """Escreve o livro do período [inicio, fim) em `caminho` e devolve o número de linhas por aba."""
+    inicio, fim = pd.Timestamp(inicio), pd.Timestamp(fim)
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(caminho)), suffix='.xlsx')
+    os.close(descritor)
+    livro = xlsxwriter.Workbook(temporario, {'constant_memory': True})
+    formatos = {
+        'Data': livro.add_format({'num_format': 'dd/mm/yyyy hh:mm'}),
+        'Preco_Venda': livro.add_format({'num_format': '#,##0.00'}),
+        'Receita': livro.add_format({'num_format': '#,##0.00'}),
+        'Valor': livro.add_format({'num_format': '#,##0.00'}),
+    }
+    try:
+        vendas = _LinhasVendas(blocos_vendas(vendas_quentes, pasta_arquivo, inicio, fim, tamanho_bloco), produtos_df)
+        linhas = {'Vendas': _escrever_folha(livro, 'Vendas', COLUNAS_VENDAS, vendas, formatos)}
+        if armazem is not None:
+            linhas['Documentos Fiscais'] = _escrever_folha(
+                livro, 'Documentos Fiscais', COLUNAS_DOCUMENTOS, _linhas_documentos(armazem, inicio, fim), formatos)
+        datas_compras = pd.to_datetime(compras_df['Data'], errors='coerce')
+        compras = compras_df[(datas_compras >= inicio) & (datas_compras < fim)].reindex(columns=COLUNAS_COMPRAS)
+        compras = compras.assign(Data=pd.to_datetime(compras['Data'], errors='coerce'))
+        linhas['Compras'] = _escrever_folha(livro, 'Compras', COLUNAS_COMPRAS, _linhas(compras), formatos)
+        total_compras = pd.to_numeric(compras['Valor'], errors='coerce').sum()
+        resumo = [
+            ("Período", f"{inicio:%d/%m/%Y} a {fim - pd.Timedelta(days=1):%d/%m/%Y}"),
+            ("Vendas (linhas)", linhas['Vendas']),
+            ("Itens vendidos", vendas.itens),
+            ("Receita (preços atuais do cardápio)", round(vendas.receita, 2)),
+            ("Compras e despesas", round(total_compras, 2)),
+            ("Gerado em", datetime.now().strftime('%d/%m/%Y %H:%M')),
+        ]
+        _escrever_folha(livro, 'Resumo', ['Indicador', 'Valor'], resumo, {})
+        livro.close()
+    except BaseException:
+        livro.close()
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    os.replace(temporario, caminho)
+    contar('exportacoes_excel_linhas', sum(linhas.values()))
+    return linhas
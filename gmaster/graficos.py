@@ -0,0 +1,73 @@
+"""
+Gráficos das abas de análise com cache e reamostragem.
+
+As figuras ficam guardadas por (versão dos dados, gráfico, filtro): enquanto nada for gravado,
+um rerun reaproveita o objeto já construído. A série de receita é agregada por dia, semana ou
+mês conforme a extensão do período, e séries longas passam para o modo WebGL do Plotly.
+"""
+from collections import OrderedDict
+
+import pandas as pd
+import plotly.express as px
+
+from gmaster.metricas import contar
+
+# Até ~3 meses por dia, até ~2 anos por semana, acima disso por mês
+DIAS_MAXIMO_DIARIO = 92
+DIAS_MAXIMO_SEMANAL = 731
+FREQUENCIAS = {'Dia': 'D', 'Semana': 'W-MON', 'Mês': 'MS'}
+LIMITE_MARCADORES = 120
+LIMITE_WEBGL = 1000
+
+
+def escolher_frequencia(inicio, fim):
+    """Nome da granularidade ('Dia', 'Semana' ou 'Mês') adequada ao período."""
+    dias = (pd.Timestamp(fim) - pd.Timestamp(inicio)).days
+    if dias <= DIAS_MAXIMO_DIARIO:
+        return 'Dia'
+    if dias <= DIAS_MAXIMO_SEMANAL:
+        return 'Semana'
+    return 'Mês'
+
+
+def serie_receita(vendas_detalhadas, granularidade):
+    """Receita somada por dia, semana (a começar à segunda) ou mês."""
+    if vendas_detalhadas.empty:
+        return pd.Series(dtype=float, name='Receita')
+    serie = vendas_detalhadas.set_index(pd.to_datetime(vendas_detalhadas['Data']))['Receita']
+    return serie.resample(FREQUENCIAS[granularidade], label='left', closed='left').sum()
+
+
+def figura_receita(vendas_detalhadas, granularidade):
+    serie = serie_receita(vendas_detalhadas, granularidade)
+    fig = px.line(
+        x=serie.index, y=serie.values, title=f"📈 Receita por {granularidade}",
+        markers=len(serie) <= LIMITE_MARCADORES,
+        render_mode='webgl' if len(serie) > LIMITE_WEBGL else 'svg',
+        labels={'x': 'Data', 'y': 'Receita (R$)'},
+    )
+    fig.update_layout(yaxis_range=[0, max(1, serie.max() if len(serie) else 1)])
+    return fig
+
+
+class CacheFiguras:
+    """Cache LRU de figuras Plotly; a versão dos dados faz parte da chave."""
+
+    def __init__(self, tamanho_maximo=32):
+        self.tamanho_maximo = tamanho_maximo
+        self._figuras = OrderedDict()
+
+    def obter(self, chave, construir):
+        """Devolve a figura da chave, chamando `construir()` apenas quando ainda não existe."""
+        if chave in self._figuras:
+            self._figuras.move_to_end(chave)
+            contar('figura_em_cache')
+            return self._figuras[chave]
+        figura = construir()
+        self._figuras[chave] = figura
+        if len(self._figuras) > self.tamanho_maximo:
+            self._figuras.popitem(last=False)
+        return figura
+
+    def limpar(self):
+        self._figuras.clear()
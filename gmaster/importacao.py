@@ -0,0 +1,249 @@
+"""
+Importação em lote de vendas exportadas por plataformas de delivery e pelo PDV antigo.
+
+O ficheiro (CSV ou Excel) é lido em blocos de tamanho fixo, as colunas são mapeadas para o
+esquema da aba Vendas, cada linha é validada contra o Cardápio e os pedidos já importados
+(pelo ID externo) são ignorados. Cada bloco é devolvido assim que fica pronto, com o seu
+ajuste de estoque por produto, para ser gravado e registado antes de o bloco seguinte ser lido:
+a memória não cresce com o ficheiro e uma falha a meio não perde os blocos já gravados.
+"""
+import sqlite3
+import unicodedata
+from contextlib import closing
+from datetime import date, datetime
+
+import pandas as pd
+
+from gmaster.metricas import medir
+
+TAMANHO_BLOCO = 5000
+# A base .xlsx é reescrita inteira a cada gravação: só se grava a cada tantos blocos (e no fim)
+BLOCOS_POR_GRAVACAO = 10
+
+# Nomes de coluna conhecidos (já normalizados) para cada campo da aba Vendas
+SINONIMOS_COLUNAS = {
+    'Data': ['data', 'data_pedido', 'data_venda', 'data_hora', 'date', 'order_date', 'created_at'],
+    'Produto': ['produto', 'item', 'nome_item', 'descricao', 'product', 'item_name'],
+    'Quantidade': ['quantidade', 'qtd', 'qtde', 'quantity', 'qty'],
+    'CPF_Cliente': ['cpf', 'cpf_cliente', 'documento', 'documento_cliente', 'customer_document'],
+    'ID_Externo': ['id_pedido', 'pedido', 'numero_pedido', 'n_pedido', 'order_id', 'id'],
+}
+CAMPOS_OBRIGATORIOS = ['Data', 'Produto', 'Quantidade']
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS pedidos_importados (
+    origem TEXT NOT NULL,
+    id_externo TEXT NOT NULL,
+    id_venda INTEGER,
+    importado_em TEXT,
+    PRIMARY KEY (origem, id_externo)
+);
+"""
+
+
+def normalizar_texto(texto):
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii')
+    return '_'.join(texto.strip().lower().replace('-', ' ').replace('.', ' ').split())
+
+
+def detectar_mapeamento(colunas):
+    """Sugere, para cada campo da aba Vendas, a coluna do ficheiro correspondente (ou None)."""
+    normalizadas = {normalizar_texto(c): c for c in colunas}
+    return {
+        campo: next((normalizadas[s] for s in sinonimos if s in normalizadas), None)
+        for campo, sinonimos in SINONIMOS_COLUNAS.items()
+    }
+
+
+def _celula(valor):
+    # Datas do Excel ficam como datas: convertê-las em texto ISO e reler com o dia primeiro trocaria dia e mês
+    if valor is None:
+        return ''
+    if isinstance(valor, (datetime, date)):
+        return valor
+    return str(valor)
+
+
+def _bloco_texto(linhas, cabecalho):
+    return pd.DataFrame([[_celula(v) for v in linha] for linha in linhas], columns=cabecalho, dtype=object)
+
+
+def ler_em_blocos(arquivo, nome_arquivo, tamanho_bloco=TAMANHO_BLOCO):
+    """Itera o ficheiro em DataFrames de até `tamanho_bloco` linhas, com os valores como texto (datas do Excel como datas)."""
+    if nome_arquivo.lower().endswith(('.xlsx', '.xlsm')):
+        from openpyxl import load_workbook  # Modo só-leitura: as linhas são lidas sob demanda
+        livro = load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            linhas = livro.worksheets[0].iter_rows(values_only=True)
+            cabecalho = [str(c) if c is not None else f"coluna_{i}" for i, c in enumerate(next(linhas, []))]
+            bloco = []
+            for linha in linhas:
+                bloco.append(linha)
+                if len(bloco) >= tamanho_bloco:
+                    yield _bloco_texto(bloco, cabecalho)
+                    bloco = []
+            if bloco:
+                yield _bloco_texto(bloco, cabecalho)
+        finally:
+            livro.close()
+    else:
+        yield from pd.read_csv(arquivo, sep=None, engine='python', dtype=str, chunksize=tamanho_bloco,
+                               encoding='utf-8-sig', keep_default_na=False)
+
+
+def ler_cabecalho(arquivo, nome_arquivo):
+    """Colunas do ficheiro, lendo apenas o primeiro bloco pequeno."""
+    colunas = next(ler_em_blocos(arquivo, nome_arquivo, tamanho_bloco=5), pd.DataFrame()).columns.tolist()
+    if hasattr(arquivo, 'seek'):
+        arquivo.seek(0)
+    return colunas
+
+
+_INICIO_ISO = r'^\d{4}-\d{1,2}-\d{1,2}'
+
+
+def _datas_linha_a_linha(textos, opcoes):
+    valores = {}
+    for indice, texto in textos.items():
+        try:
+            valores[indice] = pd.Timestamp(pd.to_datetime(texto, **opcoes))
+        except (ValueError, OverflowError):
+            valores[indice] = pd.NaT
+    com_fuso = [i for i, v in valores.items() if not pd.isna(v) and v.tzinfo is not None]
+    ha_sem_fuso = any(not pd.isna(v) and v.tzinfo is None for v in valores.values())
+    for indice in com_fuso:
+        # Com horas sem fuso no mesmo bloco não se sabe a que fuso estas se referem: a linha é rejeitada
+        valores[indice] = pd.NaT if ha_sem_fuso else valores[indice].tz_localize(None)
+    return pd.Series([valores[i] for i in textos.index], index=textos.index, dtype='datetime64[ns]')
+
+
+def _textos_para_datas(textos, **opcoes):
+    try:
+        datas = pd.to_datetime(textos, errors='coerce', **opcoes)
+    except ValueError:
+        # Fusos misturados (ex.: '...Z' e horas sem fuso) não têm conversão vetorizada
+        return _datas_linha_a_linha(textos, opcoes)
+    if datas.dt.tz is not None:
+        # Todas com o mesmo fuso: fica a hora local escrita no ficheiro, como no resto da aba Vendas
+        datas = datas.dt.tz_localize(None)
+    return datas
+
+
+def converter_datas(valores):
+    """
+    Converte a coluna de datas sem trocar dia e mês: datas do Excel são usadas como estão, textos
+    ISO (AAAA-MM-DD...) são lidos como ISO e só os restantes (ex.: 05/03/2024) com o dia primeiro.
+    """
+    datas = pd.Series(pd.NaT, index=valores.index, dtype='datetime64[ns]')
+    ja_datas = valores.map(lambda v: isinstance(v, (datetime, date)))
+    if ja_datas.any():
+        datas[ja_datas] = pd.to_datetime(valores[ja_datas].tolist())
+    textos = valores[~ja_datas].astype(str).str.strip()
+    textos = textos[textos != '']
+    iso = textos.str.match(_INICIO_ISO)
+    if iso.any():
+        datas[iso[iso].index] = _textos_para_datas(textos[iso], format='ISO8601')
+    if (~iso).any():
+        datas[iso[~iso].index] = _textos_para_datas(textos[~iso], dayfirst=True, format='mixed')
+    return datas
+
+
+class RegistroImportacoes:
+    """Registo persistente (SQLite) dos pedidos externos já importados, por origem."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        with closing(sqlite3.connect(caminho)) as conexao:
+            conexao.executescript(ESQUEMA)
+
+    def ja_importados(self, origem, ids_externos):
+        ids_externos = list(ids_externos)
+        encontrados = set()
+        with closing(sqlite3.connect(self.caminho)) as conexao:
+            # Consultas em grupos para não passar do limite de parâmetros do SQLite
+            for i in range(0, len(ids_externos), 500):
+                grupo = ids_externos[i:i + 500]
+                marcadores = ','.join('?' * len(grupo))
+                encontrados.update(linha[0] for linha in conexao.execute(
+                    f"SELECT id_externo FROM pedidos_importados WHERE origem = ? AND id_externo IN ({marcadores})",
+                    [origem] + grupo))
+        return encontrados
+
+    def registrar(self, origem, pares_id):
+        """Regista pares (id_externo, id_venda) numa única transação."""
+        agora = datetime.now().isoformat(timespec='seconds')
+        with closing(sqlite3.connect(self.caminho)) as conexao, conexao:
+            conexao.executemany(
+                "INSERT OR IGNORE INTO pedidos_importados VALUES (?, ?, ?, ?)",
+                ((origem, id_externo, int(id_venda), agora) for id_externo, id_venda in pares_id))
+
+
+def importar_vendas(blocos, mapeamento, produtos_df, registro, origem, proximo_id):
+    """
+    Processa os blocos um a um e, para cada um, devolve (gerador) um dicionário com:
+    'vendas' (DataFrame pronto para juntar à aba Vendas, indexado por ID_Venda),
+    'ids_externos' (pares id_externo/id_venda a registar depois de gravar as vendas),
+    'ajustes_estoque' (quantidade total por produto), 'lidas', 'duplicadas' e 'rejeitadas' (por motivo).
+    Os IDs externos de um bloco ainda não registado já são ignorados nos blocos seguintes, por isso
+    quem consome pode juntar vários blocos numa só gravação.
+    """
+    produtos_por_nome = {normalizar_texto(p): p for p in produtos_df['Produto'].dropna()}
+    # Um pedido pode ter várias linhas (itens) com o mesmo ID, até em blocos diferentes: só se ignora
+    # o que veio numa importação anterior, não o que já foi registado nesta
+    desta_importacao = set()
+
+    for bloco in blocos:
+        with medir('importar_vendas_bloco'):
+            resultado = _processar_bloco(bloco, mapeamento, produtos_por_nome, registro, origem, proximo_id, desta_importacao)
+        proximo_id += len(resultado['vendas'])
+        desta_importacao.update(id_externo for id_externo, _ in resultado['ids_externos'])
+        yield resultado
+
+
+def _processar_bloco(bloco, mapeamento, produtos_por_nome, registro, origem, proximo_id, desta_importacao):
+    dados = pd.DataFrame({campo: bloco[coluna] if coluna else '' for campo, coluna in mapeamento.items()}, index=bloco.index)
+
+    datas = converter_datas(dados['Data'])
+    quantidades = pd.to_numeric(dados['Quantidade'].astype(str).str.replace(',', '.', regex=False), errors='coerce')
+    produtos = dados['Produto'].map(lambda nome: produtos_por_nome.get(normalizar_texto(nome)))
+
+    motivos = pd.Series('', index=dados.index)
+    motivos[datas.isna()] = 'data inválida'
+    # Quantidades fracionárias (0,5 ou 1,7) seriam truncadas ao converter para inteiro
+    motivos[(motivos == '') & (~(quantidades > 0) | (quantidades % 1 != 0))] = 'quantidade inválida'
+    motivos[(motivos == '') & produtos.isna()] = 'produto fora do cardápio'
+    rejeitadas = {motivo: int(total) for motivo, total in motivos[motivos != ''].value_counts().items()}
+    validas = motivos == ''
+
+    duplicadas = 0
+    ids_externos = dados['ID_Externo'].astype(str).str.strip()
+    com_id = validas & (ids_externos != '')
+    if com_id.any():
+        ja_importados = registro.ja_importados(origem, set(ids_externos[com_id])) - desta_importacao
+        repetidos = com_id & ids_externos.isin(ja_importados)
+        duplicadas = int(repetidos.sum())
+        validas &= ~repetidos
+
+    vendas = pd.DataFrame({
+        'Data': datas[validas],
+        'Produto': produtos[validas],
+        'Quantidade': quantidades[validas].astype(int),
+        'CPF_Cliente': dados.loc[validas, 'CPF_Cliente'].astype(str).str.strip(),
+    })
+    vendas.index = pd.RangeIndex(proximo_id, proximo_id + len(vendas), name='ID_Venda')
+    return {
+        'vendas': vendas,
+        'ids_externos': [(id_externo, id_venda) for id_externo, id_venda in zip(ids_externos[validas], vendas.index) if id_externo],
+        'ajustes_estoque': {produto: int(total) for produto, total in vendas.groupby('Produto')['Quantidade'].sum().items()},
+        'lidas': len(bloco),
+        'duplicadas': duplicadas,
+        'rejeitadas': rejeitadas,
+    }
+
+
+def aplicar_ajustes_estoque(estoque, ajustes):
+    """Abate do estoque a quantidade total importada de cada produto, numa única operação."""
+    estoque = estoque.copy()
+    baixa = estoque['Produto'].map(ajustes).fillna(0)
+    estoque['Quantidade_Estoque'] = pd.to_numeric(estoque['Quantidade_Estoque'], errors='coerce').fillna(0) - baixa
+    return estoque
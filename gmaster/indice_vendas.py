@@ -0,0 +1,112 @@
+"""
+Índice de vendas em SQLite para consultas paginadas (Emissão Fiscal).
+
+Guarda apenas o necessário para filtrar e listar: ID, data, produto, quantidade e o hash do
+cliente (o CPF em claro continua só na base). Os índices por data, produto e cliente fazem com
+que cada página seja lida sem percorrer o histórico inteiro.
+"""
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS vendas (
+    id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL,
+    produto TEXT,
+    quantidade REAL,
+    cliente TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_vendas_data ON vendas (data, id);
+CREATE INDEX IF NOT EXISTS idx_vendas_produto ON vendas (produto, data);
+CREATE INDEX IF NOT EXISTS idx_vendas_cliente ON vendas (cliente, data);
+"""
+
+
+class IndiceVendas:
+
+    def __init__(self, caminho, chave_cliente):
+        """`chave_cliente` converte um CPF no hash usado pelo índice de clientes (ou None)."""
+        self.caminho = caminho
+        self.chave_cliente = chave_cliente
+        with closing(self._conectar()) as conexao:
+            conexao.executescript(ESQUEMA)
+
+    def _conectar(self):
+        return sqlite3.connect(self.caminho)
+
+    def ultimo_id(self):
+        with closing(self._conectar()) as conexao:
+            valor = conexao.execute("SELECT MAX(id) FROM vendas").fetchone()[0]
+        return -1 if valor is None else int(valor)
+
+    def sincronizar(self, vendas_df):
+        """Indexa as vendas com ID maior que o último indexado. Devolve quantas foram inseridas."""
+        if vendas_df.empty:
+            return 0
+        novas = vendas_df[vendas_df.index > self.ultimo_id()]
+        if novas.empty:
+            return 0
+        cpfs = novas['CPF_Cliente'] if 'CPF_Cliente' in novas.columns else pd.Series(None, index=novas.index)
+        linhas = zip(
+            (int(i) for i in novas.index),
+            pd.to_datetime(novas['Data']).dt.strftime('%Y-%m-%d %H:%M:%S'),
+            novas['Produto'].astype(str),
+            pd.to_numeric(novas['Quantidade'], errors='coerce').fillna(0).astype(float),
+            (self.chave_cliente(cpf) for cpf in cpfs),
+        )
+        with closing(self._conectar()) as conexao, conexao:
+            conexao.executemany("INSERT OR REPLACE INTO vendas VALUES (?, ?, ?, ?, ?)", linhas)
+        return len(novas)
+
+    def _filtros(self, inicio=None, fim=None, produto=None, cpf=None, venda_id=None):
+        condicoes, parametros = [], []
+        if venda_id is not None:
+            condicoes.append("id = ?")
+            parametros.append(int(venda_id))
+        if inicio is not None:
+            condicoes.append("data >= ?")
+            parametros.append(pd.Timestamp(inicio).strftime('%Y-%m-%d %H:%M:%S'))
+        if fim is not None:
+            condicoes.append("data < ?")
+            parametros.append(pd.Timestamp(fim).strftime('%Y-%m-%d %H:%M:%S'))
+        if produto:
+            condicoes.append("produto = ?")
+            parametros.append(produto)
+        if cpf:
+            condicoes.append("cliente = ?")
+            parametros.append(self.chave_cliente(cpf) or '')
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        return where, parametros
+
+    def contar(self, **filtros):
+        where, parametros = self._filtros(**filtros)
+        with closing(self._conectar()) as conexao:
+            return int(conexao.execute(f"SELECT COUNT(*) FROM vendas {where}", parametros).fetchone()[0])
+
+    def buscar(self, pagina=1, por_pagina=20, **filtros):
+        """
+        Devolve o DataFrame de uma página de vendas, das mais recentes para as mais antigas.
+        Filtros: inicio, fim (datas), produto, cpf, venda_id.
+        """
+        where, parametros = self._filtros(**filtros)
+        deslocamento = max(0, (int(pagina) - 1) * int(por_pagina))
+        with closing(self._conectar()) as conexao:
+            pagina_df = pd.read_sql_query(
+                f"SELECT id AS ID_Venda, data AS Data, produto AS Produto, quantidade AS Quantidade "
+                f"FROM vendas {where} ORDER BY data DESC, id DESC LIMIT ? OFFSET ?",
+                conexao, params=parametros + [int(por_pagina), deslocamento],
+            )
+        pagina_df['Data'] = pd.to_datetime(pagina_df['Data'])
+        return pagina_df.set_index('ID_Venda')
+
+    def data_da_venda(self, venda_id):
+        with closing(self._conectar()) as conexao:
+            linha = conexao.execute("SELECT data FROM vendas WHERE id = ?", (int(venda_id),)).fetchone()
+        return pd.Timestamp(linha[0]) if linha else None
+
+    def reconstruir(self):
+        """Apaga o índice (usado quando a base de vendas é substituída)."""
+        with closing(self._conectar()) as conexao, conexao:
+            conexao.execute("DELETE FROM vendas")
@@ -0,0 +1,150 @@
+"""
+Modo multi-loja: cada loja tem a sua pasta de dados (pizzaria_db.xlsx, config_empresa.json e
+arquivo_vendas/) e a Central de Desempenho consolida todas.
+
+As lojas estão listadas em `lojas.json`, na pasta de dados principal:
+
+    {"lojas": [{"nome": "Centro", "pasta": "lojas/centro"}, {"nome": "Praia", "pasta": "/dados/praia"}]}
+
+Cada loja é agregada num processo separado, que devolve apenas os totais por dia, categoria,
+produto e loja. A consolidação soma esses totais; as vendas em bruto nunca saem do trabalhador.
+Os totais de uma loja ficam em cache enquanto os ficheiros dela não mudarem.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from gmaster import arquivo_vendas
+from gmaster.dados import ler_base, preparar_dados_analise
+from gmaster.metricas import cronometrado, contar
+
+ARQUIVO_LOJAS = "lojas.json"
+NOME_BASE = "pizzaria_db.xlsx"
+PASTA_ARQUIVO = "arquivo_vendas"
+
+_executor = None
+_trabalhadores = 0
+_executor_lock = threading.Lock()
+_cache_totais = {}
+LIMITE_CACHE = 128
+
+
+def carregar_lojas(pasta_principal, nome_local="Esta loja"):
+    """
+    Lista de lojas ({'nome', 'pasta'} com caminho absoluto) ou [] se o modo multi-loja não está ativo.
+    A loja da pasta principal entra sempre na lista.
+    """
+    caminho = os.path.join(pasta_principal, ARQUIVO_LOJAS)
+    if not os.path.exists(caminho):
+        return []
+    with open(caminho, "r", encoding="utf-8") as f:
+        configuradas = json.load(f).get('lojas', [])
+    lojas = [{'nome': loja['nome'], 'pasta': os.path.normpath(os.path.join(pasta_principal, loja['pasta']))}
+             for loja in configuradas]
+    if os.path.normpath(pasta_principal) not in {loja['pasta'] for loja in lojas}:
+        lojas.insert(0, {'nome': nome_local, 'pasta': os.path.normpath(pasta_principal)})
+    return lojas
+
+
+def _assinatura_loja(pasta):
+    """Datas de modificação dos ficheiros de dados da loja: se não mudarem, os totais também não."""
+    ficheiros = [os.path.join(pasta, NOME_BASE), os.path.join(pasta, PASTA_ARQUIVO, "manifesto.json")]
+    return tuple(os.path.getmtime(f) if os.path.exists(f) else None for f in ficheiros)
+
+
+def agregar_loja(pasta, inicio, fim):
+    """Totais de uma loja no período [inicio, fim). Corre no processo trabalhador."""
+    base = ler_base(os.path.join(pasta, NOME_BASE))
+    vendas = arquivo_vendas.vendas_do_periodo(base['vendas'], os.path.join(pasta, PASTA_ARQUIVO), inicio, fim)
+    detalhadas = preparar_dados_analise(vendas, base['produtos'])
+    if detalhadas.empty:
+        return {
+            'diaria': pd.DataFrame(columns=['Data', 'Receita', 'Lucro']),
+            'categoria': pd.DataFrame(columns=['Categoria', 'Receita']),
+            'produto': pd.DataFrame(columns=['Produto', 'Quantidade', 'Receita', 'Lucro']),
+            'totais': {'Receita': 0.0, 'Lucro': 0.0, 'Itens': 0},
+        }
+    return {
+        'diaria': detalhadas.groupby(detalhadas['Data'].dt.normalize())[['Receita', 'Lucro']].sum().reset_index(),
+        'categoria': detalhadas.groupby('Categoria')['Receita'].sum().reset_index(),
+        'produto': detalhadas.groupby('Produto')[['Quantidade', 'Receita', 'Lucro']].sum().reset_index(),
+        'totais': {
+            'Receita': float(detalhadas['Receita'].sum()),
+            'Lucro': float(detalhadas['Lucro'].sum()),
+            'Itens': int(detalhadas['Quantidade'].sum()),
+        },
+    }
+
+
+def _obter_executor(trabalhadores):
+    """Pool de processos mantido entre reruns, para não pagar o arranque a cada consulta."""
+    global _executor, _trabalhadores
+    with _executor_lock:
+        if _executor is None or _trabalhadores < trabalhadores:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=trabalhadores)
+            _trabalhadores = trabalhadores
+        return _executor
+
+
+@cronometrado('consolidar_lojas')
+def consolidar(lojas, inicio, fim, max_processos=None):
+    """
+    Agrega as lojas em paralelo e junta os totais. Devolve um dicionário com 'por_loja',
+    'diaria', 'categoria', 'produto' (DataFrames já somados) e 'erros' ({nome: mensagem}).
+    """
+    inicio, fim = pd.Timestamp(inicio), pd.Timestamp(fim)
+    if len(_cache_totais) > LIMITE_CACHE:
+        _cache_totais.clear()
+    totais, erros, pendentes = {}, {}, {}
+    for loja in lojas:
+        chave = (loja['pasta'], _assinatura_loja(loja['pasta']), inicio, fim)
+        if chave in _cache_totais:
+            totais[loja['nome']] = _cache_totais[chave]
+            contar('loja_em_cache')
+        elif not os.path.exists(os.path.join(loja['pasta'], NOME_BASE)):
+            erros[loja['nome']] = f"Base não encontrada em {loja['pasta']}"
+        else:
+            pendentes[loja['nome']] = chave
+
+    if len(pendentes) == 1:
+        # Uma única loja a recalcular não compensa passar por outro processo
+        (nome, chave), = pendentes.items()
+        try:
+            totais[nome] = _cache_totais[chave] = agregar_loja(chave[0], inicio, fim)
+        except Exception as erro:
+            erros[nome] = str(erro)
+    elif pendentes:
+        trabalhadores = min(len(pendentes), max_processos or os.cpu_count() or 1)
+        executor = _obter_executor(trabalhadores)
+        tarefas = {nome: executor.submit(agregar_loja, chave[0], inicio, fim) for nome, chave in pendentes.items()}
+        for nome, tarefa in tarefas.items():
+            try:
+                totais[nome] = _cache_totais[pendentes[nome]] = tarefa.result()
+            except Exception as erro:
+                erros[nome] = str(erro)
+
+    return _juntar([loja['nome'] for loja in lojas if loja['nome'] in totais], totais, erros)
+
+
+def _juntar(nomes, totais, erros):
+    por_loja = pd.DataFrame([totais[nome]['totais'] for nome in nomes], index=pd.Index(nomes, name='Loja'),
+                            columns=['Receita', 'Lucro', 'Itens'])
+
+    def somar(parte, chave, colunas):
+        partes = [totais[nome][parte] for nome in nomes if not totais[nome][parte].empty]
+        if not partes:
+            return pd.DataFrame(columns=[chave] + colunas)
+        return pd.concat(partes, ignore_index=True).groupby(chave)[colunas].sum().reset_index()
+
+    return {
+        'por_loja': por_loja,
+        'diaria': somar('diaria', 'Data', ['Receita', 'Lucro']),
+        'categoria': somar('categoria', 'Categoria', ['Receita']),
+        'produto': somar('produto', 'Produto', ['Quantidade', 'Receita', 'Lucro']),
+        'erros': erros,
+    }
@@ -0,0 +1,165 @@
+"""
+Instrumentação leve das operações críticas (carga, gravação, análise, XML, exportações).
+
+As medições ficam numa janela deslizante em memória, partilhada por todas as sessões do
+processo. Com a recolha desligada, `medir` e `cronometrado` custam apenas uma verificação
+de flag. A recolha liga-se com a variável de ambiente GMASTER_METRICAS=1 ou pela barra lateral.
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+TAMANHO_JANELA = 500
+
+_ativo = os.environ.get("GMASTER_METRICAS", "") == "1"
+_sem_medicao = nullcontext()
+
+
+class RegistroMetricas:
+    """Janela deslizante de durações (segundos) e contadores por operação."""
+
+    def __init__(self, tamanho_janela=TAMANHO_JANELA):
+        self.tamanho_janela = tamanho_janela
+        self._duracoes = {}
+        self._chamadas = {}
+        self._totais = {}
+        self._erros = {}
+        self._contadores = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, operacao, duracao, erro=False):
+        with self._lock:
+            janela = self._duracoes.get(operacao)
+            if janela is None:
+                janela = self._duracoes[operacao] = deque(maxlen=self.tamanho_janela)
+            janela.append(duracao)
+            self._chamadas[operacao] = self._chamadas.get(operacao, 0) + 1
+            # Soma de todas as chamadas (não só da janela), exigida pelo _sum do summary do Prometheus
+            self._totais[operacao] = self._totais.get(operacao, 0.0) + duracao
+            if erro:
+                self._erros[operacao] = self._erros.get(operacao, 0) + 1
+
+    def contar(self, nome, quantidade=1):
+        with self._lock:
+            self._contadores[nome] = self._contadores.get(nome, 0) + quantidade
+
+    def limpar(self):
+        with self._lock:
+            self._duracoes.clear()
+            self._chamadas.clear()
+            self._totais.clear()
+            self._erros.clear()
+            self._contadores.clear()
+
+    def resumo(self):
+        """Lista de dicionários com chamadas, erros, p50, p95 e máximo (em milissegundos) e total (em segundos) por operação."""
+        with self._lock:
+            copia = {operacao: sorted(janela) for operacao, janela in self._duracoes.items()}
+            chamadas = dict(self._chamadas)
+            totais = dict(self._totais)
+            erros = dict(self._erros)
+        linhas = []
+        for operacao, duracoes in sorted(copia.items()):
+            linhas.append({
+                'Operacao': operacao,
+                'Chamadas': chamadas.get(operacao, 0),
+                'Erros': erros.get(operacao, 0),
+                'p50_ms': round(_percentil(duracoes, 50) * 1000, 2),
+                'p95_ms': round(_percentil(duracoes, 95) * 1000, 2),
+                'Max_ms': round(duracoes[-1] * 1000, 2),
+                'Total_s': round(totais.get(operacao, 0.0), 6),
+            })
+        return linhas
+
+    def contadores(self):
+        with self._lock:
+            return dict(self._contadores)
+
+    def para_json(self):
+        return json.dumps({'operacoes': self.resumo(), 'contadores': self.contadores()}, indent=4, ensure_ascii=False)
+
+    def para_prometheus(self):
+        """Formato de exposição texto do Prometheus (summary com quantis 0.5 e 0.95)."""
+        linhas = [
+            "# HELP gmaster_operacao_segundos Duração das operações do GMaster.",
+            "# TYPE gmaster_operacao_segundos summary",
+        ]
+        for item in self.resumo():
+            rotulo = f'operacao="{item["Operacao"]}"'
+            linhas.append(f'gmaster_operacao_segundos{{{rotulo},quantile="0.5"}} {item["p50_ms"] / 1000:.6f}')
+            linhas.append(f'gmaster_operacao_segundos{{{rotulo},quantile="0.95"}} {item["p95_ms"] / 1000:.6f}')
+            linhas.append(f'gmaster_operacao_segundos_sum{{{rotulo}}} {item["Total_s"]:.6f}')
+            linhas.append(f'gmaster_operacao_segundos_count{{{rotulo}}} {item["Chamadas"]}')
+        linhas.append("# TYPE gmaster_operacao_erros_total counter")
+        for item in self.resumo():
+            linhas.append(f'gmaster_operacao_erros_total{{operacao="{item["Operacao"]}"}} {item["Erros"]}')
+        contadores = self.contadores()
+        if contadores:
+            linhas.append("# TYPE gmaster_eventos_total counter")
+            for nome, valor in sorted(contadores.items()):
+                linhas.append(f'gmaster_eventos_total{{evento="{nome}"}} {valor}')
+        return "\n".join(linhas) + "\n"
+
+
+def _percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    # Percentil pelo método do posto mais próximo
+    posicao = max(1, math.ceil(p / 100 * len(valores_ordenados)))
+    return valores_ordenados[posicao - 1]
+
+
+registro = RegistroMetricas()
+
+
+def ativo():
+    return _ativo
+
+
+def ativar(valor=True):
+    global _ativo
+    _ativo = bool(valor)
+
+
+@contextmanager
+def _medicao(operacao):
+    inicio = time.perf_counter()
+    erro = False
+    try:
+        yield
+    except Exception:
+        # st.rerun/st.stop usam BaseException e não contam como erro
+        erro = True
+        raise
+    finally:
+        registro.registrar(operacao, time.perf_counter() - inicio, erro)
+
+
+def medir(operacao):
+    """Context manager que regista a duração do bloco; não faz nada com a recolha desligada."""
+    if not _ativo:
+        return _sem_medicao
+    return _medicao(operacao)
+
+
+def cronometrado(operacao):
+    """Decorador equivalente a `medir` para funções inteiras."""
+    def decorador(funcao):
+        @wraps(funcao)
+        def envolvida(*args, **kwargs):
+            if not _ativo:
+                return funcao(*args, **kwargs)
+            with _medicao(operacao):
+                return funcao(*args, **kwargs)
+        return envolvida
+    return decorador
+
+
+def contar(nome, quantidade=1):
+    if _ativo:
+        registro.contar(nome, quantidade)
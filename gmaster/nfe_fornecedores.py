@@ -0,0 +1,197 @@
+"""
+Importação das NF-e (XML) enviadas pelos fornecedores para a aba Compras.
+
+Cada XML é lido em fluxo com `iterparse`: os elementos de cada item (`det`) são descartados
+logo depois de lidos, por isso a memória não cresce com o tamanho da nota nem com o número de
+notas. Aceita ficheiros XML soltos, ficheiros ZIP e pastas. As chaves de acesso já importadas
+ficam registadas em SQLite e são ignoradas nas importações seguintes.
+"""
+import os
+import sqlite3
+import zipfile
+from contextlib import closing
+from datetime import datetime
+from xml.etree.ElementTree import iterparse, ParseError
+
+import pandas as pd
+
+from gmaster.importacao import normalizar_texto
+from gmaster.metricas import cronometrado
+
+CATEGORIA_MERCADORIAS = 'Mercadorias'
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS nfe_importadas (
+    chave TEXT PRIMARY KEY,
+    fornecedor TEXT,
+    cnpj TEXT,
+    valor REAL,
+    importado_em TEXT
+);
+"""
+
+
+def _nome_local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _filhos(elemento):
+    return {_nome_local(filho.tag): (filho.text or '').strip() for filho in elemento}
+
+
+def _numero(texto):
+    try:
+        return float(texto)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def ler_nfe(arquivo):
+    """
+    Lê uma NF-e em fluxo e devolve um dicionário com chave, fornecedor, cnpj, data,
+    itens (produto, quantidade, valor) e total. Devolve None se o XML não for uma NF-e.
+    """
+    nota = {'chave': '', 'fornecedor': '', 'cnpj': '', 'data': None, 'itens': [], 'total': 0.0}
+    for evento, elemento in iterparse(arquivo, events=('start', 'end')):
+        nome = _nome_local(elemento.tag)
+        if evento == 'start':
+            if nome == 'infNFe' and not nota['chave']:
+                nota['chave'] = elemento.get('Id', '').removeprefix('NFe')
+            continue
+        if nome == 'prod':
+            dados = _filhos(elemento)
+            nota['itens'].append({
+                'produto': dados.get('xProd', ''),
+                'quantidade': _numero(dados.get('qCom')),
+                'valor': _numero(dados.get('vProd')),
+            })
+        elif nome == 'det':
+            elemento.clear()  # Itens já lidos não ficam na árvore
+        elif nome == 'emit':
+            dados = _filhos(elemento)
+            nota['fornecedor'] = dados.get('xFant') or dados.get('xNome', '')
+            nota['cnpj'] = dados.get('CNPJ') or dados.get('CPF', '')
+            elemento.clear()
+        elif nome == 'ide':
+            dados = _filhos(elemento)
+            nota['data'] = pd.to_datetime(dados.get('dhEmi') or dados.get('dEmi'), errors='coerce')
+            elemento.clear()
+        elif nome == 'ICMSTot':
+            nota['total'] = _numero(_filhos(elemento).get('vNF'))
+        elif nome == 'chNFe' and not nota['chave']:
+            nota['chave'] = (elemento.text or '').strip()
+    if not nota['chave'] or not nota['itens']:
+        return None
+    if pd.isna(nota['data']):
+        nota['data'] = None
+    else:
+        # Mantém a data local da emissão (dhEmi traz o fuso do emitente)
+        if nota['data'].tzinfo is not None:
+            nota['data'] = nota['data'].tz_localize(None)
+        nota['data'] = nota['data'].normalize()
+    return nota
+
+
+def iterar_xmls(fontes):
+    """
+    Percorre as fontes (caminhos de pastas, caminhos de ficheiros ou ficheiros abertos/enviados)
+    e produz pares (nome, ficheiro) para cada XML, sem extrair os ZIPs para o disco. Um ZIP que
+    não se consegue abrir produz (nome, None).
+    """
+    for fonte in fontes:
+        if isinstance(fonte, (str, os.PathLike)) and os.path.isdir(fonte):
+            for raiz, _, nomes in os.walk(fonte):
+                for nome in sorted(nomes):
+                    if nome.lower().endswith(('.xml', '.zip')):
+                        yield from iterar_xmls([os.path.join(raiz, nome)])
+            continue
+        nome = str(fonte) if isinstance(fonte, (str, os.PathLike)) else getattr(fonte, 'name', 'arquivo')
+        if nome.lower().endswith('.zip'):
+            try:
+                pacote = zipfile.ZipFile(fonte)
+            except zipfile.BadZipFile:
+                yield nome, None
+                continue
+            with pacote:
+                for membro in pacote.namelist():
+                    if membro.lower().endswith('.xml'):
+                        with pacote.open(membro) as arquivo:
+                            yield f"{nome}/{membro}", arquivo
+        elif isinstance(fonte, (str, os.PathLike)):
+            with open(fonte, 'rb') as arquivo:
+                yield nome, arquivo
+        else:
+            yield nome, fonte
+
+
+class RegistroNFe:
+    """Chaves de acesso das NF-e já importadas (partilha o ficheiro SQLite das importações de vendas)."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        with closing(sqlite3.connect(caminho)) as conexao:
+            conexao.executescript(ESQUEMA)
+
+    def ja_importada(self, chave):
+        with closing(sqlite3.connect(self.caminho)) as conexao:
+            return conexao.execute("SELECT 1 FROM nfe_importadas WHERE chave = ?", (chave,)).fetchone() is not None
+
+    def registrar(self, notas):
+        agora = datetime.now().isoformat(timespec='seconds')
+        with closing(sqlite3.connect(self.caminho)) as conexao, conexao:
+            conexao.executemany(
+                "INSERT OR IGNORE INTO nfe_importadas VALUES (?, ?, ?, ?, ?)",
+                ((n['chave'], n['fornecedor'], n['cnpj'], n['total'], agora) for n in notas))
+
+
+@cronometrado('importar_nfe')
+def importar_nfe(fontes, registro, estoque_df):
+    """
+    Lê as NF-e das fontes e devolve um dicionário com:
+    'compras' (linhas para a aba Compras, um item por linha e a diferença para o total da nota
+    como frete/impostos), 'notas' (resumo das notas novas, a registar depois de gravar a base),
+    'ajustes_estoque' (quantidade a somar por produto do Estoque), 'duplicadas' e 'invalidas' (nomes).
+    """
+    produtos_estoque = {normalizar_texto(p): p for p in estoque_df['Produto'].dropna()}
+    linhas = []
+    notas = []
+    ajustes = {}
+    chaves_lidas = set()
+    duplicadas = 0
+    invalidas = []
+
+    for nome, arquivo in iterar_xmls(fontes):
+        try:
+            nota = ler_nfe(arquivo) if arquivo is not None else None
+        except (ParseError, zipfile.BadZipFile):
+            nota = None
+        if nota is None:
+            invalidas.append(nome)
+            continue
+        if nota['chave'] in chaves_lidas or registro.ja_importada(nota['chave']):
+            duplicadas += 1
+            continue
+        chaves_lidas.add(nota['chave'])
+
+        data = nota['data'] or pd.Timestamp(datetime.now().date())
+        soma_itens = 0.0
+        for item in nota['itens']:
+            linhas.append({'Data': data, 'Item': item['produto'], 'Valor': round(item['valor'], 2),
+                           'Fornecedor': nota['fornecedor'], 'Categoria_Despesa': CATEGORIA_MERCADORIAS})
+            soma_itens += item['valor']
+            produto = produtos_estoque.get(normalizar_texto(item['produto']))
+            if produto is not None:
+                ajustes[produto] = ajustes.get(produto, 0) + item['quantidade']
+        diferenca = round(nota['total'] - soma_itens, 2) if nota['total'] else 0.0
+        if abs(diferenca) >= 0.01:
+            linhas.append({'Data': data, 'Item': f"Frete/impostos NF-e {nota['chave'][-9:]}", 'Valor': diferenca,
+                           'Fornecedor': nota['fornecedor'], 'Categoria_Despesa': CATEGORIA_MERCADORIAS})
+        notas.append({k: nota[k] for k in ('chave', 'fornecedor', 'cnpj', 'total')} | {'itens': len(nota['itens'])})
+
+    return {
+        'compras': pd.DataFrame(linhas, columns=['Data', 'Item', 'Valor', 'Fornecedor', 'Categoria_Despesa']),
+        'notas': notas,
+        'ajustes_estoque': ajustes,
+        'duplicadas': duplicadas,
+        'invalidas': invalidas,
+    }
@@ -0,0 +1,217 @@
+"""
+Relatórios mensais em PDF (vendas, resultado e estoque) gerados em segundo plano.
+
+O resumo do mês é agregado na aplicação (é pequeno e barato) e entregue a um trabalhador em
+thread, que apenas desenha o PDF com o FPDF. Os PDFs dos meses fechados ficam guardados em
+`relatorios/`, com a assinatura dos dados no nome: o mesmo mês só volta a ser gerado se as
+vendas ou compras desse mês mudarem.
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from gmaster.metricas import medir
+
+ESTADO_PRONTO = 'pronto'
+ESTADO_GERANDO = 'gerando'
+ESTADO_ERRO = 'erro'
+
+LIMITE_LINHAS_TABELA = 15
+
+_geradores = {}
+_geradores_lock = threading.Lock()
+
+
+def meses_fechados(data_inicial, hoje=None):
+    """Meses ('AAAA-MM') do início do histórico até ao mês anterior ao atual, do mais recente para o mais antigo."""
+    if data_inicial is None:
+        return []
+    mes_atual = pd.Timestamp(hoje or datetime.now()).to_period('M')
+    return [str(p) for p in reversed(pd.period_range(pd.Timestamp(data_inicial).to_period('M'), mes_atual - 1, freq='M'))]
+
+
+def limites_mes(mes):
+    inicio = pd.Period(mes, freq='M').start_time
+    return inicio, inicio + pd.offsets.MonthBegin(1)
+
+
+def resumir_mes(mes, vendas_detalhadas, compras, estoque):
+    """
+    Agrega o mês em estruturas simples (listas e números) para o PDF.
+    `vendas_detalhadas` é a saída de preparar_dados_analise já limitada ao mês.
+    """
+    inicio, fim = limites_mes(mes)
+    datas_compras = pd.to_datetime(compras['Data'], errors='coerce')
+    compras_mes = compras[(datas_compras >= inicio) & (datas_compras < fim)]
+    despesas = pd.to_numeric(compras_mes['Valor'], errors='coerce').fillna(0).groupby(
+        compras_mes['Categoria_Despesa'].fillna('Outros')).sum().sort_values(ascending=False)
+
+    if vendas_detalhadas.empty:
+        receita = lucro_bruto = 0.0
+        itens = 0
+        por_categoria, top_produtos, receita_diaria = [], [], []
+    else:
+        receita = float(vendas_detalhadas['Receita'].sum())
+        lucro_bruto = float(vendas_detalhadas['Lucro'].sum())
+        itens = int(vendas_detalhadas['Quantidade'].sum())
+        categorias = vendas_detalhadas.groupby('Categoria')[['Receita', 'Lucro']].sum().sort_values('Receita', ascending=False)
+        por_categoria = [[str(c), round(float(r), 2), round(float(l), 2)] for c, r, l in categorias.itertuples()]
+        produtos = vendas_detalhadas.groupby('Produto')[['Quantidade', 'Receita']].sum().nlargest(LIMITE_LINHAS_TABELA, 'Receita')
+        top_produtos = [[str(p), int(q), round(float(r), 2)] for p, q, r in produtos.itertuples()]
+        diaria = vendas_detalhadas.groupby(vendas_detalhadas['Data'].dt.date)['Receita'].sum()
+        receita_diaria = [[str(d), round(float(r), 2)] for d, r in diaria.items()]
+
+    total_despesas = float(despesas.sum())
+    resumo = {
+        'mes': mes,
+        'receita': round(receita, 2),
+        'custo_mercadorias': round(receita - lucro_bruto, 2),
+        'lucro_bruto': round(lucro_bruto, 2),
+        'itens': itens,
+        'despesas': [[str(c), round(float(v), 2)] for c, v in despesas.items()],
+        'total_despesas': round(total_despesas, 2),
+        'resultado': round(lucro_bruto - total_despesas, 2),
+        'por_categoria': por_categoria,
+        'top_produtos': top_produtos,
+        'receita_diaria': receita_diaria,
+    }
+    # O estoque é a posição no momento da geração e não entra na assinatura (não é do mês fechado)
+    resumo['assinatura'] = hashlib.sha256(json.dumps(resumo, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+    resumo['estoque'] = [[str(p), float(q)] for p, q in zip(estoque['Produto'], pd.to_numeric(estoque['Quantidade_Estoque'], errors='coerce').fillna(0))]
+    return resumo
+
+
+def _texto(valor):
+    # As fontes padrão do FPDF só cobrem latin-1
+    return str(valor).encode('latin-1', 'replace').decode('latin-1')
+
+
+def _tabela(pdf, cabecalho, linhas, larguras):
+    pdf.set_font('Helvetica', 'B', 9)
+    for titulo, largura in zip(cabecalho, larguras):
+        pdf.cell(largura, 7, _texto(titulo), border=1)
+    pdf.ln()
+    pdf.set_font('Helvetica', '', 9)
+    for linha in linhas:
+        for valor, largura in zip(linha, larguras):
+            if isinstance(valor, float):
+                valor = f"{valor:,.2f}"
+            pdf.cell(largura, 6, _texto(valor), border=1)
+        pdf.ln()
+    pdf.ln(4)
+
+
+def renderizar_pdf(resumo, config_empresa):
+    """Desenha o relatório do mês e devolve os bytes do PDF."""
+    from fpdf import FPDF  # Só é carregado pelo trabalhador, quando há um relatório a gerar
+
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font('Helvetica', 'B', 14)
+    pdf.cell(0, 8, _texto(config_empresa.get('nome_fantasia', 'GMaster')), ln=1)
+    pdf.set_font('Helvetica', '', 9)
+    pdf.cell(0, 5, _texto(f"{config_empresa.get('razao_social', '')} - CNPJ {config_empresa.get('cnpj', '')}"), ln=1)
+    pdf.cell(0, 5, _texto(f"{config_empresa.get('endereco', '')} - {config_empresa.get('cidade_uf', '')}"), ln=1)
+    pdf.ln(4)
+    pdf.set_font('Helvetica', 'B', 12)
+    pdf.cell(0, 8, _texto(f"Relatório Mensal - {resumo['mes']}"), ln=1)
+
+    pdf.set_font('Helvetica', 'B', 11)
+    pdf.cell(0, 7, _texto("1. Vendas"), ln=1)
+    _tabela(pdf, ["Indicador", "Valor"], [
+        ["Receita (R$)", resumo['receita']],
+        ["Itens vendidos", resumo['itens']],
+    ], [90, 50])
+    if resumo['por_categoria']:
+        _tabela(pdf, ["Categoria", "Receita (R$)", "Lucro Bruto (R$)"], resumo['por_categoria'], [70, 45, 45])
+    if resumo['top_produtos']:
+        _tabela(pdf, ["Produto", "Quantidade", "Receita (R$)"], resumo['top_produtos'], [90, 30, 40])
+
+    pdf.set_font('Helvetica', 'B', 11)
+    pdf.cell(0, 7, _texto("2. Resultado do Mês"), ln=1)
+    linhas_resultado = [
+        ["Receita de vendas", resumo['receita']],
+        ["(-) Custo das mercadorias vendidas", -resumo['custo_mercadorias']],
+        ["= Lucro bruto", resumo['lucro_bruto']],
+    ]
+    linhas_resultado += [[f"(-) {categoria}", -valor] for categoria, valor in resumo['despesas']]
+    linhas_resultado.append(["= Resultado", resumo['resultado']])
+    _tabela(pdf, ["Conta", "Valor (R$)"], linhas_resultado, [110, 50])
+
+    pdf.set_font('Helvetica', 'B', 11)
+    pdf.cell(0, 7, _texto("3. Estoque"), ln=1)
+    pdf.set_font('Helvetica', 'I', 8)
+    pdf.cell(0, 5, _texto(f"Posição na geração do relatório ({datetime.now():%d/%m/%Y %H:%M})"), ln=1)
+    _tabela(pdf, ["Produto", "Quantidade"], resumo['estoque'], [110, 50])
+
+    saida = pdf.output(dest='S')
+    # FPDF 1.x devolve str (latin-1); o fpdf2 devolve bytearray
+    return saida.encode('latin-1') if isinstance(saida, str) else bytes(saida)
+
+
+class GeradorRelatorios:
+    """Fila de geração em segundo plano; um único trabalhador para não disputar CPU com as vendas."""
+
+    def __init__(self, pasta):
+        self.pasta = pasta
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='relatorios')
+        self._pendentes = {}
+        self._lock = threading.Lock()
+
+    def caminho(self, resumo):
+        return os.path.join(self.pasta, f"relatorio_{resumo['mes']}_{resumo['assinatura']}.pdf")
+
+    def estado(self, resumo):
+        if os.path.exists(self.caminho(resumo)):
+            return ESTADO_PRONTO
+        with self._lock:
+            tarefa = self._pendentes.get(self.caminho(resumo))
+        if tarefa is None:
+            return None
+        if not tarefa.done():
+            return ESTADO_GERANDO
+        return ESTADO_ERRO if tarefa.exception() is not None else ESTADO_PRONTO
+
+    def erro(self, resumo):
+        with self._lock:
+            tarefa = self._pendentes.get(self.caminho(resumo))
+        return tarefa.exception() if tarefa is not None and tarefa.done() else None
+
+    def solicitar(self, resumo, config_empresa):
+        """Põe o relatório na fila, se ainda não existir nem estiver a ser gerado. Não bloqueia."""
+        caminho = self.caminho(resumo)
+        with self._lock:
+            tarefa = self._pendentes.get(caminho)
+            if os.path.exists(caminho) or (tarefa is not None and not tarefa.done()):
+                return
+            self._pendentes[caminho] = self._executor.submit(self._gerar, resumo, dict(config_empresa), caminho)
+
+    def ler(self, resumo):
+        with open(self.caminho(resumo), 'rb') as f:
+            return f.read()
+
+    def _gerar(self, resumo, config_empresa, caminho):
+        with medir('gerar_relatorio_pdf'):
+            conteudo = renderizar_pdf(resumo, config_empresa)
+        os.makedirs(self.pasta, exist_ok=True)
+        with open(caminho + '.tmp', 'wb') as f:
+            f.write(conteudo)
+        os.replace(caminho + '.tmp', caminho)
+        # Versões antigas do mesmo mês (dados entretanto alterados) deixam de ser servidas
+        for antigo in glob.glob(os.path.join(self.pasta, f"relatorio_{resumo['mes']}_*.pdf")):
+            if antigo != caminho:
+                os.remove(antigo)
+
+
+def obter_gerador(pasta):
+    """Gerador partilhado por todas as sessões do servidor para a mesma pasta."""
+    with _geradores_lock:
+        if pasta not in _geradores:
+            _geradores[pasta] = GeradorRelatorios(pasta)
+        return _geradores[pasta]
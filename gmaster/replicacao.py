@@ -0,0 +1,306 @@
+"""
+Replicação por registo de alterações entre os caixas (nós) e um nó central.
+
+Cada nó acrescenta as suas vendas e as posições de estoque alteradas a um registo SQLite
+numerado (`replicacao.sqlite`). Uma thread em segundo plano envia ao central apenas as entradas
+ainda não confirmadas; se o central não responder, o caixa continua a vender e o envio é
+retomado mais tarde. O central aplica as entradas de forma idempotente: guarda, por nó, o último
+número de sequência aplicado e ignora tudo o que já viu. Os números de sequência só valem dentro
+do mesmo registo: cada registo tem uma época aleatória, enviada com cada lote, e quando a época
+de um nó muda (registo recriado numa reinstalação ou restauro) o central volta a contar do zero.
+Cada caixa deve ter um GMASTER_NO próprio; por omissão é o nome da máquina.
+
+Testar com dois processos locais:
+
+    python -m gmaster.replicacao central --base central.sqlite --porta 8765
+    python -m gmaster.replicacao enviar --registo replicacao.sqlite --central http://localhost:8765
+"""
+import argparse
+import json
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import urllib.error
+import urllib.request
+from contextlib import closing
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from gmaster.metricas import contar
+
+TIPO_VENDA = 'venda'
+TIPO_ESTOQUE = 'estoque'
+TAMANHO_LOTE = 500
+INTERVALO_ENVIO = 10
+TEMPO_LIMITE = 5
+
+ESQUEMA_NO = """
+CREATE TABLE IF NOT EXISTS registo (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo TEXT NOT NULL,
+    dados TEXT NOT NULL,
+    criado_em TEXT
+);
+CREATE TABLE IF NOT EXISTS propriedades (
+    chave TEXT PRIMARY KEY,
+    valor TEXT NOT NULL
+);
+"""
+
+ESQUEMA_CENTRAL = """
+CREATE TABLE IF NOT EXISTS nos (
+    no TEXT PRIMARY KEY,
+    ultimo_seq INTEGER NOT NULL,
+    visto_em TEXT,
+    epoca TEXT
+);
+CREATE TABLE IF NOT EXISTS vendas (
+    no TEXT NOT NULL,
+    id_venda INTEGER NOT NULL,
+    data TEXT,
+    produto TEXT,
+    quantidade REAL,
+    cpf_cliente TEXT,
+    PRIMARY KEY (no, id_venda)
+);
+CREATE TABLE IF NOT EXISTS estoque (
+    no TEXT NOT NULL,
+    produto TEXT NOT NULL,
+    quantidade REAL,
+    PRIMARY KEY (no, produto)
+);
+"""
+
+
+def id_no_padrao():
+    return socket.gethostname()
+
+
+class RegistoAlteracoes:
+    """Registo local de alterações de um nó."""
+
+    def __init__(self, caminho, no=None):
+        self.caminho = caminho
+        self.no = no or id_no_padrao()
+        with closing(sqlite3.connect(caminho)) as conexao, conexao:
+            conexao.executescript(ESQUEMA_NO)
+            # A época nasce com o ficheiro: um registo recriado tem outra, e os seq voltam a valer do zero
+            conexao.execute("INSERT OR IGNORE INTO propriedades VALUES ('epoca', ?)", (uuid.uuid4().hex,))
+            self.epoca = conexao.execute("SELECT valor FROM propriedades WHERE chave = 'epoca'").fetchone()[0]
+
+    def _acrescentar(self, entradas):
+        agora = datetime.now().isoformat(timespec='seconds')
+        with closing(sqlite3.connect(self.caminho)) as conexao, conexao:
+            conexao.executemany("INSERT INTO registo (tipo, dados, criado_em) VALUES (?, ?, ?)",
+                                ((tipo, json.dumps(dados, ensure_ascii=False), agora) for tipo, dados in entradas))
+
+    def registar_vendas(self, vendas_df):
+        """Acrescenta as vendas (indexadas por ID_Venda) ao registo."""
+        if vendas_df.empty:
+            return
+        cpfs = vendas_df['CPF_Cliente'] if 'CPF_Cliente' in vendas_df.columns else pd.Series('', index=vendas_df.index)
+        self._acrescentar(
+            (TIPO_VENDA, {
+                'id_venda': int(id_venda),
+                'data': pd.Timestamp(data).isoformat(),
+                'produto': str(produto),
+                'quantidade': float(quantidade),
+                'cpf_cliente': '' if pd.isna(cpf) else str(cpf),
+            })
+            for id_venda, data, produto, quantidade, cpf in zip(
+                vendas_df.index, vendas_df['Data'], vendas_df['Produto'], vendas_df['Quantidade'], cpfs)
+        )
+
+    def registar_estoque(self, estoque_df, produtos):
+        """Acrescenta a posição atual dos produtos indicados (valor absoluto, não a diferença)."""
+        produtos = set(produtos)
+        if not produtos:
+            return
+        linhas = estoque_df[estoque_df['Produto'].isin(produtos)]
+        self._acrescentar(
+            (TIPO_ESTOQUE, {'produto': str(produto), 'quantidade': float(quantidade)})
+            for produto, quantidade in zip(linhas['Produto'], pd.to_numeric(linhas['Quantidade_Estoque'], errors='coerce').fillna(0))
+        )
+
+    def pendentes(self, limite=TAMANHO_LOTE):
+        with closing(sqlite3.connect(self.caminho)) as conexao:
+            linhas = conexao.execute("SELECT seq, tipo, dados FROM registo ORDER BY seq LIMIT ?", (limite,)).fetchall()
+        return [{'seq': seq, 'tipo': tipo, 'dados': json.loads(dados)} for seq, tipo, dados in linhas]
+
+    def total_pendentes(self):
+        with closing(sqlite3.connect(self.caminho)) as conexao:
+            return conexao.execute("SELECT COUNT(*) FROM registo").fetchone()[0]
+
+    def confirmar(self, ate_seq):
+        """Apaga as entradas que o central já aplicou."""
+        with closing(sqlite3.connect(self.caminho)) as conexao, conexao:
+            conexao.execute("DELETE FROM registo WHERE seq <= ?", (int(ate_seq),))
+
+
+def enviar_pendentes(registo, url_central, tamanho_lote=TAMANHO_LOTE):
+    """Envia os lotes pendentes até esvaziar o registo. Devolve quantas entradas foram confirmadas."""
+    enviadas = 0
+    while True:
+        entradas = registo.pendentes(tamanho_lote)
+        if not entradas:
+            return enviadas
+        corpo = json.dumps({'no': registo.no, 'epoca': registo.epoca, 'entradas': entradas}, ensure_ascii=False).encode('utf-8')
+        pedido = urllib.request.Request(f"{url_central.rstrip('/')}/replicar", data=corpo,
+                                        headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(pedido, timeout=TEMPO_LIMITE) as resposta:
+            confirmado = json.load(resposta)['ultimo_seq']
+        registo.confirmar(confirmado)
+        enviadas += sum(1 for entrada in entradas if entrada['seq'] <= confirmado)
+        contar('replicacao_entradas_enviadas', len(entradas))
+        if confirmado < entradas[-1]['seq']:
+            return enviadas  # O central não aplicou o lote inteiro; tenta de novo no próximo ciclo
+
+
+class EnvioPeriodico:
+    """Thread que envia o registo ao central a cada `intervalo` segundos, fora do caminho das vendas."""
+
+    def __init__(self, registo, url_central, intervalo=INTERVALO_ENVIO):
+        self.registo = registo
+        self.url_central = url_central
+        self.intervalo = intervalo
+        self.ultimo_erro = None
+        self.ultimo_envio = None
+        self._acordar = threading.Event()
+        self._thread = threading.Thread(target=self._ciclo, name='replicacao', daemon=True)
+        self._thread.start()
+
+    def enviar_agora(self):
+        self._acordar.set()
+
+    def _ciclo(self):
+        while True:
+            try:
+                enviar_pendentes(self.registo, self.url_central)
+                self.ultimo_envio = datetime.now()
+                self.ultimo_erro = None
+            except (urllib.error.URLError, OSError, ValueError, KeyError) as erro:
+                # Sem ligação ao central: as entradas ficam no registo e seguem no próximo ciclo
+                self.ultimo_erro = str(erro)
+                contar('replicacao_falhas')
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+
+
+_envios = {}
+_envios_lock = threading.Lock()
+
+
+def obter_envio(caminho_registo, url_central, no=None):
+    """Envio periódico partilhado pelas sessões do servidor (um por registo)."""
+    with _envios_lock:
+        if caminho_registo not in _envios:
+            _envios[caminho_registo] = EnvioPeriodico(RegistoAlteracoes(caminho_registo, no), url_central)
+        return _envios[caminho_registo]
+
+
+class BaseCentral:
+    """Base consolidada do nó central."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        with closing(sqlite3.connect(caminho)) as conexao, conexao:
+            conexao.executescript(ESQUEMA_CENTRAL)
+            colunas = {linha[1] for linha in conexao.execute("PRAGMA table_info(nos)")}
+            if 'epoca' not in colunas:
+                conexao.execute("ALTER TABLE nos ADD COLUMN epoca TEXT")
+
+    def aplicar(self, no, entradas, epoca=None):
+        """Aplica as entradas novas do nó numa transação e devolve o último seq aplicado."""
+        with self._lock, closing(sqlite3.connect(self.caminho)) as conexao, conexao:
+            linha = conexao.execute("SELECT ultimo_seq, epoca FROM nos WHERE no = ?", (no,)).fetchone()
+            ultimo_seq = linha[0] if linha else 0
+            if linha is not None and linha[1] != epoca:
+                # Outro registo (recriado ou de outra máquina com o mesmo nome): os seq antigos não valem.
+                # Reaplicar é seguro, as vendas e o estoque são gravados por chave.
+                ultimo_seq = 0
+                contar('replicacao_mudancas_epoca')
+            for entrada in sorted(entradas, key=lambda e: e['seq']):
+                if entrada['seq'] <= ultimo_seq:
+                    continue  # Já aplicada (reenvio depois de uma confirmação perdida)
+                dados = entrada['dados']
+                if entrada['tipo'] == TIPO_VENDA:
+                    conexao.execute("INSERT OR REPLACE INTO vendas VALUES (?, ?, ?, ?, ?, ?)",
+                                    (no, dados['id_venda'], dados['data'], dados['produto'], dados['quantidade'], dados['cpf_cliente']))
+                elif entrada['tipo'] == TIPO_ESTOQUE:
+                    conexao.execute("INSERT OR REPLACE INTO estoque VALUES (?, ?, ?)", (no, dados['produto'], dados['quantidade']))
+                ultimo_seq = entrada['seq']
+            conexao.execute("INSERT OR REPLACE INTO nos (no, ultimo_seq, visto_em, epoca) VALUES (?, ?, ?, ?)",
+                            (no, ultimo_seq, datetime.now().isoformat(timespec='seconds'), epoca))
+        return ultimo_seq
+
+    def resumo(self):
+        with closing(sqlite3.connect(self.caminho)) as conexao:
+            return pd.read_sql_query(
+                "SELECT n.no, n.ultimo_seq, n.visto_em, COUNT(v.id_venda) AS vendas "
+                "FROM nos n LEFT JOIN vendas v ON v.no = n.no GROUP BY n.no", conexao)
+
+
+def servir_central(caminho_base, porta):
+    base = BaseCentral(caminho_base)
+
+    class Tratador(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != '/replicar':
+                self.send_error(404)
+                return
+            try:
+                pedido = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                ultimo_seq = base.aplicar(str(pedido['no']), pedido['entradas'], pedido.get('epoca'))
+            except (ValueError, KeyError, TypeError, AttributeError) as erro:
+                self.send_error(400, str(erro))
+                return
+            corpo = json.dumps({'ultimo_seq': ultimo_seq}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, formato, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(('0.0.0.0', porta), Tratador)
+    print(f"Nó central a receber em http://0.0.0.0:{porta}/replicar (base: {caminho_base})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replicação do GMaster entre caixas e o nó central.")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    central = sub.add_parser('central', help="Inicia o nó central.")
+    central.add_argument('--base', default='central.sqlite')
+    central.add_argument('--porta', type=int, default=8765)
+    enviar = sub.add_parser('enviar', help="Envia o registo pendente de um nó.")
+    enviar.add_argument('--registo', default='replicacao.sqlite')
+    enviar.add_argument('--central', required=True)
+    enviar.add_argument('--no', default=None)
+    args = parser.parse_args(argv)
+
+    if args.comando == 'central':
+        servir_central(args.base, args.porta)
+    else:
+        registo = RegistoAlteracoes(args.registo, args.no)
+        inicio = time.perf_counter()
+        try:
+            enviadas = enviar_pendentes(registo, args.central)
+        except (urllib.error.URLError, OSError) as erro:
+            print(f"Central indisponível ({erro}). {registo.total_pendentes()} entrada(s) continuam pendentes.")
+            return
+        print(f"{enviadas} entrada(s) confirmada(s) pelo central em {time.perf_counter() - inicio:.2f} s.")
+
+
+if __name__ == '__main__':
+    main()
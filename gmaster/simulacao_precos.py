@@ -0,0 +1,100 @@
+"""
+Simulador de preços e custos do Cardápio sobre as vendas históricas.
+
+As vendas detalhadas (saída de `preparar_dados_analise`) são convertidas uma única vez numa
+matriz de quantidades produto × dia. Cada cenário é um vetor de preços e um vetor de custos por
+produto; todos os cenários são avaliados de uma vez com operações matriciais (cenário × produto
+× dia), sem voltar a juntar vendas e cardápio por cenário.
+
+A elasticidade opcional ajusta a quantidade vendida à variação de preço (elasticidade constante):
+quantidade_nova = quantidade * (preco_novo / preco_atual) ** elasticidade. Com elasticidade 0 as
+quantidades históricas ficam iguais.
+"""
+import numpy as np
+import pandas as pd
+
+from gmaster.metricas import cronometrado
+
+
+class BaseSimulacao:
+    """Matriz de quantidades produto × dia e os preços e custos atuais de cada produto."""
+
+    def __init__(self, produtos, categorias, dias, quantidades, precos, custos):
+        self.produtos = produtos
+        self.categorias = categorias
+        self.dias = dias
+        self.quantidades = quantidades
+        self.precos = precos
+        self.custos = custos
+
+
+def preparar_base(vendas_detalhadas):
+    """Constrói a BaseSimulacao a partir das vendas detalhadas (uma única vez por período)."""
+    if vendas_detalhadas.empty:
+        return None
+    dias = vendas_detalhadas['Data'].dt.normalize()
+    matriz = (vendas_detalhadas.assign(Dia=dias)
+              .pivot_table(index='Produto', columns='Dia', values='Quantidade', aggfunc='sum', fill_value=0))
+    atuais = vendas_detalhadas.drop_duplicates('Produto', keep='last').set_index('Produto').reindex(matriz.index)
+    return BaseSimulacao(
+        produtos=matriz.index.tolist(),
+        categorias=atuais['Categoria'].fillna('').to_numpy() if 'Categoria' in atuais.columns else np.full(len(matriz), ''),
+        dias=pd.DatetimeIndex(matriz.columns),
+        quantidades=matriz.to_numpy(dtype=float),
+        precos=atuais['Preco_Venda'].to_numpy(dtype=float),
+        custos=atuais['Custo_Unitario'].to_numpy(dtype=float),
+    )
+
+
+def gerar_cenarios(base, variacoes_preco, variacoes_custo=(0,), afetados=None):
+    """
+    Grelha de cenários: cada par (variação de preço %, variação de custo %) aplicado aos produtos
+    `afetados` (máscara booleana; todos por omissão). Devolve (nomes, precos S×P, custos S×P).
+    """
+    afetados = np.ones(len(base.produtos), dtype=bool) if afetados is None else np.asarray(afetados, dtype=bool)
+    grelha_preco, grelha_custo = np.meshgrid(np.asarray(variacoes_preco, dtype=float), np.asarray(variacoes_custo, dtype=float), indexing='ij')
+    grelha_preco, grelha_custo = grelha_preco.ravel(), grelha_custo.ravel()
+    fatores_preco = 1 + np.where(afetados, grelha_preco[:, None], 0) / 100
+    fatores_custo = 1 + np.where(afetados, grelha_custo[:, None], 0) / 100
+    nomes = [f"Preço {p:+.0f}% / Custo {c:+.0f}%" for p, c in zip(grelha_preco, grelha_custo)]
+    return nomes, base.precos * fatores_preco, base.custos * fatores_custo
+
+
+@cronometrado('simular_precos')
+def simular(base, nomes, precos, custos, elasticidade=0.0):
+    """
+    Avalia todos os cenários de uma vez e devolve-os ordenados pelo lucro projetado.
+    `elasticidade` pode ser um número ou um vetor por produto (normalmente negativa).
+    """
+    precos = np.atleast_2d(precos)
+    custos = np.atleast_2d(custos)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fator_quantidade = np.where(base.precos > 0, (precos / base.precos) ** np.asarray(elasticidade, dtype=float), 1.0)
+    # (cenário × produto) @ (produto × dia) -> valores diários de cada cenário
+    receita_dia = (fator_quantidade * precos) @ base.quantidades
+    lucro_dia = (fator_quantidade * (precos - custos)) @ base.quantidades
+    itens = fator_quantidade @ base.quantidades.sum(axis=1)
+    receita = receita_dia.sum(axis=1)
+    lucro = lucro_dia.sum(axis=1)
+    lucro_atual = ((base.precos - base.custos) @ base.quantidades).sum()
+    resultado = pd.DataFrame({
+        'Cenario': nomes,
+        'Receita': receita,
+        'Lucro': lucro,
+        'Margem_%': np.divide(lucro, receita, out=np.zeros_like(lucro), where=receita != 0) * 100,
+        'Itens': itens,
+        'Variacao_Lucro': lucro - lucro_atual,
+        'Pior_Dia': lucro_dia.min(axis=1),
+    })
+    return resultado.sort_values('Lucro', ascending=False, ignore_index=True).round(2)
+
+
+def precos_do_cenario(base, precos, custos):
+    """Tabela produto a produto de um cenário, para comparar com o Cardápio atual."""
+    return pd.DataFrame({
+        'Produto': base.produtos,
+        'Preco_Atual': base.precos,
+        'Preco_Cenario': precos,
+        'Custo_Atual': base.custos,
+        'Custo_Cenario': custos,
+    }).round(2)
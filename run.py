@@ -3,23 +3,61 @@ import sys
 import subprocess
 import webbrowser
 import time
+import urllib.request
+import urllib.error
+
+PORTA = 8501
+ENDERECO = f"http://localhost:{PORTA}"
+# Endpoint de saúde do servidor do Streamlit; responde "ok" quando a aplicação já aceita ligações
+ENDERECO_SAUDE = f"{ENDERECO}/_stcore/health"
+TEMPO_MAXIMO = 60
+INTERVALO_VERIFICACAO = 0.1
+
+
+def servidor_pronto():
+    try:
+        with urllib.request.urlopen(ENDERECO_SAUDE, timeout=1) as resposta:
+            return resposta.status == 200
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return False
+
 
 def main():
+    inicio = time.perf_counter()
     # Encontra o caminho do script principal
     # Verifique se o nome "sistema gestão.py" está correto
-    script_path = os.path.join(os.path.dirname(__file__), "sistema gestão.py")
+    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sistema gestão.py")
 
-    # Comando para iniciar o Streamlit
-    command = f'"{sys.executable}" -m streamlit run "{script_path}" --server.port 8501 --server.headless "true"'
+    # Comando para iniciar o Streamlit (lista de argumentos, sem passar por uma shell)
+    command = [
+        sys.executable, "-m", "streamlit", "run", script_path,
+        "--server.port", str(PORTA),
+        "--server.headless", "true",
+        "--browser.gatherUsageStats", "false",
+    ]
 
     print("Iniciando o GMaster... Por favor, aguarde.")
-    
-    # Inicia o processo do Streamlit
-    subprocess.Popen(command, shell=True)
-    
-    # Espera um pouco para o servidor iniciar e abre o navegador
-    time.sleep(5)
-    webbrowser.open("http://localhost:8501", new=2, autoraise=True)
+    processo = subprocess.Popen(command)
+
+    # Em vez de esperar um tempo fixo, consulta o servidor até ele responder
+    while not servidor_pronto():
+        if processo.poll() is not None:
+            print(f"O servidor do GMaster terminou inesperadamente (código {processo.returncode}).")
+            sys.exit(processo.returncode or 1)
+        if time.perf_counter() - inicio > TEMPO_MAXIMO:
+            print(f"O servidor não respondeu em {TEMPO_MAXIMO} s. Verifique a janela do Streamlit.")
+            break
+        time.sleep(INTERVALO_VERIFICACAO)
+    else:
+        print(f"GMaster pronto em {time.perf_counter() - inicio:.2f} s.")
+
+    webbrowser.open(ENDERECO, new=2, autoraise=True)
+
+    try:
+        processo.wait()
+    except KeyboardInterrupt:
+        processo.terminate()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
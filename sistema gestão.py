@@ -1,16 +1,26 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 import plotly.express as px
-from fpdf import FPDF
 import os
 import time
 from datetime import datetime, timedelta
-from io import BytesIO
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
-import zipfile
 import json
-import random
+from gmaster.dados import (
+    criar_db_ficticio, ler_base, gravar_base, sincronizar_estoque, preparar_dados_analise,
+    agregar_dashboard, gerar_xml_nfc, gerar_script_mysql, gerar_csv_powerbi
+)
+from gmaster.alteracoes import ler_alteracoes, tem_alteracoes, aplicar_alteracoes, reconciliar_estoque, produtos_com_estoque_alterado
+from gmaster.clientes import IndiceClientes, carregar_sal, normalizar_cpf
+from gmaster.indice_vendas import IndiceVendas
+from gmaster import importacao
+from gmaster.nfe_fornecedores import importar_nfe, RegistroNFe
+from gmaster.documentos_fiscais import obter_armazem, ESTADO_EXPORTADO
+from gmaster import arquivo_vendas, metricas, relatorios
+from gmaster import lojas, replicacao, backup, cozinha, simulacao_precos, exportacao_excel
+from gmaster.alertas_estoque import MonitorEstoque, NotificadorFicheiro, NotificadorWebhook, compras_de_reposicao
+from gmaster.graficos import CacheFiguras, escolher_frequencia, figura_receita, FREQUENCIAS
+from gmaster.consulta_sql import ConsoleSQL, ErroConsulta, LIMITE_LINHAS
 
 # --- Configuração da Página ---
 st.set_page_config(
@@ -56,72 +66,29 @@ try:
     BASE_DIR = os.path.dirname(os.path.realpath(__file__))
 except NameError:
     BASE_DIR = os.getcwd()
+# NOVO: Em modo multi-loja cada loja corre com a sua própria pasta de dados
+BASE_DIR = os.environ.get("GMASTER_DADOS", BASE_DIR)
 DB_FILE = os.path.join(BASE_DIR, "pizzaria_db.xlsx")
 CONFIG_FILE = os.path.join(BASE_DIR, "config_empresa.json")
+CLIENTES_FILE = os.path.join(BASE_DIR, "clientes_idx.json.gz")
+SAL_FILE = os.path.join(BASE_DIR, ".gmaster_sal")
+ARQUIVO_DIR = os.path.join(BASE_DIR, "arquivo_vendas")
+FISCAL_DIR = os.path.join(BASE_DIR, "documentos_fiscais")
+INDICE_VENDAS_FILE = os.path.join(BASE_DIR, "vendas_idx.sqlite")
+IMPORTACOES_FILE = os.path.join(BASE_DIR, "importacoes.sqlite")
+RELATORIOS_DIR = os.path.join(BASE_DIR, "relatorios")
+REPLICACAO_FILE = os.path.join(BASE_DIR, "replicacao.sqlite")
+BACKUP_DIR = os.path.join(BASE_DIR, "backups")
+ALERTAS_FILE = os.path.join(BASE_DIR, "alertas_estoque.log")
+EXPORTACOES_DIR = os.path.join(BASE_DIR, "exportacoes")
+# NOVO: O download passa o ficheiro inteiro pela memória; acima disto fica só na pasta de exportações
+LIMITE_DOWNLOAD_MB = 50
+# NOVO: Endereço do nó central (ex.: http://192.168.0.10:8765); sem ele a replicação fica desligada
+CENTRAL_URL = os.environ.get("GMASTER_CENTRAL")
 
 
 # --- Funções de Manipulação de Dados ---
 
-def criar_db_ficticio():
-    """
-    NOVO: Cria uma base de dados fictícia com 3 meses de dados para demonstração.
-    """
-    # 1. Produtos
-    produtos_data = [
-        {'Produto': 'Pizza Margherita', 'Categoria': 'Pizza Salgada', 'Preco_Venda': 55.00, 'Custo_Unitario': 15.50},
-        {'Produto': 'Pizza Pepperoni', 'Categoria': 'Pizza Salgada', 'Preco_Venda': 62.50, 'Custo_Unitario': 18.00},
-        {'Produto': 'Pizza Frango com Catupiry', 'Categoria': 'Pizza Salgada', 'Preco_Venda': 60.00, 'Custo_Unitario': 17.20},
-        {'Produto': 'Pizza Portuguesa', 'Categoria': 'Pizza Salgada', 'Preco_Venda': 65.00, 'Custo_Unitario': 19.50},
-        {'Produto': 'Pizza Quatro Queijos', 'Categoria': 'Pizza Salgada', 'Preco_Venda': 63.00, 'Custo_Unitario': 20.00},
-        {'Produto': 'Pizza de Chocolate', 'Categoria': 'Pizza Doce', 'Preco_Venda': 58.00, 'Custo_Unitario': 16.00},
-        {'Produto': 'Coca-Cola 2L', 'Categoria': 'Bebida', 'Preco_Venda': 12.00, 'Custo_Unitario': 6.50},
-        {'Produto': 'Guaraná Antarctica 2L', 'Categoria': 'Bebida', 'Preco_Venda': 11.00, 'Custo_Unitario': 6.00},
-        {'Produto': 'Água Mineral 500ml', 'Categoria': 'Bebida', 'Preco_Venda': 5.00, 'Custo_Unitario': 2.00},
-        {'Produto': 'Brownie de Chocolate', 'Categoria': 'Sobremesa', 'Preco_Venda': 15.00, 'Custo_Unitario': 7.00}
-    ]
-    df_produtos = pd.DataFrame(produtos_data)
-
-    # 2. Estoque
-    df_estoque = pd.DataFrame({
-        'Produto': df_produtos['Produto'],
-        'Quantidade_Estoque': [random.randint(50, 200) for _ in df_produtos['Produto']]
-    })
-
-    # 3. Vendas (últimos 90 dias)
-    vendas_list = []
-    hoje = datetime.now()
-    lista_produtos = df_produtos['Produto'].tolist()
-    for i in range(90):
-        data_venda = hoje - timedelta(days=i)
-        num_vendas_dia = random.randint(5, 25)
-        for _ in range(num_vendas_dia):
-            produto_vendido = random.choice(lista_produtos)
-            vendas_list.append({
-                'Data': data_venda.replace(hour=random.randint(18, 22), minute=random.randint(0, 59)),
-                'Produto': produto_vendido,
-                'Quantidade': random.randint(1, 3),
-                'CPF_Cliente': '' # Opcional
-            })
-    df_vendas = pd.DataFrame(vendas_list)
-
-    # 4. Compras (algumas despesas fictícias)
-    compras_data = [
-        {'Data': hoje - timedelta(days=30), 'Item': 'Compra de Farinha e Queijo', 'Valor': 1250.00, 'Fornecedor': 'Distribuidora Alimentos Bons', 'Categoria_Despesa': 'Mercadorias'},
-        {'Data': hoje - timedelta(days=5), 'Item': 'Pagamento de Aluguel', 'Valor': 3500.00, 'Fornecedor': 'Imobiliária Central', 'Categoria_Despesa': 'Aluguel'},
-        {'Data': hoje - timedelta(days=2), 'Item': 'Compra de Embalagens', 'Valor': 450.00, 'Fornecedor': 'EmbalaTudo', 'Categoria_Despesa': 'Mercadorias'},
-    ]
-    df_compras = pd.DataFrame(compras_data)
-
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df_produtos.to_excel(writer, index=False, sheet_name='Cardapio')
-        df_estoque.to_excel(writer, index=False, sheet_name='Estoque')
-        df_vendas.to_excel(writer, index=False, sheet_name='Vendas')
-        df_compras.to_excel(writer, index=False, sheet_name='Compras')
-
-    return output.getvalue()
-
-
 def inicializar_arquivos():
     st.info("Base de dados não encontrada. Criando arquivos iniciais com dados de exemplo...")
     config_default = {
@@ -142,183 +109,210 @@ def inicializar_arquivos():
     time.sleep(3)
     st.rerun()
 
+@metricas.cronometrado('carregar_dados')
 def carregar_dados_para_edicao():
     if not os.path.exists(DB_FILE) or not os.path.exists(CONFIG_FILE):
         inicializar_arquivos()
     try:
-        with open(DB_FILE, 'rb') as f:
-            xls = pd.ExcelFile(f)
-            st.session_state['df_produtos'] = pd.read_excel(xls, 'Cardapio')
-            st.session_state['df_estoque'] = pd.read_excel(xls, 'Estoque')
-            st.session_state['df_vendas'] = pd.read_excel(xls, 'Vendas')
-            if 'Compras' in xls.sheet_names:
-                st.session_state['df_compras'] = pd.read_excel(xls, 'Compras')
-            else:
-                st.session_state['df_compras'] = pd.DataFrame(columns=['Data', 'Item', 'Valor', 'Fornecedor', 'Categoria_Despesa'])
+        base = ler_base(DB_FILE)
+        st.session_state['df_produtos'] = base['produtos']
+        # A reconciliação estoque/cardápio corre uma vez na carga e depois só quando o cardápio muda
+        st.session_state['df_estoque'] = sincronizar_estoque(base['produtos'].dropna(subset=['Produto']), base['estoque'])
+        st.session_state['df_compras'] = base['compras']
         with open(CONFIG_FILE, "r", encoding="utf-8") as f:
             st.session_state['config_empresa'] = json.load(f)
+        df_vendas, meses_arquivados = arquivo_vendas.arquivar_meses_fechados(base['vendas'], ARQUIVO_DIR)
+        st.session_state['df_vendas'] = df_vendas
+        if meses_arquivados:
+            salvar_dados(st.session_state['config_empresa'], st.session_state['df_produtos'], st.session_state['df_estoque'], df_vendas, st.session_state['df_compras'], notificar=False)
     except Exception as e:
         st.error(f"Ocorreu um erro ao carregar os dados: {e}")
         st.warning(f"Verifique se os ficheiros de dados não estão corrompidos. Se necessário, apague-os para que o sistema os crie novamente.")
         st.stop()
 
-def salvar_dados(config_empresa, produtos, estoque, vendas, compras):
-    produtos_df = produtos.dropna(subset=['Produto'])
-    produtos_atuais = produtos_df['Produto'].unique()
-    estoque_sincronizado = estoque[estoque['Produto'].isin(produtos_atuais)].copy()
-    novos_produtos = [p for p in produtos_atuais if p not in estoque_sincronizado['Produto'].values]
-    if novos_produtos:
-        novos_estoque_df = pd.DataFrame({'Produto': novos_produtos, 'Quantidade_Estoque': [0]*len(novos_produtos)})
-        estoque_sincronizado = pd.concat([estoque_sincronizado, novos_estoque_df], ignore_index=True)
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        produtos_df.to_excel(writer, index=False, sheet_name='Cardapio')
-        estoque_sincronizado.to_excel(writer, index=False, sheet_name='Estoque')
-        vendas.to_excel(writer, index=False, sheet_name='Vendas')
-        compras.to_excel(writer, index=False, sheet_name='Compras')
-    with open(DB_FILE, "wb") as f:
-        f.write(output.getvalue())
+@metricas.cronometrado('salvar_dados')
+def salvar_dados(config_empresa, produtos, estoque, vendas, compras, notificar=True):
+    gravar_base(DB_FILE, produtos, estoque, vendas, compras)
+    # As alterações só entram no registo de replicação depois de gravadas na base local
+    pendente = st.session_state.pop('replicacao_pendente', None)
+    if pendente:
+        envio = st.session_state['replicacao']
+        for novas_vendas in pendente['vendas']:
+            envio.registo.registar_vendas(novas_vendas)
+        envio.registo.registar_estoque(estoque, pendente['estoque'])
+        envio.enviar_agora()
+    # Exportações preparadas antes desta gravação ficaram desatualizadas
+    st.session_state.pop('exportacoes', None)
+    # As figuras em cache são indexadas pela versão dos dados
+    st.session_state['versao_dados'] = st.session_state.get('versao_dados', 0) + 1
     with open(CONFIG_FILE, "w", encoding="utf-8") as f:
         json.dump(config_empresa, f, indent=4)
-    st.toast("🎉 Dados salvos com sucesso!", icon='✅')
+    if notificar:
+        st.toast("🎉 Dados salvos com sucesso!", icon='✅')
 
-def gerar_xml_nfc(venda_info, produtos_info):
+def marcar_para_replicacao(vendas=None, produtos_estoque=()):
+    """NOVO: Guarda vendas e produtos de estoque a replicar; seguem para o registo na próxima gravação."""
+    if 'replicacao' not in st.session_state:
+        return
+    pendente = st.session_state.setdefault('replicacao_pendente', {'vendas': [], 'estoque': set()})
+    if vendas is not None and not vendas.empty:
+        pendente['vendas'].append(vendas)
+    pendente['estoque'].update(produtos_estoque)
+
+def aplicar_edicoes_pendentes():
     """
-    CORRIGIDO: Função de geração de XML com número de nota e data corrigidos.
+    NOVO: Aplica ao cardápio e ao estoque apenas as linhas alteradas nos editores.
+    Devolve True se havia alterações.
     """
-    nfe = ET.Element("NFe", xmlns="http://www.portalfiscal.inf.br/nfe")
-    infNFe = ET.SubElement(nfe, "infNFe", versao="4.00", Id=f"NFe{venda_info.name}") # Id é opcional mas bom ter
-
-    ide = ET.SubElement(infNFe, "ide")
-    ET.SubElement(ide, "cUF").text = "35"  # Exemplo: SP
-    ET.SubElement(ide, "natOp").text = "VENDA"
-    ET.SubElement(ide, "mod").text = "65"  # NFC-e
-    ET.SubElement(ide, "serie").text = "1"
-    # CORREÇÃO: Usar o índice da venda como número da nota fiscal. É único.
-    ET.SubElement(ide, "nNF").text = str(venda_info.name)
-    # CORREÇÃO: Formatar a data/hora com fuso horário padrão do Brasil (-03:00)
-    ET.SubElement(ide, "dhEmi").text = pd.to_datetime(venda_info['Data']).strftime('%Y-%m-%dT%H:%M:%S-03:00')
-    ET.SubElement(ide, "tpNF").text = "1" # 1 - Saída
-    ET.SubElement(ide, "idDest").text = "1" # 1 - Operação interna
-    ET.SubElement(ide, "tpImp").text = "4" # 4 - DANFE NFC-e
-    ET.SubElement(ide, "tpEmis").text = "1" # 1 - Emissão normal
-    ET.SubElement(ide, "finNFe").text = "1" # 1 - NFe normal
-    ET.SubElement(ide, "indFinal").text = "1" # 1 - Consumidor final
-    ET.SubElement(ide, "indPres").text = "1" # 1 - Operação presencial
-    ET.SubElement(ide, "procEmi").text = "0" # 0 - Emissão com aplicativo do contribuinte
-    ET.SubElement(ide, "verProc").text = "GMaster 1.0"
-
-
-    emit = ET.SubElement(infNFe, "emit")
-    ET.SubElement(emit, "CNPJ").text = st.session_state['config_empresa'].get('cnpj', '').replace('.', '').replace('/', '').replace('-', '')
-    ET.SubElement(emit, "xNome").text = st.session_state['config_empresa'].get('razao_social', '')
-
-    if 'CPF_Cliente' in venda_info and pd.notna(venda_info['CPF_Cliente']) and venda_info['CPF_Cliente']:
-        dest = ET.SubElement(infNFe, "dest")
-        ET.SubElement(dest, "CPF").text = str(venda_info['CPF_Cliente']).replace('.', '').replace('-', '')
-    
-    total_nota = 0
-    for i, row in produtos_info.reset_index(drop=True).iterrows():
-        det = ET.SubElement(infNFe, "det", nItem=str(i + 1))
-        prod = ET.SubElement(det, "prod")
-        ET.SubElement(prod, "cProd").text = f"P{row.name}" # Usando o índice original do produto
-        ET.SubElement(prod, "xProd").text = row['Produto']
-        ET.SubElement(prod, "NCM").text = "21069090"  # Código genérico para alimentos
-        ET.SubElement(prod, "CFOP").text = "5102"
-        ET.SubElement(prod, "uCom").text = "UN"
-        ET.SubElement(prod, "qCom").text = f"{row['Quantidade']:.4f}"
-        # CORREÇÃO: Formatação explícita para 10 casas decimais como exige o padrão
-        ET.SubElement(prod, "vUnCom").text = f"{row['Preco_Venda']:.10f}"
-        vProd = row['Quantidade'] * row['Preco_Venda']
-        total_nota += vProd
-        ET.SubElement(prod, "vProd").text = f"{vProd:.2f}"
-        ET.SubElement(prod, "uTrib").text = "UN"
-        ET.SubElement(prod, "qTrib").text = f"{row['Quantidade']:.4f}"
-        ET.SubElement(prod, "vUnTrib").text = f"{row['Preco_Venda']:.10f}"
-        ET.SubElement(prod, "indTot").text = "1"
-
-    total = ET.SubElement(infNFe, "total")
-    ICMSTot = ET.SubElement(total, "ICMSTot")
-    ET.SubElement(ICMSTot, "vBC").text = "0.00"
-    ET.SubElement(ICMSTot, "vICMS").text = "0.00"
-    ET.SubElement(ICMSTot, "vProd").text = f"{total_nota:.2f}"
-    ET.SubElement(ICMSTot, "vNF").text = f"{total_nota:.2f}"
-    
-    pag = ET.SubElement(infNFe, "pag")
-    detPag = ET.SubElement(pag, "detPag")
-    ET.SubElement(detPag, "tPag").text = "01"  # 01=Dinheiro
-    ET.SubElement(detPag, "vPag").text = f"{total_nota:.2f}"
-    
-    xml_string = ET.tostring(nfe, 'utf-8')
-    dom = minidom.parseString(xml_string)
-    return dom.toprettyxml(indent="  ", encoding="utf-8")
-
-def gerar_script_mysql(produtos, estoque, vendas):
-    sql_script = ""
-    sql_script += "DROP TABLE IF EXISTS `cardapio`;\n"
-    sql_script += "CREATE TABLE `cardapio` (`Produto` varchar(255) NOT NULL, `Categoria` varchar(255) DEFAULT NULL, `Preco_Venda` decimal(10,2) DEFAULT NULL, `Custo_Unitario` decimal(10,2) DEFAULT NULL, PRIMARY KEY (`Produto`)) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;\n\n"
-    if not produtos.empty:
-        for index, row in produtos.iterrows():
-            produto = str(row.get('Produto', '')).replace("'", "''")
-            categoria = str(row.get('Categoria', '')).replace("'", "''")
-            preco = row.get('Preco_Venda', 0)
-            custo = row.get('Custo_Unitario', 0)
-            linha_sql = f"INSERT INTO `cardapio` VALUES ('{produto}', '{categoria}', {preco}, {custo});\n"
-            sql_script += linha_sql
-    sql_script += "\nDROP TABLE IF EXISTS `estoque`;\n"
-    sql_script += "CREATE TABLE `estoque` (`Produto` varchar(255) NOT NULL, `Quantidade_Estoque` int(11) DEFAULT NULL, PRIMARY KEY (`Produto`)) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;\n\n"
-    if not estoque.empty:
-        for index, row in estoque.iterrows():
-            produto = str(row.get('Produto', '')).replace("'", "''")
-            qtde = row.get('Quantidade_Estoque', 0)
-            linha_sql = f"INSERT INTO `estoque` VALUES ('{produto}', {qtde});\n"
-            sql_script += linha_sql
-    sql_script += "\nDROP TABLE IF EXISTS `vendas`;\n"
-    sql_script += "CREATE TABLE `vendas` (`id` int(11) NOT NULL AUTO_INCREMENT, `Data` datetime DEFAULT NULL, `Produto` varchar(255) DEFAULT NULL, `Quantidade` int(11) DEFAULT NULL, `CPF_Cliente` varchar(20) DEFAULT NULL, PRIMARY KEY (`id`)) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;\n\n"
-    if not vendas.empty:
-        for index, row in vendas.iterrows():
-            data = pd.to_datetime(row.get('Data')).strftime('%Y-%m-%d %H:%M:%S')
-            produto = str(row.get('Produto', '')).replace("'", "''")
-            qtde = row.get('Quantidade', 0)
-            cpf = str(row.get('CPF_Cliente', '')).replace("'", "''")
-            linha_sql = f"INSERT INTO `vendas` (`Data`, `Produto`, `Quantidade`, `CPF_Cliente`) VALUES ('{data}', '{produto}', {qtde}, '{cpf}');\n"
-            sql_script += linha_sql
-    return sql_script.encode('utf-8')
+    versao = st.session_state.get('versao_editores', 0)
+    # O estoque primeiro: as posições do editor referem-se ao estoque antes da reconciliação
+    alteracoes_estoque = ler_alteracoes(st.session_state.get(f"editor_estoque_{versao}"), st.session_state['df_estoque'])
+    alteracoes_produtos = ler_alteracoes(st.session_state.get(f"editor_produtos_{versao}"), st.session_state['df_produtos'])
+    if not tem_alteracoes(alteracoes_estoque) and not tem_alteracoes(alteracoes_produtos):
+        return False
+    estoque_antes = st.session_state['df_estoque']
+    if tem_alteracoes(alteracoes_estoque):
+        st.session_state['df_estoque'] = aplicar_alteracoes(st.session_state['df_estoque'], alteracoes_estoque)
+    if tem_alteracoes(alteracoes_produtos):
+        produtos_antes = st.session_state['df_produtos']
+        produtos_depois = aplicar_alteracoes(produtos_antes, alteracoes_produtos)
+        st.session_state['df_estoque'] = reconciliar_estoque(st.session_state['df_estoque'], produtos_antes, produtos_depois, alteracoes_produtos)
+        st.session_state['df_produtos'] = produtos_depois
+    marcar_para_replicacao(produtos_estoque=produtos_com_estoque_alterado(estoque_antes, st.session_state['df_estoque']))
+    # Os mínimos podem ter sido editados: o monitor é reconstruído (edições são raras, as vendas não)
+    st.session_state['monitor_estoque'].carregar(st.session_state['df_estoque'])
+    # Nova chave para os editores: as alterações já aplicadas não devem ser lidas outra vez
+    st.session_state['versao_editores'] = versao + 1
+    return True
+
+@metricas.cronometrado('documentos_das_vendas')
+def documentos_das_vendas(vendas):
+    """
+    NOVO: Garante que cada venda tem o seu XML no armazém fiscal, gerando apenas os que faltam.
+    Devolve (ids_com_documento, ids_com_erro).
+    """
+    armazem = st.session_state['armazem_fiscal']
+    produtos_por_nome = st.session_state['df_produtos'].set_index('Produto', drop=False)
+    ids, erros = [], []
+    for index, venda_info in vendas.iterrows():
+        if armazem.tem_documento(index):
+            # Documento já emitido: é servido como está, mesmo que o produto tenha mudado ou saído do cardápio
+            ids.append(str(index))
+        elif venda_info['Produto'] in produtos_por_nome.index:
+            produto_info = produtos_por_nome.loc[[venda_info['Produto']]].copy()
+            produto_info['Quantidade'] = venda_info['Quantidade']
+            armazem.obter_ou_gerar(venda_info, produto_info, st.session_state['config_empresa'], gerar_xml_nfc)
+            ids.append(str(index))
+        else:
+            erros.append(index)
+    armazem.salvar()
+    return ids, erros
+
+@metricas.cronometrado('carregar_indice_vendas')
+def carregar_indice_vendas():
+    """
+    NOVO: Abre o índice SQLite das vendas e indexa só as que ainda não estão nele.
+    """
+    indice = IndiceVendas(INDICE_VENDAS_FILE, st.session_state['indice_clientes'].chave)
+    ultimo_id_base = arquivo_vendas.proximo_id_venda(st.session_state['df_vendas'], ARQUIVO_DIR) - 1
+    if indice.ultimo_id() > ultimo_id_base:
+        # A base foi substituída: o índice aponta para vendas que já não existem
+        indice.reconstruir()
+    if indice.ultimo_id() < 0 and arquivo_vendas.total_linhas_arquivadas(ARQUIVO_DIR):
+        historico = arquivo_vendas.carregar_periodo(ARQUIVO_DIR, pd.Timestamp.min, pd.Timestamp.max)
+        indice.sincronizar(historico.sort_index())
+    indice.sincronizar(st.session_state['df_vendas'])
+    st.session_state['indice_vendas'] = indice
+
+def atualizar_indices_vendas(novas_vendas):
+    """NOVO: Acrescenta vendas novas aos índices de clientes e de vendas, sem reler a aba Vendas."""
+    indice_clientes = st.session_state['indice_clientes']
+    if indice_clientes.atualizar(novas_vendas, st.session_state['df_produtos']):
+        indice_clientes.salvar(CLIENTES_FILE)
+    st.session_state['indice_vendas'].sincronizar(novas_vendas)
+
+def obter_venda(venda_id):
+    """NOVO: Devolve a linha completa de uma venda, lendo do arquivo só se ela já não estiver no conjunto quente."""
+    if venda_id in st.session_state['df_vendas'].index:
+        return st.session_state['df_vendas'].loc[venda_id]
+    data_venda = st.session_state['indice_vendas'].data_da_venda(venda_id)
+    if data_venda is None:
+        return None
+    vendas_dia = arquivo_vendas.vendas_do_periodo(st.session_state['df_vendas'], ARQUIVO_DIR, data_venda.normalize(), data_venda.normalize() + timedelta(days=1))
+    return vendas_dia.loc[venda_id] if venda_id in vendas_dia.index else None
+
+def fontes_consulta_sql():
+    """NOVO: Tabelas da consola SQL. Cada uma só é lida (e o arquivo só é aberto) se a consulta a usar."""
+    def vendas_arquivadas():
+        return arquivo_vendas.carregar_periodo(ARQUIVO_DIR, pd.Timestamp.min, pd.Timestamp.max)
+
+    def vendas_historico():
+        return arquivo_vendas.vendas_do_periodo(st.session_state['df_vendas'], ARQUIVO_DIR, pd.Timestamp.min, pd.Timestamp.max)
+
+    return {
+        'vendas': lambda: st.session_state['df_vendas'].rename_axis('ID_Venda').reset_index(),
+        'vendas_arquivo': lambda: vendas_arquivadas().rename_axis('ID_Venda').reset_index(),
+        'vendas_historico': lambda: vendas_historico().rename_axis('ID_Venda').reset_index(),
+        'vendas_detalhadas': lambda: preparar_dados_analise(vendas_historico(), st.session_state['df_produtos']).reset_index(drop=True),
+        'cardapio': lambda: st.session_state['df_produtos'].copy(),
+        'estoque': lambda: st.session_state['df_estoque'].copy(),
+        'compras': lambda: st.session_state['df_compras'].copy(),
+    }
+
+@metricas.cronometrado('carregar_indice_clientes')
+def carregar_indice_clientes():
+    """
+    NOVO: Carrega o índice de clientes (CPF com hash) e indexa só as vendas que ainda não estão nele.
+    """
+    indice = IndiceClientes.carregar(CLIENTES_FILE, carregar_sal(SAL_FILE))
+    if indice.ultimo_id < 0 and arquivo_vendas.total_linhas_arquivadas(ARQUIVO_DIR):
+        historico = arquivo_vendas.carregar_periodo(ARQUIVO_DIR, pd.Timestamp.min, pd.Timestamp.max)
+        indice.atualizar(historico.sort_index(), st.session_state['df_produtos'])
+    if indice.atualizar(st.session_state['df_vendas'], st.session_state['df_produtos']):
+        indice.salvar(CLIENTES_FILE)
+    st.session_state['indice_clientes'] = indice
 
 if 'dados_carregados' not in st.session_state:
     carregar_dados_para_edicao()
+    carregar_indice_clientes()
+    carregar_indice_vendas()
+    # Um único armazém por processo: duas sessões a gravar o índice não apagam as entradas uma da outra
+    st.session_state['armazem_fiscal'] = obter_armazem(FISCAL_DIR)
+    st.session_state['cache_figuras'] = CacheFiguras()
+    st.session_state['console_sql'] = ConsoleSQL(fontes_consulta_sql())
+    # NOVO: Alertas de estoque baixo (aplicação, ficheiro e, se configurado, webhook)
+    notificadores = [NotificadorFicheiro(ALERTAS_FILE)]
+    if os.environ.get("GMASTER_WEBHOOK_ALERTAS"):
+        notificadores.append(NotificadorWebhook(os.environ["GMASTER_WEBHOOK_ALERTAS"]))
+    st.session_state['monitor_estoque'] = MonitorEstoque(notificadores)
+    st.session_state['monitor_estoque'].carregar(st.session_state['df_estoque'])
+    # NOVO: Cópias de segurança incrementais numa thread própria, fora do caminho das vendas
+    st.session_state['backup'] = backup.obter_agendador(BASE_DIR, BACKUP_DIR)
+    # NOVO: Servidor do quadro da cozinha (um por processo, partilhado pelas sessões)
+    st.session_state['porta_cozinha'] = cozinha.iniciar_servidor(int(os.environ.get("GMASTER_PORTA_COZINHA", cozinha.PORTA_PADRAO)))
+    if CENTRAL_URL:
+        st.session_state['replicacao'] = replicacao.obter_envio(REPLICACAO_FILE, CENTRAL_URL, os.environ.get("GMASTER_NO"))
     st.session_state['dados_carregados'] = True
 
+cache_figuras = st.session_state['cache_figuras']
+versao_dados = st.session_state.get('versao_dados', 0)
+
 st.title(f"🍕 {st.session_state['config_empresa'].get('nome_fantasia', 'GMaster')} - GMaster")
-tab_list = ["📊 Dashboard", "👑 Central de Desempenho", "💰 Registrar Venda", "📖 Cardápio", "📦 Estoque", "🛒 Compras", "🧾 Emissão Fiscal", "⚙️ Empresa"]
-tab_dashboard, tab_admin, tab_vendas, tab_cardapio, tab_estoque, tab_compras, tab_fiscal, tab_empresa = st.tabs(tab_list)
-
-def preparar_dados_analise(vendas_df, produtos_df):
-    if vendas_df.empty or produtos_df.empty:
-        return pd.DataFrame()
-    produtos_df_copy = produtos_df.copy()
-    vendas_df_copy = vendas_df.copy()
-    produtos_df_copy['Preco_Venda'] = pd.to_numeric(produtos_df_copy['Preco_Venda'], errors='coerce').fillna(0)
-    produtos_df_copy['Custo_Unitario'] = pd.to_numeric(produtos_df_copy['Custo_Unitario'], errors='coerce').fillna(0)
-    vendas_df_copy['Quantidade'] = pd.to_numeric(vendas_df_copy['Quantidade'], errors='coerce').fillna(0)
-    vendas_detalhadas = pd.merge(vendas_df_copy, produtos_df_copy, on='Produto', how='left')
-    vendas_validas = vendas_detalhadas[
-        (vendas_detalhadas['Preco_Venda'] > 0) &
-        (vendas_detalhadas['Custo_Unitario'] > 0)
-    ].copy()
-    if not vendas_validas.empty:
-        vendas_validas['Receita'] = vendas_validas['Quantidade'] * vendas_validas['Preco_Venda']
-        vendas_validas['Lucro'] = vendas_validas['Receita'] - (vendas_validas['Quantidade'] * vendas_validas['Custo_Unitario'])
-        vendas_validas['Data'] = pd.to_datetime(vendas_validas['Data'])
-        return vendas_validas
-    return pd.DataFrame()
+monitor_estoque = st.session_state['monitor_estoque']
+for alerta in monitor_estoque.retirar_alertas_app():
+    st.toast(f"Estoque baixo: {alerta['produto']} ({alerta['quantidade']:.0f} / mínimo {alerta['minimo']:.0f})", icon='⚠️')
+tab_list = ["📊 Dashboard", "👑 Central de Desempenho", "💰 Registrar Venda", "👨‍🍳 Cozinha", "⭐ Fidelidade", "📖 Cardápio", "📦 Estoque", "🛒 Compras", "🧾 Emissão Fiscal", "⚙️ Empresa"]
+tab_dashboard, tab_admin, tab_vendas, tab_cozinha, tab_fidelidade, tab_cardapio, tab_estoque, tab_compras, tab_fiscal, tab_empresa = st.tabs(tab_list)
 
 # --- Abas de Análise (ATUALIZADAS COM AVISOS) ---
 with tab_dashboard:
     st.header("Análise de Desempenho Rápida")
-    vendas_detalhadas_dash = preparar_dados_analise(st.session_state['df_vendas'], st.session_state['df_produtos'])
+    vendas_quentes = st.session_state['df_vendas']
+    vendas_detalhadas_dash = preparar_dados_analise(vendas_quentes, st.session_state['df_produtos'])
+    # NOVO: O início do histórico vem do manifesto do arquivo, sem abrir as partições
+    data_min_hist = arquivo_vendas.data_inicial_historico(ARQUIVO_DIR, vendas_quentes)
     
-    if vendas_detalhadas_dash.empty:
+    if data_min_hist is None or (vendas_detalhadas_dash.empty and not arquivo_vendas.total_linhas_arquivadas(ARQUIVO_DIR)):
         st.date_input("Data de Início", datetime.now().date(), key="dash_inicio_empty", disabled=True)
         st.date_input("Data de Fim", datetime.now().date(), key="dash_fim_empty", disabled=True)
         kpi1, kpi2, kpi3 = st.columns(3)
@@ -330,68 +324,192 @@ with tab_dashboard:
         else:
             st.warning("Ainda não há dados de vendas para análise. Registre uma venda e preencha o preço/custo no cardápio para começar.")
     else:
-        data_min_real = vendas_detalhadas_dash['Data'].min().date()
-        data_max_real = vendas_detalhadas_dash['Data'].max().date()
-        data_inicio = pd.to_datetime(st.date_input("Data de Início", data_min_real, min_value=data_min_real, max_value=data_max_real, key="dash_inicio"))
+        data_min_real = data_min_hist.date()
+        if vendas_detalhadas_dash.empty:
+            data_inicio_padrao = data_min_real
+            data_max_real = max(datetime.now().date(), data_min_real)
+        else:
+            # Por padrão o período cobre apenas o conjunto quente; o arquivo só é lido se o utilizador recuar a data
+            data_inicio_padrao = vendas_detalhadas_dash['Data'].min().date()
+            data_max_real = vendas_detalhadas_dash['Data'].max().date()
+        data_inicio = pd.to_datetime(st.date_input("Data de Início", data_inicio_padrao, min_value=data_min_real, max_value=data_max_real, key="dash_inicio"))
         data_fim = pd.to_datetime(st.date_input("Data de Fim", data_max_real, min_value=data_min_real, max_value=data_max_real, key="dash_fim")) + timedelta(days=1)
         
-        vendas_filtradas = vendas_detalhadas_dash[(vendas_detalhadas_dash['Data'] >= data_inicio) & (vendas_detalhadas_dash['Data'] < data_fim)]
+        periodo_so_quente = not vendas_detalhadas_dash.empty and data_inicio >= vendas_detalhadas_dash['Data'].min()
+        if periodo_so_quente:
+            vendas_filtradas = vendas_detalhadas_dash[(vendas_detalhadas_dash['Data'] >= data_inicio) & (vendas_detalhadas_dash['Data'] < data_fim)]
+        else:
+            vendas_periodo = arquivo_vendas.vendas_do_periodo(vendas_quentes, ARQUIVO_DIR, data_inicio, data_fim)
+            vendas_filtradas = preparar_dados_analise(vendas_periodo, st.session_state['df_produtos'])
+            if vendas_filtradas.empty:
+                vendas_filtradas = pd.DataFrame(columns=['Data', 'Produto', 'Quantidade', 'Categoria', 'Receita', 'Lucro'])
         
+        agregados = agregar_dashboard(vendas_filtradas)
         kpi1, kpi2, kpi3 = st.columns(3)
-        kpi1.metric("Receita Total", f"R$ {vendas_filtradas['Receita'].sum():.2f}")
-        kpi2.metric("Lucro Total", f"R$ {vendas_filtradas['Lucro'].sum():.2f}")
-        kpi3.metric("Total de Itens Vendidos", f"{int(vendas_filtradas['Quantidade'].sum())}")
+        kpi1.metric("Receita Total", f"R$ {agregados['receita']:.2f}")
+        kpi2.metric("Lucro Total", f"R$ {agregados['lucro']:.2f}")
+        kpi3.metric("Total de Itens Vendidos", f"{agregados['itens']}")
         
         if not vendas_filtradas.empty:
             g1, g2 = st.columns(2)
+            filtro_dash = (versao_dados, data_inicio, data_fim)
             with g1:
-                produtos_mais_vendidos = vendas_filtradas.groupby('Produto')['Quantidade'].sum().nlargest(5).sort_values(ascending=True)
-                fig_produtos = px.bar(produtos_mais_vendidos, x='Quantidade', y=produtos_mais_vendidos.index, orientation='h', title="🏆 Top 5 Produtos Mais Vendidos")
+                produtos_mais_vendidos = agregados['top_produtos']
+                fig_produtos = cache_figuras.obter(('dash_produtos',) + filtro_dash, lambda: px.bar(
+                    produtos_mais_vendidos, x='Quantidade', y=produtos_mais_vendidos.index, orientation='h', title="🏆 Top 5 Produtos Mais Vendidos"))
                 st.plotly_chart(fig_produtos, use_container_width=True)
             with g2:
-                vendas_categoria = vendas_filtradas.groupby('Categoria')['Receita'].sum().sort_values(ascending=True)
-                fig_categoria = px.pie(vendas_categoria, values='Receita', names=vendas_categoria.index, title="💰 Receita por Categoria", hole=0.4)
+                vendas_categoria = agregados['receita_categoria']
+                fig_categoria = cache_figuras.obter(('dash_categoria',) + filtro_dash, lambda: px.pie(
+                    vendas_categoria, values='Receita', names=vendas_categoria.index, title="💰 Receita por Categoria", hole=0.4))
                 st.plotly_chart(fig_categoria, use_container_width=True)
         else:
             st.info("Não há dados de vendas no período selecionado para exibir análises.")
 
 with tab_admin:
     st.header("👑 Central de Desempenho")
-    vendas_para_analise = preparar_dados_analise(st.session_state['df_vendas'], st.session_state['df_produtos'])
-    
-    if vendas_para_analise.empty:
-        if not st.session_state['df_vendas'].empty:
-            st.warning("📊 Você tem vendas registradas, mas elas não estão aparecendo nos gráficos! Verifique se os produtos vendidos têm 'Preço de Venda' e 'Custo Unitário' maiores que zero na aba 'Cardápio'.")
-        else:
-            st.warning("Os gráficos estão sendo exibidos com valores zerados porque não há vendas válidas registradas.")
-        vendas_para_analise = pd.DataFrame({'Data': [datetime.now()], 'Receita': [0], 'Categoria': ['Nenhuma'], 'Lucro': [0], 'Produto': ['Nenhum']})
+    lojas_configuradas = lojas.carregar_lojas(BASE_DIR, st.session_state['config_empresa'].get('nome_fantasia') or "Esta loja")
+    consolidado = bool(lojas_configuradas) and st.radio(
+        "Visão", ["Esta loja", f"Consolidado ({len(lojas_configuradas)} lojas)"], horizontal=True, key="admin_visao") != "Esta loja"
+    periodos_admin = {"Últimos 90 dias": 90, "Últimos 12 meses": 365, "Todo o histórico": None}
+    periodo_admin = st.selectbox("Período de Análise", list(periodos_admin), key="admin_periodo")
+    fim_admin = pd.Timestamp(datetime.now().date()) + timedelta(days=1)
+    if periodos_admin[periodo_admin] is None:
+        inicio_admin = arquivo_vendas.data_inicial_historico(ARQUIVO_DIR, st.session_state['df_vendas']) or fim_admin
+        if consolidado:
+            inicio_admin = pd.Timestamp("2000-01-01")  # O início de cada loja é resolvido pelo próprio arquivo
+    else:
+        inicio_admin = fim_admin - timedelta(days=periodos_admin[periodo_admin])
+
+    if consolidado:
+        # NOVO: Cada loja é agregada no seu processo; aqui só se juntam os totais
+        consolidacao = lojas.consolidar(lojas_configuradas, inicio_admin, fim_admin)
+        if periodos_admin[periodo_admin] is None and not consolidacao['diaria'].empty:
+            inicio_admin = consolidacao['diaria']['Data'].min()
+        for nome_loja, erro_loja in consolidacao['erros'].items():
+            st.error(f"Loja '{nome_loja}' não foi incluída: {erro_loja}")
+        por_loja = consolidacao['por_loja']
+        kpi1, kpi2, kpi3 = st.columns(3)
+        kpi1.metric("Receita Total (todas as lojas)", f"R$ {por_loja['Receita'].sum():.2f}")
+        kpi2.metric("Lucro Total (todas as lojas)", f"R$ {por_loja['Lucro'].sum():.2f}")
+        kpi3.metric("Itens Vendidos (todas as lojas)", f"{int(por_loja['Itens'].sum())}")
+        st.dataframe(por_loja.style.format({'Receita': "R$ {:.2f}", 'Lucro': "R$ {:.2f}"}), use_container_width=True)
+        base_receita, base_categoria, base_produto = consolidacao['diaria'], consolidacao['categoria'], consolidacao['produto']
+        if base_receita.empty:
+            st.warning("Nenhuma das lojas tem vendas válidas no período.")
+            base_receita = pd.DataFrame({'Data': [datetime.now()], 'Receita': [0], 'Lucro': [0]})
+            base_categoria = pd.DataFrame({'Categoria': ['Nenhuma'], 'Receita': [0]})
+            base_produto = pd.DataFrame({'Produto': ['Nenhum'], 'Lucro': [0]})
+    else:
+        vendas_admin = arquivo_vendas.vendas_do_periodo(st.session_state['df_vendas'], ARQUIVO_DIR, inicio_admin, fim_admin)
+        vendas_para_analise = preparar_dados_analise(vendas_admin, st.session_state['df_produtos'])
+
+        if vendas_para_analise.empty:
+            if not vendas_admin.empty:
+                st.warning("📊 Você tem vendas registradas, mas elas não estão aparecendo nos gráficos! Verifique se os produtos vendidos têm 'Preço de Venda' e 'Custo Unitário' maiores que zero na aba 'Cardápio'.")
+            else:
+                st.warning("Os gráficos estão sendo exibidos com valores zerados porque não há vendas válidas registradas.")
+            vendas_para_analise = pd.DataFrame({'Data': [datetime.now()], 'Receita': [0], 'Categoria': ['Nenhuma'], 'Lucro': [0], 'Produto': ['Nenhum']})
+        base_receita = base_categoria = base_produto = vendas_para_analise
 
-    vendas_para_analise['Dia_da_Semana'] = pd.to_datetime(vendas_para_analise['Data']).dt.day_name()
     st.subheader("Desempenho Geral")
+    # NOVO: Figuras em cache por versão dos dados e filtro; só são reconstruídas depois de gravar
+    if consolidado:
+        # Os dados das outras lojas não passam por salvar_dados: a chave usa os totais já agregados
+        filtro_admin = ('consolidado', periodo_admin, pd.Timestamp(inicio_admin).date(),
+                        tuple(map(tuple, por_loja.reset_index().values.tolist())))
+    else:
+        filtro_admin = (versao_dados, periodo_admin, pd.Timestamp(inicio_admin).date())
+
+    def grafico_categorias():
+        vendas_categoria = base_categoria.groupby('Categoria')['Receita'].sum().sort_values(ascending=False)
+        vendas_categoria = vendas_categoria[vendas_categoria.index.notna() & (vendas_categoria.index != '')]
+        return px.pie(vendas_categoria, values='Receita', names=vendas_categoria.index, title="🍕 Receita por Categoria", hole=0.4)
+
+    def grafico_dias_semana():
+        dias_ordem = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+        vendas_semama = base_receita.groupby(pd.to_datetime(base_receita['Data']).dt.day_name())['Receita'].sum().reindex(dias_ordem).fillna(0)
+        return px.bar(vendas_semama, x=vendas_semama.index, y='Receita', title="📅 Vendas por Dia da Semana", labels={'x':'Dia da Semana', 'Receita':'Receita Total (R$)'})
+
+    def grafico_top_lucro():
+        top_produtos_lucro = base_produto.groupby('Produto')['Lucro'].sum().nlargest(10).sort_values()
+        top_produtos_lucro = top_produtos_lucro[top_produtos_lucro.index.notna() & (top_produtos_lucro.index != '')]
+        return px.bar(top_produtos_lucro, x='Lucro', y=top_produtos_lucro.index, orientation='h', title="🏆 Top 10 Produtos por Lucro", labels={'Lucro':'Lucro Total (R$)', 'y':'Produto'})
+
     g1, g2 = st.columns(2)
     with g1:
-        vendas_dia = vendas_para_analise.groupby(pd.to_datetime(vendas_para_analise['Data']).dt.date)['Receita'].sum()
-        fig_dia = px.line(vendas_dia, x=vendas_dia.index, y='Receita', title="📈 Receita Diária", markers=True, labels={'x':'Data', 'Receita':'Receita (R$)'})
-        fig_dia.update_layout(yaxis_range=[0, max(1, vendas_dia.max() or 1)])
+        opcoes_granularidade = ["Automático"] + list(FREQUENCIAS)
+        granularidade = st.selectbox("Agrupar receita por", opcoes_granularidade, key="admin_granularidade")
+        if granularidade == "Automático":
+            granularidade = escolher_frequencia(inicio_admin, fim_admin)
+        fig_dia = cache_figuras.obter(('admin_receita', granularidade) + filtro_admin, lambda: figura_receita(base_receita, granularidade))
         st.plotly_chart(fig_dia, use_container_width=True)
     with g2:
-        vendas_categoria = vendas_para_analise.groupby('Categoria')['Receita'].sum().sort_values(ascending=False)
-        vendas_categoria = vendas_categoria[vendas_categoria.index.notna() & (vendas_categoria.index != '')]
-        fig_cat_pie = px.pie(vendas_categoria, values='Receita', names=vendas_categoria.index, title="🍕 Receita por Categoria", hole=0.4)
-        st.plotly_chart(fig_cat_pie, use_container_width=True)
+        st.plotly_chart(cache_figuras.obter(('admin_categoria',) + filtro_admin, grafico_categorias), use_container_width=True)
     st.divider()
     st.subheader("Análise de Produtos e Dias")
     g3, g4 = st.columns(2)
     with g3:
-        dias_ordem = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        vendas_semama = vendas_para_analise.groupby('Dia_da_Semana')['Receita'].sum().reindex(dias_ordem).fillna(0)
-        fig_semama = px.bar(vendas_semama, x=vendas_semama.index, y='Receita', title="📅 Vendas por Dia da Semana", labels={'x':'Dia da Semana', 'Receita':'Receita Total (R$)'})
-        st.plotly_chart(fig_semama, use_container_width=True)
+        st.plotly_chart(cache_figuras.obter(('admin_dias_semana',) + filtro_admin, grafico_dias_semana), use_container_width=True)
     with g4:
-        top_produtos_lucro = vendas_para_analise.groupby('Produto')['Lucro'].sum().nlargest(10).sort_values()
-        top_produtos_lucro = top_produtos_lucro[top_produtos_lucro.index.notna() & (top_produtos_lucro.index != '')]
-        fig_top_lucro = px.bar(top_produtos_lucro, x='Lucro', y=top_produtos_lucro.index, orientation='h', title="🏆 Top 10 Produtos por Lucro", labels={'Lucro':'Lucro Total (R$)', 'y':'Produto'})
-        st.plotly_chart(fig_top_lucro, use_container_width=True)
+        st.plotly_chart(cache_figuras.obter(('admin_top_lucro',) + filtro_admin, grafico_top_lucro), use_container_width=True)
+    st.divider()
+    st.subheader("📄 Relatórios Mensais (PDF)")
+    # NOVO: O PDF é gerado em segundo plano; meses fechados ficam guardados e não voltam a ser gerados
+    meses_relatorio = relatorios.meses_fechados(arquivo_vendas.data_inicial_historico(ARQUIVO_DIR, st.session_state['df_vendas']))
+    if not meses_relatorio:
+        st.info("Os relatórios ficam disponíveis quando houver um mês fechado com vendas.")
+    else:
+        mes_relatorio = st.selectbox("Mês do Relatório", meses_relatorio, key="relatorio_mes")
+        gerador = relatorios.obter_gerador(RELATORIOS_DIR)
+        # O resumo (leitura do arquivo e agregação do mês) só é montado no clique e fica guardado por
+        # (mês, versão dos dados): os reruns das vendas apenas consultam o estado do PDF
+        preparado = st.session_state.get('relatorio_preparado')
+        if preparado is not None and preparado['mes'] != mes_relatorio:
+            preparado = None
+        estado_relatorio = gerador.estado(preparado['resumo']) if preparado else None
+        if estado_relatorio == relatorios.ESTADO_PRONTO:
+            st.download_button(f"📥 Baixar Relatório de {mes_relatorio}", gerador.ler(preparado['resumo']), f"relatorio_{mes_relatorio}.pdf", "application/pdf")
+        elif estado_relatorio == relatorios.ESTADO_GERANDO:
+            st.info("O relatório está a ser gerado em segundo plano. Pode continuar a usar o sistema.")
+            st.button("🔄 Verificar Relatório")
+        elif estado_relatorio == relatorios.ESTADO_ERRO:
+            st.error(f"Não foi possível gerar o relatório: {gerador.erro(preparado['resumo'])}")
+        desatualizado = preparado is not None and preparado['versao'] != versao_dados
+        if estado_relatorio != relatorios.ESTADO_GERANDO and (preparado is None or desatualizado or estado_relatorio == relatorios.ESTADO_ERRO):
+            if desatualizado and estado_relatorio == relatorios.ESTADO_PRONTO:
+                st.caption("Os dados mudaram desde que o relatório foi preparado.")
+            if st.button("Atualizar Relatório" if preparado else "Gerar Relatório"):
+                inicio_mes, fim_mes = relatorios.limites_mes(mes_relatorio)
+                vendas_mes = preparar_dados_analise(
+                    arquivo_vendas.vendas_do_periodo(st.session_state['df_vendas'], ARQUIVO_DIR, inicio_mes, fim_mes),
+                    st.session_state['df_produtos'])
+                resumo_mes = relatorios.resumir_mes(mes_relatorio, vendas_mes, st.session_state['df_compras'], st.session_state['df_estoque'])
+                st.session_state['relatorio_preparado'] = {'mes': mes_relatorio, 'versao': versao_dados, 'resumo': resumo_mes}
+                # Se a assinatura não mudou, o PDF já existente é reaproveitado
+                if gerador.estado(resumo_mes) != relatorios.ESTADO_PRONTO:
+                    gerador.solicitar(resumo_mes, st.session_state['config_empresa'])
+                st.rerun()
+    st.divider()
+    with st.expander("🔎 Consulta SQL"):
+        # NOVO: Perguntas ad hoc sem exportar para Excel; só leitura, com tempo e linhas limitados
+        console_sql = st.session_state['console_sql']
+        st.caption(f"Motor: {console_sql.motor}. Tabelas: {', '.join(console_sql.fontes)}. "
+                   "As vendas arquivadas só são lidas se a consulta usar vendas_arquivo, vendas_historico ou vendas_detalhadas.")
+        texto_sql = st.text_area("Consulta (SELECT ou WITH)", value="SELECT Produto, SUM(Quantidade) AS Itens\nFROM vendas\nGROUP BY Produto\nORDER BY Itens DESC", height=140, key="sql_texto")
+        limite_sql = st.number_input("Máximo de linhas", min_value=1, max_value=100000, value=LIMITE_LINHAS, step=100, key="sql_limite")
+        if st.button("▶️ Executar Consulta"):
+            try:
+                resultado_sql, info_sql = console_sql.executar(texto_sql, versao_dados, int(limite_sql))
+            except ErroConsulta as erro:
+                st.error(f"Erro na consulta: {erro}")
+            else:
+                origem = "cache" if info_sql['em_cache'] else f"{info_sql['segundos']:.3f} s"
+                st.caption(f"{len(resultado_sql)} linha(s) · {origem}")
+                if info_sql['truncado']:
+                    st.warning(f"Resultado cortado nas primeiras {int(limite_sql)} linhas.")
+                st.dataframe(resultado_sql, use_container_width=True)
+                st.download_button("📥 Baixar Resultado (CSV)", resultado_sql.to_csv(index=False).encode('utf-8'), "consulta.csv", "text/csv")
 
 # --- Abas de Edição (sem alterações) ---
 with tab_vendas:
@@ -401,16 +519,26 @@ with tab_vendas:
         produto_vendido = st.selectbox("Selecione o Produto", options=produtos_disponiveis, key="venda_produto")
         quantidade_vendida = st.number_input("Quantidade", min_value=1, step=1, key="venda_qtde")
         cpf_cliente = st.text_input("CPF do Cliente (Opcional)", key="venda_cpf")
-        if st.button("Confirmar Venda"):
+        cpf_invalido = bool(cpf_cliente.strip()) and normalizar_cpf(cpf_cliente) is None
+        if cpf_invalido:
+            st.error("CPF inválido: confira os dígitos ou deixe o campo vazio.")
+        if st.button("Confirmar Venda", disabled=cpf_invalido):
             idx_estoque_list = st.session_state['df_estoque'].index[st.session_state['df_estoque']['Produto'] == produto_vendido].tolist()
             if idx_estoque_list:
                 idx_estoque = idx_estoque_list[0]
                 estoque_atual = st.session_state['df_estoque'].loc[idx_estoque, 'Quantidade_Estoque']
                 if estoque_atual >= quantidade_vendida:
-                    st.session_state['df_estoque'].loc[idx_estoque, 'Quantidade_Estoque'] -= quantidade_vendida
-                    nova_venda = pd.DataFrame([{'Data': datetime.now(), 'Produto': produto_vendido, 'Quantidade': quantidade_vendida, 'CPF_Cliente': cpf_cliente}])
-                    st.session_state['df_vendas'] = pd.concat([st.session_state['df_vendas'], nova_venda], ignore_index=True)
-                    salvar_dados(st.session_state['config_empresa'], st.session_state['df_produtos'], st.session_state['df_estoque'], st.session_state['df_vendas'], st.session_state['df_compras'])
+                    with metricas.medir('registrar_venda'):
+                        st.session_state['df_estoque'].loc[idx_estoque, 'Quantidade_Estoque'] -= quantidade_vendida
+                        monitor_estoque.atualizar(produto_vendido, st.session_state['df_estoque'].loc[idx_estoque, 'Quantidade_Estoque'])
+                        id_venda = arquivo_vendas.proximo_id_venda(st.session_state['df_vendas'], ARQUIVO_DIR)
+                        nova_venda = pd.DataFrame([{'Data': datetime.now(), 'Produto': produto_vendido, 'Quantidade': quantidade_vendida, 'CPF_Cliente': cpf_cliente}], index=pd.Index([id_venda], name='ID_Venda'))
+                        st.session_state['df_vendas'] = pd.concat([st.session_state['df_vendas'], nova_venda])
+                        marcar_para_replicacao(nova_venda, [produto_vendido])
+                        salvar_dados(st.session_state['config_empresa'], st.session_state['df_produtos'], st.session_state['df_estoque'], st.session_state['df_vendas'], st.session_state['df_compras'])
+                        atualizar_indices_vendas(nova_venda)
+                        cozinha.obter_canal().publicar_pedido(id_venda, produto_vendido, quantidade_vendida, nova_venda['Data'].iloc[0])
+                    metricas.contar('vendas_registradas')
                     st.success("Venda registrada e salva com sucesso!")
                     time.sleep(1)
                     st.rerun()
@@ -421,30 +549,197 @@ with tab_vendas:
     else:
         st.warning("Adicione produtos no Cardápio para registrar vendas.")
 
+    st.divider()
+    with st.expander("📥 Importar Vendas em Lote (delivery / PDV)"):
+        st.info("Importe exportações em CSV ou Excel. O ficheiro é processado em blocos; pedidos já importados da mesma origem são ignorados.")
+        arquivo_importacao = st.file_uploader("Ficheiro de Vendas", type=["csv", "txt", "xlsx"], key="importacao_arquivo")
+        origem_importacao = st.text_input("Origem (ex.: iFood, PDV antigo)", value="Importação", key="importacao_origem")
+        if arquivo_importacao is not None:
+            colunas_arquivo = importacao.ler_cabecalho(arquivo_importacao, arquivo_importacao.name)
+            mapeamento_sugerido = importacao.detectar_mapeamento(colunas_arquivo)
+            st.write("Correspondência de colunas:")
+            opcoes_colunas = ["(nenhuma)"] + colunas_arquivo
+            mapeamento = {}
+            colunas_mapa = st.columns(len(mapeamento_sugerido))
+            for coluna_ui, (campo, sugerida) in zip(colunas_mapa, mapeamento_sugerido.items()):
+                escolhida = coluna_ui.selectbox(campo, opcoes_colunas, index=opcoes_colunas.index(sugerida) if sugerida else 0, key=f"importacao_mapa_{campo}")
+                mapeamento[campo] = None if escolhida == "(nenhuma)" else escolhida
+            abater_estoque = st.checkbox("Abater as quantidades importadas do estoque", value=True, key="importacao_estoque")
+            faltando = [campo for campo in importacao.CAMPOS_OBRIGATORIOS if not mapeamento[campo]]
+            if faltando:
+                st.warning(f"Indique as colunas obrigatórias: {', '.join(faltando)}.")
+            elif st.button("Importar Vendas"):
+                registro_importacoes = importacao.RegistroImportacoes(IMPORTACOES_FILE)
+                origem = origem_importacao.strip() or "Importação"
+                lotes_importacao = importacao.importar_vendas(
+                    importacao.ler_em_blocos(arquivo_importacao, arquivo_importacao.name), mapeamento,
+                    st.session_state['df_produtos'], registro_importacoes, origem,
+                    arquivo_vendas.proximo_id_venda(st.session_state['df_vendas'], ARQUIVO_DIR)
+                )
+                resultado = {'importadas': 0, 'lidas': 0, 'duplicadas': 0, 'rejeitadas': {}, 'ajustes_estoque': {}}
+                progresso_importacao = st.empty()
+                pendentes = {'vendas': [], 'ids_externos': [], 'blocos': 0}
+
+                def gravar_importacao():
+                    # Uma só gravação da base para vários blocos; os IDs externos só são registados depois dela
+                    salvar_dados(st.session_state['config_empresa'], st.session_state['df_produtos'], st.session_state['df_estoque'], st.session_state['df_vendas'], st.session_state['df_compras'], notificar=False)
+                    registro_importacoes.registrar(origem, pendentes['ids_externos'])
+                    atualizar_indices_vendas(pd.concat(pendentes['vendas']))
+                    resultado['importadas'] += sum(len(v) for v in pendentes['vendas'])
+                    pendentes.update(vendas=[], ids_externos=[], blocos=0)
+                    progresso_importacao.caption(f"{resultado['importadas']} venda(s) gravada(s) de {resultado['lidas']} linha(s) lidas...")
+
+                # Os meses fechados vão para o arquivo bloco a bloco e ficam registados logo; o resto
+                # é gravado a cada BLOCOS_POR_GRAVACAO blocos. Repetir uma importação interrompida
+                # salta pelo ID externo tudo o que já estava gravado
+                for lote in lotes_importacao:
+                    resultado['lidas'] += lote['lidas']
+                    resultado['duplicadas'] += lote['duplicadas']
+                    for motivo, total in lote['rejeitadas'].items():
+                        resultado['rejeitadas'][motivo] = resultado['rejeitadas'].get(motivo, 0) + total
+                    vendas_importadas = lote['vendas']
+                    if vendas_importadas.empty:
+                        continue
+                    if abater_estoque:
+                        st.session_state['df_estoque'] = importacao.aplicar_ajustes_estoque(st.session_state['df_estoque'], lote['ajustes_estoque'])
+                        monitor_estoque.atualizar_varios(st.session_state['df_estoque'], lote['ajustes_estoque'])
+                        for produto, total in lote['ajustes_estoque'].items():
+                            resultado['ajustes_estoque'][produto] = resultado['ajustes_estoque'].get(produto, 0) + total
+                    marcar_para_replicacao(vendas_importadas, lote['ajustes_estoque'] if abater_estoque else ())
+                    st.session_state['df_vendas'], meses_arquivados = arquivo_vendas.arquivar_meses_fechados(
+                        pd.concat([st.session_state['df_vendas'], vendas_importadas]), ARQUIVO_DIR)
+                    if meses_arquivados:
+                        arquivadas = set(vendas_importadas.index.difference(st.session_state['df_vendas'].index))
+                        registro_importacoes.registrar(origem, [par for par in lote['ids_externos'] if par[1] in arquivadas])
+                        lote['ids_externos'] = [par for par in lote['ids_externos'] if par[1] not in arquivadas]
+                    pendentes['vendas'].append(vendas_importadas)
+                    pendentes['ids_externos'].extend(lote['ids_externos'])
+                    pendentes['blocos'] += 1
+                    if pendentes['blocos'] >= importacao.BLOCOS_POR_GRAVACAO:
+                        gravar_importacao()
+                if pendentes['vendas']:
+                    gravar_importacao()
+                st.success(f"{resultado['importadas']} de {resultado['lidas']} linha(s) importada(s). {resultado['duplicadas']} já tinham sido importadas.")
+                if resultado['rejeitadas']:
+                    st.warning("Linhas rejeitadas: " + ", ".join(f"{motivo}: {total}" for motivo, total in resultado['rejeitadas'].items()))
+                if abater_estoque and resultado['ajustes_estoque']:
+                    negativos = st.session_state['df_estoque'][st.session_state['df_estoque']['Quantidade_Estoque'] < 0]['Produto'].tolist()
+                    if negativos:
+                        st.warning(f"Estoque negativo após a importação: {', '.join(negativos)}. Ajuste na aba Estoque.")
+
+with tab_cozinha:
+    st.header("👨‍🍳 Quadro da Cozinha")
+    porta_cozinha = st.session_state.get('porta_cozinha')
+    if porta_cozinha is None:
+        st.error("Não foi possível iniciar o quadro da cozinha: a porta está ocupada. Defina outra em GMASTER_PORTA_COZINHA.")
+    else:
+        # O quadro recebe os pedidos por SSE diretamente do servidor da cozinha; esta aba não precisa de rerun
+        cabecalhos = getattr(getattr(st, 'context', None), 'headers', None) or {}
+        host_cozinha = cabecalhos.get('Host', 'localhost').split(':')[0]
+        url_cozinha = f"http://{host_cozinha}:{porta_cozinha}/"
+        st.info(f"Os pedidos aparecem aqui assim que a venda é confirmada. Nos ecrãs da cozinha, abra {url_cozinha}")
+        components.iframe(url_cozinha, height=650, scrolling=True)
+
+with tab_fidelidade:
+    st.header("⭐ Fidelidade de Clientes")
+    st.info("Clientes identificados pelo CPF informado na venda. O CPF é guardado apenas como hash; a tabela mostra-o mascarado.")
+    indice_clientes = st.session_state['indice_clientes']
+    rfm = indice_clientes.calcular_rfm()
+    if rfm.empty:
+        st.warning("Ainda não há vendas com CPF do cliente. Informe o CPF ao registrar uma venda para acompanhar a fidelidade.")
+    else:
+        k1, k2, k3 = st.columns(3)
+        k1.metric("Clientes Identificados", f"{len(rfm)}")
+        k2.metric("Clientes Recorrentes", f"{int((rfm['Frequencia'] > 1).sum())}")
+        k3.metric("Ticket Médio por Cliente", f"R$ {rfm['Valor'].mean():.2f}")
+        segmentos = rfm['Segmento'].value_counts()
+        fig_segmentos = px.bar(segmentos, x=segmentos.index, y=segmentos.values, title="👥 Clientes por Segmento", labels={'x': 'Segmento', 'y': 'Clientes'})
+        st.plotly_chart(fig_segmentos, use_container_width=True)
+        st.dataframe(rfm.drop(columns=['Cliente']), use_container_width=True)
+    st.divider()
+    st.subheader("Consultar Cliente")
+    cpf_consulta = st.text_input("CPF do Cliente", key="fidelidade_cpf")
+    if cpf_consulta:
+        cliente = indice_clientes.buscar(cpf_consulta)
+        if normalizar_cpf(cpf_consulta) is None:
+            st.error("CPF inválido: confira os dígitos.")
+        elif cliente is None:
+            st.warning("Nenhuma compra encontrada para este CPF.")
+        else:
+            c1, c2, c3 = st.columns(3)
+            c1.metric("Compras", f"{cliente['frequencia']}")
+            c2.metric("Valor Total", f"R$ {cliente['valor']:.2f}")
+            c3.metric("Última Compra", pd.to_datetime(cliente['ultima'], unit='s').strftime('%d/%m/%Y'))
+            # Lê do arquivo apenas os meses entre a primeira e a última compra do cliente
+            vendas_cliente = arquivo_vendas.vendas_do_periodo(
+                st.session_state['df_vendas'], ARQUIVO_DIR,
+                pd.to_datetime(cliente['primeira'], unit='s'), pd.to_datetime(cliente['ultima'], unit='s') + timedelta(seconds=1)
+            )
+            vendas_cliente = vendas_cliente[vendas_cliente.index.isin(cliente['vendas'])]
+            st.dataframe(vendas_cliente.drop(columns=['CPF_Cliente'], errors='ignore'))
+
 with tab_cardapio:
     st.header("📖 Gerenciar Cardápio")
     st.info("Clique duas vezes numa célula para editar. Adicione ou remova linhas usando os botões `+` e `x`. Salve as alterações no botão abaixo.")
-    st.session_state['df_produtos'] = st.data_editor(st.session_state['df_produtos'], num_rows="dynamic", key="editor_produtos")
+    versao_editores = st.session_state.get('versao_editores', 0)
+    st.data_editor(st.session_state['df_produtos'], num_rows="dynamic", key=f"editor_produtos_{versao_editores}")
     if st.button("Salvar Alterações no Cardápio"):
-        salvar_dados(st.session_state['config_empresa'], st.session_state['df_produtos'], st.session_state['df_estoque'], st.session_state['df_vendas'], st.session_state['df_compras'])
-        time.sleep(1)
-        st.rerun()
+        if aplicar_edicoes_pendentes():
+            salvar_dados(st.session_state['config_empresa'], st.session_state['df_produtos'], st.session_state['df_estoque'], st.session_state['df_vendas'], st.session_state['df_compras'])
+            time.sleep(1)
+            st.rerun()
+        else:
+            st.info("Nenhuma alteração para salvar.")
+    with st.expander("🧪 Simulador de Preços"):
+        # NOVO: Projeta receita e lucro de centenas de cenários de preço/custo sobre as vendas reais do período
+        periodos_simulacao = {"Últimos 30 dias": 30, "Últimos 90 dias": 90, "Últimos 12 meses": 365}
+        # Os expanders correm em cada interação: a base só é montada com o simulador aberto e
+        # fica guardada até mudarem o período, o dia ou os dados
+        if st.toggle("Abrir simulador", key="simulacao_aberto"):
+            periodo_simulacao = st.selectbox("Vendas de Referência", list(periodos_simulacao), index=1, key="simulacao_periodo")
+            fim_simulacao = pd.Timestamp(datetime.now().date()) + timedelta(days=1)
+            chave_simulacao = (periodo_simulacao, fim_simulacao, versao_dados)
+            guardada = st.session_state.get('simulacao_base')
+            if guardada is None or guardada['chave'] != chave_simulacao:
+                vendas_simulacao = preparar_dados_analise(
+                    arquivo_vendas.vendas_do_periodo(st.session_state['df_vendas'], ARQUIVO_DIR, fim_simulacao - timedelta(days=periodos_simulacao[periodo_simulacao]), fim_simulacao),
+                    st.session_state['df_produtos'])
+                guardada = {'chave': chave_simulacao, 'base': simulacao_precos.preparar_base(vendas_simulacao)}
+                st.session_state['simulacao_base'] = guardada
+            base_simulacao = guardada['base']
+            if base_simulacao is None:
+                st.info("Não há vendas com preço e custo válidos no período para simular.")
+            else:
+                categorias_simulacao = sorted(set(base_simulacao.categorias) - {''})
+                categoria_simulacao = st.selectbox("Aplicar a", ["Todo o cardápio"] + categorias_simulacao, key="simulacao_categoria")
+                s1, s2, s3 = st.columns(3)
+                faixa_preco = s1.slider("Variação de Preço (%)", -50, 50, (-20, 20), key="simulacao_faixa_preco")
+                faixa_custo = s2.slider("Variação de Custo (%)", -30, 30, (0, 0), step=5, key="simulacao_faixa_custo")
+                elasticidade = s3.number_input("Elasticidade da Procura", min_value=-5.0, max_value=0.0, value=0.0, step=0.1, key="simulacao_elasticidade",
+                                               help="0 mantém as quantidades históricas; -1 faz uma subida de 10% no preço vender cerca de 9% menos.")
+                afetados = None if categoria_simulacao == "Todo o cardápio" else base_simulacao.categorias == categoria_simulacao
+                nomes_cenarios, precos_cenarios, custos_cenarios = simulacao_precos.gerar_cenarios(
+                    base_simulacao, range(faixa_preco[0], faixa_preco[1] + 1), range(faixa_custo[0], faixa_custo[1] + 1, 5), afetados)
+                ranking = simulacao_precos.simular(base_simulacao, nomes_cenarios, precos_cenarios, custos_cenarios, elasticidade)
+                st.caption(f"{len(ranking)} cenários avaliados sobre {len(base_simulacao.produtos)} produtos e {len(base_simulacao.dias)} dias de vendas.")
+                st.dataframe(ranking.head(20), use_container_width=True)
+                cenario_escolhido = st.selectbox("Ver Preços do Cenário", ranking['Cenario'].head(20), key="simulacao_cenario")
+                posicao = nomes_cenarios.index(cenario_escolhido)
+                st.dataframe(simulacao_precos.precos_do_cenario(base_simulacao, precos_cenarios[posicao], custos_cenarios[posicao]), use_container_width=True)
 
 with tab_estoque:
     st.header("📦 Controlar Estoque")
-    produtos_no_cardapio = st.session_state['df_produtos']['Produto'].unique()
-    estoque_atual_df = st.session_state['df_estoque']
-    estoque_sincronizado = estoque_atual_df[estoque_atual_df['Produto'].isin(produtos_no_cardapio)].copy()
-    novos_produtos = [p for p in produtos_no_cardapio if p not in estoque_sincronizado['Produto'].values]
-    if novos_produtos:
-        novos_estoque_df = pd.DataFrame({'Produto': novos_produtos, 'Quantidade_Estoque': [0]*len(novos_produtos)})
-        estoque_sincronizado = pd.concat([estoque_sincronizado, novos_estoque_df], ignore_index=True)
-    st.info("A lista de produtos é sincronizada com o Cardápio. Apenas a quantidade pode ser editada aqui. Salve as alterações no botão abaixo.")
-    st.session_state['df_estoque'] = st.data_editor(estoque_sincronizado, disabled=['Produto'], key="editor_estoque")
+    st.info("A lista de produtos é sincronizada com o Cardápio. Apenas a quantidade e o estoque mínimo podem ser editados aqui. Salve as alterações no botão abaixo.")
+    if monitor_estoque.sugestoes:
+        st.warning(f"Abaixo do mínimo: {', '.join(sorted(monitor_estoque.sugestoes))}. Veja as sugestões de reposição na aba Compras.")
+    st.data_editor(st.session_state['df_estoque'], disabled=['Produto'], key=f"editor_estoque_{versao_editores}")
     if st.button("Salvar Alterações no Estoque"):
-        salvar_dados(st.session_state['config_empresa'], st.session_state['df_produtos'], st.session_state['df_estoque'], st.session_state['df_vendas'], st.session_state['df_compras'])
-        time.sleep(1)
-        st.rerun()
+        if aplicar_edicoes_pendentes():
+            salvar_dados(st.session_state['config_empresa'], st.session_state['df_produtos'], st.session_state['df_estoque'], st.session_state['df_vendas'], st.session_state['df_compras'])
+            time.sleep(1)
+            st.rerun()
+        else:
+            st.info("Nenhuma alteração para salvar.")
 
 with tab_compras:
     st.header("🛒 Registrar Compras e Despesas")
@@ -465,26 +760,95 @@ with tab_compras:
                 salvar_dados(st.session_state['config_empresa'], st.session_state['df_produtos'], st.session_state['df_estoque'], st.session_state['df_vendas'], st.session_state['df_compras'])
                 st.rerun()
     st.divider()
+    st.subheader("🔁 Sugestões de Reposição")
+    sugestoes = monitor_estoque.tabela_sugestoes()
+    if sugestoes.empty:
+        st.info("Nenhum produto abaixo do estoque mínimo. Defina os mínimos na aba Estoque.")
+    else:
+        st.caption("Ajuste as quantidades sugeridas (0 para ignorar) e gere as compras de uma só vez. O valor usa o custo unitário do Cardápio.")
+        sugestoes_editadas = st.data_editor(sugestoes, disabled=['Produto', 'Atual', 'Minimo'], hide_index=True, key="editor_sugestoes")
+        fornecedor_reposicao = st.text_input("Fornecedor da Reposição (Opcional)", key="reposicao_fornecedor")
+        entrada_reposicao = st.checkbox("Dar entrada das quantidades no estoque", value=True, key="reposicao_entrada")
+        if st.button("Gerar Compras das Sugestões"):
+            compras_reposicao = compras_de_reposicao(sugestoes_editadas, st.session_state['df_produtos'], pd.Timestamp(datetime.now().date()), fornecedor_reposicao)
+            if compras_reposicao.empty:
+                st.info("Nenhuma quantidade maior que zero.")
+            else:
+                st.session_state['df_compras'] = pd.concat([st.session_state['df_compras'], compras_reposicao], ignore_index=True)
+                if entrada_reposicao:
+                    quantidades_reposicao = pd.to_numeric(sugestoes_editadas['Sugerido'], errors='coerce').fillna(0)
+                    entradas_reposicao = {p: -q for p, q in zip(sugestoes_editadas['Produto'], quantidades_reposicao) if q > 0}
+                    st.session_state['df_estoque'] = importacao.aplicar_ajustes_estoque(st.session_state['df_estoque'], entradas_reposicao)
+                    monitor_estoque.atualizar_varios(st.session_state['df_estoque'], entradas_reposicao)
+                    marcar_para_replicacao(produtos_estoque=entradas_reposicao)
+                salvar_dados(st.session_state['config_empresa'], st.session_state['df_produtos'], st.session_state['df_estoque'], st.session_state['df_vendas'], st.session_state['df_compras'])
+                st.success(f"{len(compras_reposicao)} compra(s) de reposição registada(s).")
+                time.sleep(1)
+                st.rerun()
+    st.divider()
+    with st.expander("📥 Importar NF-e de Fornecedores (XML)"):
+        st.info("Envie os XML das notas fiscais dos fornecedores, soltos ou num ficheiro ZIP. Cada item entra como uma compra; notas já importadas (pela chave de acesso) são ignoradas.")
+        arquivos_nfe = st.file_uploader("XML ou ZIP das NF-e", type=["xml", "zip"], accept_multiple_files=True, key="nfe_arquivos")
+        somar_estoque_nfe = st.checkbox("Somar ao estoque os itens com o mesmo nome de um produto do Estoque", value=True, key="nfe_estoque")
+        if arquivos_nfe and st.button("Importar NF-e"):
+            registro_nfe = RegistroNFe(IMPORTACOES_FILE)
+            resultado_nfe = importar_nfe(arquivos_nfe, registro_nfe, st.session_state['df_estoque'])
+            if resultado_nfe['notas']:
+                st.session_state['df_compras'] = pd.concat([st.session_state['df_compras'], resultado_nfe['compras']], ignore_index=True)
+                if somar_estoque_nfe and resultado_nfe['ajustes_estoque']:
+                    entradas = {produto: -quantidade for produto, quantidade in resultado_nfe['ajustes_estoque'].items()}
+                    st.session_state['df_estoque'] = importacao.aplicar_ajustes_estoque(st.session_state['df_estoque'], entradas)
+                    marcar_para_replicacao(produtos_estoque=entradas)
+                    monitor_estoque.atualizar_varios(st.session_state['df_estoque'], entradas)
+                salvar_dados(st.session_state['config_empresa'], st.session_state['df_produtos'], st.session_state['df_estoque'], st.session_state['df_vendas'], st.session_state['df_compras'])
+                # As chaves só são registadas depois de a base estar gravada
+                registro_nfe.registrar(resultado_nfe['notas'])
+                total_notas = sum(nota['total'] for nota in resultado_nfe['notas'])
+                st.success(f"{len(resultado_nfe['notas'])} nota(s) importada(s): {len(resultado_nfe['compras'])} linha(s) de compra, total de R$ {total_notas:.2f}.")
+            if resultado_nfe['duplicadas']:
+                st.info(f"{resultado_nfe['duplicadas']} nota(s) já tinham sido importadas e foram ignoradas.")
+            if resultado_nfe['invalidas']:
+                st.warning(f"Ficheiros que não são NF-e válidas: {', '.join(resultado_nfe['invalidas'])}")
     st.subheader("Histórico de Compras Recentes")
     st.dataframe(st.session_state['df_compras'].tail(10))
 
 with tab_fiscal:
     st.header("🧾 Emissão Fiscal")
-    st.info("Selecione uma venda para gerar o arquivo XML individual.")
-    vendas_df_fiscal = st.session_state['df_vendas'].copy()
-    if not vendas_df_fiscal.empty:
-        vendas_df_fiscal['Data'] = pd.to_datetime(vendas_df_fiscal['Data'])
-        # Ordenar por data para mostrar as mais recentes primeiro
-        vendas_recentes = vendas_df_fiscal.sort_values(by='Data', ascending=False).head(20)
-        
-        vendas_recentes['display'] = vendas_recentes.apply(lambda row: f"ID {row.name} - {row['Produto']} ({int(row['Quantidade']) if pd.notna(row['Quantidade']) else 0}x) - {row['Data'].strftime('%d/%m/%Y %H:%M')}", axis=1)
-        
-        venda_selecionada_display = st.selectbox("Selecione uma Venda Recente", options=vendas_recentes['display'])
-        
-        if venda_selecionada_display:
-            venda_id = int(venda_selecionada_display.split(" ")[1])
-            venda_info = vendas_df_fiscal.loc[venda_id]
-            
+    st.info("Pesquise uma venda e selecione-a para gerar o arquivo XML individual.")
+    # NOVO: Pesquisa paginada sobre o índice de vendas; só a página visível é carregada
+    indice_vendas = st.session_state['indice_vendas']
+    hoje_fiscal = datetime.now().date()
+    f1, f2, f3, f4 = st.columns(4)
+    periodo_fiscal = f1.date_input("Período", (hoje_fiscal - timedelta(days=7), hoje_fiscal), key="fiscal_periodo")
+    produto_fiscal = f2.selectbox("Produto", ["Todos"] + st.session_state['df_produtos']['Produto'].dropna().tolist(), key="fiscal_produto")
+    cpf_fiscal = f3.text_input("CPF do Cliente", key="fiscal_cpf")
+    id_fiscal = f4.text_input("ID da Venda", key="fiscal_id")
+    if id_fiscal.strip().isdigit():
+        filtros_fiscal = {'venda_id': int(id_fiscal.strip())}
+    else:
+        periodo_fiscal = periodo_fiscal if isinstance(periodo_fiscal, (tuple, list)) else (periodo_fiscal,)
+        filtros_fiscal = {
+            'inicio': periodo_fiscal[0] if periodo_fiscal else None,
+            'fim': pd.Timestamp(periodo_fiscal[-1]) + timedelta(days=1) if periodo_fiscal else None,
+            'produto': None if produto_fiscal == "Todos" else produto_fiscal,
+            'cpf': cpf_fiscal or None,
+        }
+    por_pagina = 20
+    total_encontradas = indice_vendas.contar(**filtros_fiscal)
+    total_paginas = max(1, -(-total_encontradas // por_pagina))
+    pagina_fiscal = st.number_input(f"Página (de {total_paginas})", min_value=1, max_value=total_paginas, value=1, step=1, key="fiscal_pagina")
+    vendas_pagina = indice_vendas.buscar(pagina=pagina_fiscal, por_pagina=por_pagina, **filtros_fiscal)
+
+    if not vendas_pagina.empty:
+        st.caption(f"{total_encontradas} venda(s) encontrada(s).")
+        venda_id = st.selectbox(
+            "Selecione uma Venda",
+            options=vendas_pagina.index.tolist(),
+            format_func=lambda i: f"ID {i} - {vendas_pagina.at[i, 'Produto']} ({int(vendas_pagina.at[i, 'Quantidade'])}x) - {vendas_pagina.at[i, 'Data'].strftime('%d/%m/%Y %H:%M')}"
+        )
+        venda_info = obter_venda(venda_id) if venda_id is not None else None
+
+        if venda_info is not None:
             # O produto é pego do cardápio usando o nome salvo na venda
             produto_info_venda = st.session_state['df_produtos'][st.session_state['df_produtos']['Produto'] == venda_info['Produto']].copy()
             
@@ -495,8 +859,20 @@ with tab_fiscal:
                 st.write("Detalhes da Venda Selecionada:")
                 st.dataframe(pd.DataFrame([venda_info]))
                 
+                armazem = st.session_state['armazem_fiscal']
+                if armazem.desatualizado(venda_info, produto_info_venda, st.session_state['config_empresa']):
+                    # O documento emitido não é alterado em silêncio: uma nova versão tem de ser pedida
+                    if armazem.documentos[str(venda_id)]['estado'] == ESTADO_EXPORTADO:
+                        st.info("Os dados desta venda mudaram depois da emissão, mas o XML já foi exportado e é mantido como foi emitido.")
+                    else:
+                        st.warning("Os dados desta venda (por exemplo, o preço) mudaram depois da emissão do XML.")
+                        if st.button("Emitir Nova Versão do XML"):
+                            armazem.nova_versao(venda_info, produto_info_venda, st.session_state['config_empresa'], gerar_xml_nfc)
+                            armazem.salvar()
+                            st.success("Nova versão emitida; a anterior fica no histórico do armazém fiscal.")
                 if st.button("Gerar XML da NFC-e"):
-                    xml_data = gerar_xml_nfc(venda_info, produto_info_venda)
+                    xml_data = armazem.obter_ou_gerar(venda_info, produto_info_venda, st.session_state['config_empresa'], gerar_xml_nfc)
+                    armazem.salvar()
                     st.download_button(
                         label="Baixar XML para Emissão",
                         data=xml_data,
@@ -505,39 +881,84 @@ with tab_fiscal:
                     )
             else:
                 st.error(f"Produto '{venda_info['Produto']}' associado a esta venda não foi encontrado no cardápio atual. Verifique o nome do produto.")
-    else:
+    elif indice_vendas.ultimo_id() < 0:
         st.warning("Nenhuma venda registrada para gerar XML.")
+    else:
+        st.warning("Nenhuma venda encontrada com os filtros selecionados.")
     st.divider()
     st.header("Emissão em Lote")
     if st.button("Gerar Todos os XMLs do Dia"):
         hoje = datetime.now().date()
-        vendas_df_fiscal['Data'] = pd.to_datetime(vendas_df_fiscal['Data'])
-        vendas_do_dia = vendas_df_fiscal[(vendas_df_fiscal['Data'].dt.date == hoje)]
+        vendas_df_fiscal = st.session_state['df_vendas']
+        vendas_do_dia = vendas_df_fiscal[pd.to_datetime(vendas_df_fiscal['Data']).dt.date == hoje]
         if vendas_do_dia.empty:
             st.warning("Nenhuma venda registrada hoje para gerar os XMLs.")
         else:
-            zip_buffer = BytesIO()
-            erros_geracao = []
-            with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_DEFLATED, False) as zip_file:
-                for index, venda_info in vendas_do_dia.iterrows():
-                    produto_info = st.session_state['df_produtos'][st.session_state['df_produtos']['Produto'] == venda_info['Produto']].copy()
-                    if not produto_info.empty:
-                        produto_info['Quantidade'] = venda_info['Quantidade']
-                        xml_data = gerar_xml_nfc(venda_info, produto_info)
-                        zip_file.writestr(f"nfce_{index}.xml", xml_data)
-                    else:
-                        erros_geracao.append(index)
+            with metricas.medir('gerar_xml_lote_dia'):
+                # Os XMLs já emitidos e inalterados vêm direto do armazém fiscal
+                ids_gerados, erros_geracao = documentos_das_vendas(vendas_do_dia)
+                zip_dia = st.session_state['armazem_fiscal'].zip_de(ids_gerados)
 
             if erros_geracao:
                 st.error(f"Não foi possível gerar XML para as vendas com ID: {erros_geracao}. Os produtos não foram encontrados no cardápio.")
 
             st.download_button(
-                label=f"Baixar {len(vendas_do_dia) - len(erros_geracao)} XMLs do Dia (.zip)",
-                data=zip_buffer.getvalue(),
+                label=f"Baixar {len(ids_gerados)} XMLs do Dia (.zip)",
+                data=zip_dia,
                 file_name=f"XMLs_{hoje.strftime('%Y%m%d')}.zip",
                 mime="application/zip"
             )
 
+    st.divider()
+    st.header("Exportação Mensal para a Contabilidade")
+    meses_disponiveis = sorted(
+        set(arquivo_vendas.ler_manifesto(ARQUIVO_DIR)) |
+        set(pd.to_datetime(st.session_state['df_vendas']['Data']).dt.to_period('M').astype(str)),
+        reverse=True
+    )
+    if meses_disponiveis:
+        mes_contabil = st.selectbox("Mês de Referência", meses_disponiveis, key="fiscal_mes_contabil")
+        if st.button("Gerar XMLs do Mês"):
+            inicio_mes = pd.Period(mes_contabil).start_time
+            fim_mes = pd.Period(mes_contabil).end_time
+            vendas_mes = arquivo_vendas.vendas_do_periodo(st.session_state['df_vendas'], ARQUIVO_DIR, inicio_mes, fim_mes)
+            with metricas.medir('gerar_xml_lote_mes'):
+                ids_mes, erros_mes = documentos_das_vendas(vendas_mes)
+                zip_mes = st.session_state['armazem_fiscal'].zip_de(ids_mes)
+            st.session_state['armazem_fiscal'].marcar(ids_mes, ESTADO_EXPORTADO)
+            st.session_state['armazem_fiscal'].salvar()
+            if erros_mes:
+                st.error(f"Não foi possível gerar XML para as vendas com ID: {erros_mes}. Os produtos não foram encontrados no cardápio.")
+            st.download_button(
+                label=f"Baixar {len(ids_mes)} XMLs de {mes_contabil} (.zip)",
+                data=zip_mes,
+                file_name=f"XMLs_{mes_contabil.replace('-', '')}.zip",
+                mime="application/zip"
+            )
+        if st.button("Gerar Planilha do Mês (.xlsx)", help="Vendas, documentos fiscais e compras do mês, escritos em blocos direto no disco."):
+            # NOVO: Memória constante mesmo em meses grandes; o ficheiro fica também na pasta de exportações
+            inicio_mes = pd.Period(mes_contabil).start_time
+            caminho_planilha = os.path.join(EXPORTACOES_DIR, f"contabilidade_{mes_contabil.replace('-', '')}.xlsx")
+            linhas_planilha = exportacao_excel.exportar_contabilidade(
+                caminho_planilha, inicio_mes, inicio_mes + pd.offsets.MonthBegin(1),
+                st.session_state['df_vendas'], ARQUIVO_DIR, st.session_state['df_produtos'], st.session_state['df_compras'],
+                st.session_state['armazem_fiscal'])
+            st.success(f"Planilha gerada em {caminho_planilha}: " + ", ".join(f"{aba}: {n} linha(s)" for aba, n in linhas_planilha.items()))
+            tamanho_mb = os.path.getsize(caminho_planilha) / 2**20
+            if tamanho_mb > LIMITE_DOWNLOAD_MB:
+                st.info(f"A planilha tem {tamanho_mb:.0f} MB: copie-a diretamente da pasta {EXPORTACOES_DIR}.")
+            else:
+                # O Streamlit lê o ficheiro inteiro para servir o download
+                with open(caminho_planilha, "rb") as f:
+                    st.download_button(
+                        label=f"Baixar Planilha de {mes_contabil} (.xlsx)",
+                        data=f,
+                        file_name=os.path.basename(caminho_planilha),
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                    )
+    else:
+        st.warning("Nenhuma venda registrada para exportar.")
+
     st.divider()
     st.subheader("Integração com Emissor Sebrae")
     st.markdown("""
@@ -569,9 +990,39 @@ with tab_empresa:
             salvar_dados(nova_config, st.session_state['df_produtos'], st.session_state['df_estoque'], st.session_state['df_vendas'], st.session_state['df_compras'])
             st.rerun()
 
+    st.divider()
+    with st.expander("💾 Cópias de Segurança"):
+        agendador = st.session_state['backup']
+        st.info(f"Uma cópia incremental é feita automaticamente a cada {agendador.intervalo // 60} minutos, se houver alterações. "
+                "São mantidas todas as cópias das últimas 24 h, uma por dia nas últimas 2 semanas e uma por semana nos últimos 2 meses.")
+        if agendador.ultimo_erro:
+            st.error(f"A última cópia falhou: {agendador.ultimo_erro}")
+        elif agendador.ultimo_resultado:
+            ultimo = agendador.ultimo_resultado
+            st.caption(f"Última cópia: {ultimo['id']} ({ultimo['alterados']} ficheiro(s) alterado(s), {ultimo['bytes_novos'] / 1024:.1f} KB novos).")
+        if st.button("Fazer Cópia Agora"):
+            agendador.copiar_agora()
+            st.toast("Cópia de segurança iniciada em segundo plano.")
+        copias = agendador.repositorio.listar()
+        if copias:
+            copia_escolhida = st.selectbox("Restaurar a cópia de", copias,
+                                           format_func=lambda c: backup.momento_snapshot(c).strftime('%d/%m/%Y %H:%M:%S') + ''.join(c.partition('-')[1:]))
+            st.warning("A restauração substitui os dados atuais. Antes de restaurar é feita uma cópia do estado atual. Feche o sistema nos outros caixas antes de continuar.")
+            confirmar_restauro = st.checkbox("Confirmo que quero restaurar esta cópia", key="confirmar_restauro")
+            if st.button("Restaurar Cópia", disabled=not confirmar_restauro):
+                agendador.repositorio.criar(BASE_DIR)
+                total_restaurados = agendador.repositorio.restaurar(copia_escolhida, BASE_DIR)
+                # Recarrega tudo do disco na próxima execução
+                for chave in list(st.session_state.keys()):
+                    del st.session_state[chave]
+                st.success(f"{total_restaurados} ficheiro(s) restaurado(s). A recarregar...")
+                time.sleep(1)
+                st.rerun()
+
 # --- Barra Lateral (COM BOTÃO DE ATUALIZAR) ---
 st.sidebar.title("Opções")
 if st.sidebar.button("Salvar TODAS as Alterações", type="primary", help="Salva todas as alterações feitas no cardápio, estoque e nome do restaurante."):
+    aplicar_edicoes_pendentes()
     salvar_dados(
         st.session_state['config_empresa'],
         st.session_state['df_produtos'].dropna(subset=['Produto']),
@@ -585,28 +1036,62 @@ st.sidebar.divider()
 if st.sidebar.button("🔄 Atualizar Gráficos", help="Recarrega os dados e atualiza os gráficos de análise."):
     st.rerun()
 
+# NOVO: Estado da replicação com o nó central
+if 'replicacao' in st.session_state:
+    envio = st.session_state['replicacao']
+    pendentes_replicacao = envio.registo.total_pendentes()
+    if envio.ultimo_erro:
+        st.sidebar.warning(f"🔌 Central indisponível. {pendentes_replicacao} alteração(ões) aguardam envio; as vendas continuam normalmente.")
+    else:
+        st.sidebar.caption(f"🔗 Replicação ativa ({envio.registo.no}). Pendentes: {pendentes_replicacao}.")
+
 st.sidebar.divider()
 st.sidebar.header("Exportar Dados")
+incluir_arquivo = st.sidebar.checkbox("Incluir vendas arquivadas", help="Inclui nas exportações os meses já movidos para o arquivo (mais lento).")
 
-def gerar_csv_powerbi(vendas_df, produtos_df):
-    try:
-        dados_combinados = pd.merge(vendas_df, produtos_df, on='Produto', how='left')
-        return dados_combinados.to_csv(index=False).encode('utf-8')
-    except Exception:
-        return "".encode('utf-8')
-
-st.sidebar.download_button(
-    label="Exportar para Power BI (.csv)",
-    data=gerar_csv_powerbi(st.session_state['df_vendas'], st.session_state['df_produtos']),
-    file_name="dados_para_power_bi.csv",
-    mime="text/csv",
-    help="Exporta uma combinação das suas planilhas de Vendas e Cardápio."
-)
+# As exportações só são geradas quando pedidas, e não a cada interação com a aplicação
+if st.sidebar.button("Preparar Exportações", help="Gera os ficheiros para Power BI e MySQL com os dados atuais."):
+    if incluir_arquivo:
+        vendas_exportacao = arquivo_vendas.vendas_do_periodo(st.session_state['df_vendas'], ARQUIVO_DIR, pd.Timestamp.min, pd.Timestamp.max)
+    else:
+        vendas_exportacao = st.session_state['df_vendas']
+    st.session_state['exportacoes'] = {
+        'csv': gerar_csv_powerbi(vendas_exportacao, st.session_state['df_produtos']),
+        'sql': gerar_script_mysql(st.session_state['df_produtos'], st.session_state['df_estoque'], vendas_exportacao),
+    }
 
-sql_data = gerar_script_mysql(st.session_state['df_produtos'], st.session_state['df_estoque'], st.session_state['df_vendas'])
-st.sidebar.download_button(
-    label="Exportar para MySQL (.sql)",
-    data=sql_data,
-    file_name="backup.sql",
-    mime="application/sql"
-)
\ No newline at end of file
+if 'exportacoes' in st.session_state:
+    st.sidebar.download_button(
+        label="Exportar para Power BI (.csv)",
+        data=st.session_state['exportacoes']['csv'],
+        file_name="dados_para_power_bi.csv",
+        mime="text/csv",
+        help="Exporta uma combinação das suas planilhas de Vendas e Cardápio."
+    )
+    st.sidebar.download_button(
+        label="Exportar para MySQL (.sql)",
+        data=st.session_state['exportacoes']['sql'],
+        file_name="backup.sql",
+        mime="application/sql"
+    )
+
+# --- Desempenho do Sistema (secção oculta) ---
+# Aparece com GMASTER_METRICAS=1 ou abrindo a aplicação com ?desempenho=1 no endereço.
+if metricas.ativo() or st.query_params.get("desempenho") == "1":
+    st.sidebar.divider()
+    with st.sidebar.expander("⏱️ Desempenho do Sistema"):
+        recolher = st.checkbox("Recolher métricas", value=metricas.ativo(), key="metricas_ativas")
+        if recolher != metricas.ativo():
+            metricas.ativar(recolher)
+        resumo_metricas = metricas.registro.resumo()
+        if resumo_metricas:
+            st.dataframe(pd.DataFrame(resumo_metricas).set_index('Operacao'), use_container_width=True)
+            contadores = metricas.registro.contadores()
+            if contadores:
+                st.write(contadores)
+        else:
+            st.caption("Sem medições ainda. Com a recolha ligada, use a aplicação para gerar dados.")
+        st.download_button("Exportar métricas (.json)", data=metricas.registro.para_json(), file_name="metricas_gmaster.json", mime="application/json")
+        st.download_button("Exportar métricas (Prometheus)", data=metricas.registro.para_prometheus(), file_name="metricas_gmaster.prom", mime="text/plain")
+        if st.button("Limpar métricas"):
+            metricas.registro.limpar()
@@ -0,0 +1,83 @@
+import os
+from datetime import datetime, timedelta
+
+from gmaster.backup import Repositorio, main
+
+
+def _escrever(pasta, relativo, conteudo):
+    caminho = os.path.join(pasta, relativo)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(caminho, 'wb') as f:
+        f.write(conteudo)
+
+
+def _ler(pasta, relativo):
+    with open(os.path.join(pasta, relativo), 'rb') as f:
+        return f.read()
+
+
+def test_cria_incremental_e_deduplica(tmp_path):
+    dados, repositorio = str(tmp_path / "dados"), Repositorio(str(tmp_path / "backups"))
+    _escrever(dados, "config_empresa.json", b'{"cnpj": "1"}')
+    _escrever(dados, "arquivo_vendas/2024-01.parquet", b'x' * 5000)
+    primeiro = repositorio.criar(dados, agora=datetime(2026, 10, 1, 12, 0))
+    assert (primeiro['ficheiros'], primeiro['alterados']) == (2, 2)
+
+    assert repositorio.criar(dados, agora=datetime(2026, 10, 1, 12, 15)) is None
+    _escrever(dados, "config_empresa.json", b'{"cnpj": "2"}')
+    segundo = repositorio.criar(dados, agora=datetime(2026, 10, 1, 12, 30))
+    # A partição não mudou: só o bloco da configuração é novo
+    assert segundo['alterados'] == 1 and 0 < segundo['bytes_novos'] < 100
+
+
+def test_duas_copias_no_mesmo_segundo_nao_se_substituem(tmp_path):
+    dados, repositorio = str(tmp_path / "dados"), Repositorio(str(tmp_path / "backups"))
+    agora = datetime(2026, 10, 1, 12, 30)
+    _escrever(dados, "config_empresa.json", b'antes')
+    assert repositorio.criar(dados, agora=agora)['id'] == "20261001T123000"
+    _escrever(dados, "config_empresa.json", b'depois')
+    assert repositorio.criar(dados, agora=agora)['id'] == "20261001T123000-2"
+
+    assert repositorio.listar() == ["20261001T123000-2", "20261001T123000"]
+    repositorio.restaurar("20261001T123000", dados)
+    assert _ler(dados, "config_empresa.json") == b'antes'
+
+
+def test_restaurar_repoe_ficheiros_e_remove_os_novos(tmp_path):
+    dados, repositorio = str(tmp_path / "dados"), Repositorio(str(tmp_path / "backups"))
+    _escrever(dados, "documentos_fiscais/indice.json", b'{}')
+    copia = repositorio.criar(dados)['id']
+    _escrever(dados, "documentos_fiscais/indice.json", b'{"7": {}}')
+    _escrever(dados, "documentos_fiscais/xml/novo.xml", b'<nfce/>')
+
+    assert repositorio.restaurar(copia, dados) == 1
+    assert _ler(dados, "documentos_fiscais/indice.json") == b'{}'
+    assert not os.path.exists(os.path.join(dados, "documentos_fiscais/xml/novo.xml"))
+    assert [n for _, _, nomes in os.walk(dados) for n in nomes if n.endswith('.tmp')] == []
+
+
+def test_retencao_mantem_recentes_e_uma_por_dia(tmp_path):
+    dados, repositorio = str(tmp_path / "dados"), Repositorio(str(tmp_path / "backups"))
+    agora = datetime(2026, 10, 19, 12, 0)
+    momentos = [agora - timedelta(hours=1), agora - timedelta(days=3), agora - timedelta(days=3, hours=2), agora - timedelta(weeks=20)]
+    for numero, momento in enumerate(reversed(momentos)):
+        _escrever(dados, "config_empresa.json", str(numero).encode())
+        repositorio.criar(dados, agora=momento)
+
+    removidos = repositorio.aplicar_retencao(agora=agora)
+    assert sorted(removidos) == ["20260601T120000", "20261016T100000"]
+    assert repositorio.listar() == ["20261019T110000", "20261016T120000"]
+    repositorio.restaurar("20261016T120000", dados)
+    assert _ler(dados, "config_empresa.json") == b'2'
+
+
+def test_restaurar_pela_linha_de_comandos_guarda_o_estado_atual(tmp_path, capsys):
+    dados, backups = str(tmp_path / "dados"), str(tmp_path / "backups")
+    _escrever(dados, "config_empresa.json", b'antigo')
+    copia = Repositorio(backups).criar(dados, agora=datetime(2026, 10, 1, 12, 0))['id']
+    _escrever(dados, "config_empresa.json", b'atual')
+
+    main(['--dados', dados, '--backups', backups, 'restaurar', copia])
+    assert _ler(dados, "config_empresa.json") == b'antigo'
+    seguranca = Repositorio(backups).listar()[0]
+    assert seguranca != copia and seguranca in capsys.readouterr().out
@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+from gmaster.consulta_sql import ConsoleSQL, ErroConsulta
+
+
+def _console():
+    vendas = pd.DataFrame({'Produto': ['Portuguesa', 'portuguesa', 'Calabresa  Especial', 'Marguerita'],
+                           'Quantidade': [2, 1, 3, 1]})
+    return ConsoleSQL({'vendas': lambda: vendas})
+
+
+def test_literais_com_maiusculas_diferentes_nao_partilham_a_cache():
+    console = _console()
+    maiusculas, _ = console.executar("SELECT SUM(Quantidade) AS q FROM vendas WHERE Produto = 'Portuguesa'", versao=1)
+    minusculas, info = console.executar("SELECT SUM(Quantidade) AS q FROM vendas WHERE Produto = 'portuguesa'", versao=1)
+    assert not info['em_cache']
+    assert (maiusculas['q'][0], minusculas['q'][0]) == (2, 1)
+
+
+def test_espacos_e_comentarios_fora_das_aspas_usam_a_cache():
+    console = _console()
+    console.executar("SELECT Produto FROM vendas", versao=1)
+    _, info = console.executar("SELECT   Produto -- nomes\nFROM vendas;", versao=1)
+    assert info['em_cache']
+
+
+def test_literais_ficam_como_foram_escritos():
+    console = _console()
+    resultado, _ = console.executar("SELECT '--' || Produto AS p FROM vendas WHERE Produto LIKE '%  %'", versao=1)
+    assert resultado['p'].tolist() == ['--Calabresa  Especial']
+    resultado, _ = console.executar("SELECT '/* a;b */' AS t FROM vendas LIMIT 1", versao=1)
+    assert resultado['t'].tolist() == ['/* a;b */']
+
+
+def test_rejeita_varias_consultas_e_escrita():
+    console = _console()
+    with pytest.raises(ErroConsulta):
+        console.executar("SELECT 1; SELECT 2", versao=1)
+    with pytest.raises(ErroConsulta):
+        console.executar("DELETE FROM vendas", versao=1)
+    with pytest.raises(ErroConsulta):
+        console.executar("-- SELECT\n", versao=1)
+
+
+def test_limite_de_linhas_e_tempo_limite():
+    console = _console()
+    resultado, info = console.executar("SELECT Produto FROM vendas", versao=1, limite=2)
+    assert len(resultado) == 2 and info['truncado']
+    with pytest.raises(ErroConsulta, match="tempo limite"):
+        console.executar("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n",
+                         versao=1, tempo_limite=0.2)
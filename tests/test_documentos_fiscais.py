@@ -0,0 +1,68 @@
+import os
+
+import pandas as pd
+import pytest
+
+from gmaster.documentos_fiscais import ArmazemFiscal, ESTADO_EXPORTADO, ESTADO_GERADO, obter_armazem
+
+
+def _venda(venda_id=7):
+    return pd.Series({'Data': pd.Timestamp('2024-03-05 19:30'), 'Produto': 'Portuguesa', 'Quantidade': 2, 'CPF_Cliente': ''}, name=venda_id)
+
+
+def _produto(preco):
+    return pd.DataFrame({'Produto': ['Portuguesa'], 'Preco_Venda': [preco], 'Quantidade': [2]})
+
+
+def _gerar(venda_info, produtos_info, config_empresa):
+    return f"<nfce preco='{produtos_info['Preco_Venda'].iloc[0]}'/>".encode()
+
+
+def test_documento_emitido_nao_muda_com_o_preco(tmp_path):
+    armazem = ArmazemFiscal(str(tmp_path))
+    original = armazem.obter_ou_gerar(_venda(), _produto(40.0), {}, _gerar)
+    assert armazem.obter_ou_gerar(_venda(), _produto(45.0), {}, _gerar) == original
+    assert armazem.desatualizado(_venda(), _produto(45.0), {})
+    assert armazem.documentos['7']['estado'] == ESTADO_GERADO
+
+
+def test_documento_exportado_continua_exportado_e_nao_aceita_nova_versao(tmp_path):
+    armazem = ArmazemFiscal(str(tmp_path))
+    original = armazem.obter_ou_gerar(_venda(), _produto(40.0), {}, _gerar)
+    armazem.marcar(['7'], ESTADO_EXPORTADO)
+    armazem.salvar()
+
+    recarregado = ArmazemFiscal(str(tmp_path))
+    assert recarregado.obter_ou_gerar(_venda(), _produto(45.0), {}, _gerar) == original
+    assert recarregado.documentos['7']['estado'] == ESTADO_EXPORTADO
+    with pytest.raises(ValueError):
+        recarregado.nova_versao(_venda(), _produto(45.0), {}, _gerar)
+
+
+def test_nova_versao_guarda_a_anterior_no_historico(tmp_path):
+    armazem = ArmazemFiscal(str(tmp_path))
+    original = armazem.obter_ou_gerar(_venda(), _produto(40.0), {}, _gerar)
+    nova = armazem.nova_versao(_venda(), _produto(45.0), {}, _gerar)
+
+    doc = armazem.documentos['7']
+    assert nova != original and armazem.ler_xml(7) == nova
+    assert doc['versao'] == 2
+    assert doc['versoes_anteriores'][0]['hash_xml'] != doc['hash_xml']
+    assert not armazem.desatualizado(_venda(), _produto(45.0), {})
+
+
+def test_salvar_junta_entradas_gravadas_por_outro_armazem(tmp_path):
+    caixa1, caixa2 = ArmazemFiscal(str(tmp_path)), ArmazemFiscal(str(tmp_path))
+    caixa1.obter_ou_gerar(_venda(7), _produto(40.0), {}, _gerar)
+    caixa1.salvar()
+    caixa2.obter_ou_gerar(_venda(8), _produto(40.0), {}, _gerar)
+    caixa2.salvar()
+
+    relido = ArmazemFiscal(str(tmp_path))
+    assert sorted(relido.documentos) == ['7', '8']
+    assert relido.ids_no_periodo('2024-03-05', '2024-03-05') == ['7', '8']
+    assert [f for f in os.listdir(tmp_path) if f.endswith('.tmp')] == []
+
+
+def test_obter_armazem_e_partilhado_por_pasta(tmp_path):
+    assert obter_armazem(str(tmp_path)) is obter_armazem(str(tmp_path))
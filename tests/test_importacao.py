@@ -0,0 +1,70 @@
+import io
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from gmaster import importacao
+
+PRODUTOS = pd.DataFrame({'Produto': ['Portuguesa', 'Calabresa']})
+MAPEAMENTO = {'Data': 'data', 'Produto': 'produto', 'Quantidade': 'qtd', 'CPF_Cliente': None, 'ID_Externo': 'pedido'}
+
+
+@pytest.fixture
+def registro(tmp_path):
+    return importacao.RegistroImportacoes(str(tmp_path / "importacoes.sqlite"))
+
+
+def _csv(texto, tamanho_bloco=importacao.TAMANHO_BLOCO):
+    return importacao.ler_em_blocos(io.StringIO(texto), "vendas.csv", tamanho_bloco)
+
+
+def _importar(blocos, registro, proximo_id=1):
+    return list(importacao.importar_vendas(blocos, MAPEAMENTO, PRODUTOS, registro, "iFood", proximo_id))
+
+
+def _juntar(lotes):
+    return pd.concat([lote['vendas'] for lote in lotes])
+
+
+def test_datas_iso_nao_trocam_dia_e_mes(registro):
+    lotes = _importar(_csv("data;produto;qtd;pedido\n2024-03-05 19:30:00;Portuguesa;1;A\n05/03/2024 20:00;Calabresa;2;B\n"), registro)
+    vendas = _juntar(lotes)
+    assert vendas['Data'].tolist() == [pd.Timestamp('2024-03-05 19:30'), pd.Timestamp('2024-03-05 20:00')]
+
+
+def test_datas_de_celulas_excel_sao_usadas_como_estao(tmp_path, registro):
+    caminho = tmp_path / "vendas.xlsx"
+    pd.DataFrame({'data': [datetime(2024, 3, 5, 19, 30)], 'produto': ['Portuguesa'], 'qtd': [1], 'pedido': ['A']}).to_excel(caminho, index=False)
+    with open(caminho, "rb") as f:
+        vendas = _juntar(_importar(importacao.ler_em_blocos(f, "vendas.xlsx"), registro))
+    assert vendas['Data'].tolist() == [pd.Timestamp('2024-03-05 19:30')]
+
+
+def test_fusos_misturados_rejeitam_so_as_linhas_com_fuso(registro):
+    texto = "data;produto;qtd;pedido\n2024-03-05T19:30:00Z;Portuguesa;1;A\n2024-03-05 20:00:00;Calabresa;1;B\n"
+    lotes = _importar(_csv(texto), registro)
+    assert lotes[0]['rejeitadas'] == {'data inválida': 1}
+    assert _juntar(lotes)['Data'].tolist() == [pd.Timestamp('2024-03-05 20:00')]
+
+
+def test_quantidades_fracionarias_sao_rejeitadas(registro):
+    texto = "data;produto;qtd;pedido\n2024-03-05;Portuguesa;0,5;A\n2024-03-05;Portuguesa;1,7;B\n2024-03-05;Portuguesa;2;C\n2024-03-05;Portuguesa;0;D\n"
+    lotes = _importar(_csv(texto), registro)
+    assert lotes[0]['rejeitadas'] == {'quantidade inválida': 3}
+    assert _juntar(lotes)['Quantidade'].tolist() == [2]
+
+
+def test_cada_bloco_chega_pronto_e_pedidos_repartidos_entre_blocos_nao_sao_duplicados(registro):
+    texto = "data;produto;qtd;pedido\n" + "".join(f"2024-03-05;Portuguesa;1;P{i // 2}\n" for i in range(5))
+    lotes = []
+    for lote in importacao.importar_vendas(_csv(texto, tamanho_bloco=3), MAPEAMENTO, PRODUTOS, registro, "iFood", 10):
+        # Como na aplicação: o bloco é registado antes de o seguinte ser processado
+        registro.registrar("iFood", lote['ids_externos'])
+        lotes.append(lote)
+    assert [len(lote['vendas']) for lote in lotes] == [3, 2]
+    assert _juntar(lotes).index.tolist() == [10, 11, 12, 13, 14]
+
+    repetidos = _importar(_csv(texto, tamanho_bloco=3), registro)
+    assert sum(lote['duplicadas'] for lote in repetidos) == 5
+    assert all(lote['vendas'].empty for lote in repetidos)
@@ -0,0 +1,62 @@
+import zipfile
+from io import BytesIO
+
+import pandas as pd
+
+from gmaster.nfe_fornecedores import importar_nfe, RegistroNFe
+
+
+def _nfe(chave, itens, total):
+    dets = ''.join(f"<det><prod><xProd>{produto}</xProd><qCom>{quantidade}</qCom><vProd>{valor}</vProd></prod></det>"
+                   for produto, quantidade, valor in itens)
+    return (f"<NFe xmlns='http://www.portalfiscal.inf.br/nfe'><infNFe Id='NFe{chave}'>"
+            f"<ide><dhEmi>2024-03-05T10:00:00-03:00</dhEmi></ide>"
+            f"<emit><CNPJ>12345678000199</CNPJ><xNome>Distribuidora</xNome></emit>{dets}"
+            f"<total><ICMSTot><vNF>{total}</vNF></ICMSTot></total></infNFe></NFe>").encode()
+
+
+def _enviado(nome, conteudo):
+    arquivo = BytesIO(conteudo)
+    arquivo.name = nome
+    return arquivo
+
+
+def _zip(nome, membros):
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as pacote:
+        for membro, conteudo in membros.items():
+            pacote.writestr(membro, conteudo)
+    return _enviado(nome, buffer.getvalue())
+
+
+ESTOQUE = pd.DataFrame({'Produto': ['Queijo Mussarela', 'Farinha'], 'Quantidade_Estoque': [0, 0], 'Estoque_Minimo': [0, 0]})
+
+
+def test_soma_ao_estoque_e_separa_frete(tmp_path):
+    registro = RegistroNFe(str(tmp_path / "importacoes.sqlite"))
+    nota = _nfe('1' * 44, [('QUEIJO MUSSARELA', 4, 120.0), ('Tomate', 2, 10.0)], 140.0)
+    resultado = importar_nfe([_enviado('nota.xml', nota)], registro, ESTOQUE)
+
+    assert resultado['ajustes_estoque'] == {'Queijo Mussarela': 4.0}
+    assert resultado['compras']['Valor'].tolist() == [120.0, 10.0, 10.0]
+    assert resultado['compras']['Data'].iloc[0] == pd.Timestamp('2024-03-05')
+
+
+def test_chave_repetida_e_ja_registada_sao_duplicadas(tmp_path):
+    registro = RegistroNFe(str(tmp_path / "importacoes.sqlite"))
+    nota = _nfe('2' * 44, [('Farinha', 10, 50.0)], 50.0)
+    resultado = importar_nfe([_enviado('a.xml', nota), _zip('notas.zip', {'b.xml': nota})], registro, ESTOQUE)
+    assert (len(resultado['notas']), resultado['duplicadas']) == (1, 1)
+
+    registro.registrar(resultado['notas'])
+    resultado = importar_nfe([_enviado('a.xml', nota)], registro, ESTOQUE)
+    assert (resultado['notas'], resultado['duplicadas']) == ([], 1)
+
+
+def test_ficheiros_invalidos_sao_reportados(tmp_path):
+    registro = RegistroNFe(str(tmp_path / "importacoes.sqlite"))
+    fontes = [_enviado('notas.zip', b'not a zip'), _enviado('cortado.xml', b'<NFe><infNFe'),
+              _enviado('outro.xml', b'<pedido/>'), _enviado('boa.xml', _nfe('3' * 44, [('Farinha', 1, 5.0)], 5.0))]
+    resultado = importar_nfe(fontes, registro, ESTOQUE)
+    assert resultado['invalidas'] == ['notas.zip', 'cortado.xml', 'outro.xml']
+    assert len(resultado['notas']) == 1
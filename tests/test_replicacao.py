@@ -0,0 +1,69 @@
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+
+from gmaster.replicacao import BaseCentral, RegistoAlteracoes
+
+
+def _vendas(*ids):
+    return pd.DataFrame({'Data': pd.Timestamp('2024-03-05 19:30'), 'Produto': 'Portuguesa', 'Quantidade': 1, 'CPF_Cliente': ''},
+                        index=pd.Index(list(ids), name='ID_Venda'))
+
+
+def _enviar(registo, central):
+    """Um ciclo de envio sem HTTP: o que enviar_pendentes faz com a resposta do central."""
+    entradas = registo.pendentes()
+    confirmado = central.aplicar(registo.no, entradas, registo.epoca)
+    registo.confirmar(confirmado)
+    return confirmado
+
+
+def _vendas_no_central(central):
+    with closing(sqlite3.connect(central.caminho)) as conexao:
+        return [linha[0] for linha in conexao.execute("SELECT id_venda FROM vendas ORDER BY id_venda")]
+
+
+def test_reenvio_do_mesmo_lote_nao_duplica(tmp_path):
+    registo = RegistoAlteracoes(str(tmp_path / "no.sqlite"), no="caixa1")
+    central = BaseCentral(str(tmp_path / "central.sqlite"))
+    registo.registar_vendas(_vendas(1, 2))
+    entradas = registo.pendentes()
+
+    assert central.aplicar("caixa1", entradas, registo.epoca) == 2
+    # Confirmação perdida: o nó reenvia o mesmo lote
+    assert central.aplicar("caixa1", entradas, registo.epoca) == 2
+    assert _vendas_no_central(central) == [1, 2]
+
+
+def test_registo_recriado_nao_tem_entradas_descartadas(tmp_path):
+    central = BaseCentral(str(tmp_path / "central.sqlite"))
+    registo = RegistoAlteracoes(str(tmp_path / "no.sqlite"), no="caixa1")
+    registo.registar_vendas(_vendas(1, 2, 3))
+    assert _enviar(registo, central) == 3
+
+    # Reinstalação: o ficheiro do registo volta a começar em seq 1, com outra época
+    (tmp_path / "no.sqlite").unlink()
+    novo = RegistoAlteracoes(str(tmp_path / "no.sqlite"), no="caixa1")
+    assert novo.epoca != registo.epoca
+    novo.registar_vendas(_vendas(4))
+    assert _enviar(novo, central) == 1
+    assert novo.total_pendentes() == 0
+    assert _vendas_no_central(central) == [1, 2, 3, 4]
+
+
+def test_a_epoca_e_persistente_no_mesmo_registo(tmp_path):
+    caminho = str(tmp_path / "no.sqlite")
+    assert RegistoAlteracoes(caminho).epoca == RegistoAlteracoes(caminho).epoca
+
+
+def test_central_antigo_sem_coluna_de_epoca_e_migrado(tmp_path):
+    caminho = str(tmp_path / "central.sqlite")
+    with closing(sqlite3.connect(caminho)) as conexao, conexao:
+        conexao.execute("CREATE TABLE nos (no TEXT PRIMARY KEY, ultimo_seq INTEGER NOT NULL, visto_em TEXT)")
+        conexao.execute("INSERT INTO nos VALUES ('caixa1', 50, NULL)")
+    central = BaseCentral(caminho)
+    registo = RegistoAlteracoes(str(tmp_path / "no.sqlite"), no="caixa1")
+    registo.registar_vendas(_vendas(7))
+    assert _enviar(registo, central) == 1
+    assert _vendas_no_central(central) == [7]